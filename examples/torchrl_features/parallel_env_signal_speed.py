@@ -0,0 +1,91 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Compares the number of steps per second of ParallelEnv when the steps are
+signalled through pipes or through flags in shared memory, with a trivially
+cheap environment such that the signalling overhead dominates.
+
+Usage:
+    python parallel_env_signal_speed.py --num_workers 4 16 \
+        --envs_per_process 1 4 --n_steps 2000
+"""
+
+import argparse
+import time
+
+import torch
+from torchrl.data import NdUnboundedContinuousTensorSpec, TensorDict
+from torchrl.envs import ParallelEnv
+from torchrl.envs.common import _EnvClass
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--num_workers", default=[4, 16], type=int, nargs="+")
+parser.add_argument("--envs_per_process", default=[1, 4], type=int, nargs="+")
+parser.add_argument("--n_steps", default=2000, type=int)
+
+
+class CountingEnv(_EnvClass):
+    def __init__(self):
+        super().__init__(device="cpu")
+        self.action_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.observation_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.reward_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.count = 0
+
+    def set_seed(self, seed: int) -> int:
+        return seed + 1
+
+    def _step(self, tensordict):
+        self.count += 1
+        obs = torch.full((1,), float(self.count))
+        done = torch.zeros(1, dtype=torch.bool)
+        return TensorDict(
+            {"next_observation": obs, "reward": obs, "done": done}, batch_size=[]
+        )
+
+    def _reset(self, tensordict=None, **kwargs):
+        self.count = 0
+        return TensorDict(
+            {
+                "next_observation": torch.zeros(1),
+                "done": torch.zeros(1, dtype=torch.bool),
+            },
+            batch_size=[],
+        )
+
+
+def steps_per_second(env, n_steps):
+    td = env.reset()
+    td.set("action", torch.zeros(*env.batch_size, 1))
+    for _ in range(10):  # warmup, the first step goes through the pipes
+        env.step(td)
+    t0 = time.perf_counter()
+    for _ in range(n_steps):
+        env.step(td)
+    return n_steps / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(
+        f"{'workers':>7} {'envs/proc':>9} {'pipe (steps/s)':>15} "
+        f"{'flags (steps/s)':>16}"
+    )
+    for num_workers in args.num_workers:
+        for envs_per_process in args.envs_per_process:
+            results = []
+            for signal_mode in ("pipe", "flags"):
+                env = ParallelEnv(
+                    num_workers,
+                    CountingEnv,
+                    envs_per_process=envs_per_process,
+                    signal_mode=signal_mode,
+                )
+                results.append(steps_per_second(env, args.n_steps))
+                env.close()
+            print(
+                f"{num_workers:>7} {envs_per_process:>9} {results[0]:>15.1f} "
+                f"{results[1]:>16.1f}"
+            )
@@ -0,0 +1,76 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Benchmarks the batched operations of the segment trees used by the
+prioritized replay buffers, across capacities and batch sizes.
+
+Usage:
+    python segment_tree_speed.py --capacity 100000 1000000 10000000 \
+        --batch_size 1024 8192 65536 --num_threads 1 8
+"""
+
+import argparse
+import time
+
+import torch
+from torchrl._torchrl import MinSegmentTreeFp32, SumSegmentTreeFp32
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--capacity", default=[100_000, 1_000_000, 10_000_000], type=int, nargs="+"
+)
+parser.add_argument("--batch_size", default=[1024, 8192, 65536], type=int, nargs="+")
+parser.add_argument(
+    "--num_threads",
+    default=sorted({1, torch.get_num_threads()}),
+    type=int,
+    nargs="+",
+    help="sizes of the intra-op thread pool to compare",
+)
+parser.add_argument("--n_iter", default=20, type=int)
+
+
+def timeit(fun, n_iter):
+    fun()  # warmup
+    t0 = time.perf_counter()
+    for _ in range(n_iter):
+        fun()
+    return (time.perf_counter() - t0) / n_iter * 1e6
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(
+        f"{'capacity':>10} {'batch':>7} {'threads':>7} {'update (us)':>12} "
+        f"{'at (us)':>10} {'scan (us)':>10} {'stratified (us)':>16}"
+    )
+    for capacity in args.capacity:
+        sum_tree = SumSegmentTreeFp32(capacity)
+        min_tree = MinSegmentTreeFp32(capacity)
+        sum_tree[torch.arange(capacity)] = torch.rand(capacity)
+        min_tree[torch.arange(capacity)] = torch.rand(capacity)
+        p_sum = sum_tree.query(0, capacity)
+        for batch_size in args.batch_size:
+            index = torch.randint(capacity, (batch_size,))
+            priority = torch.rand(batch_size)
+            mass = torch.rand(batch_size) * p_sum
+            for num_threads in args.num_threads:
+                torch.set_num_threads(num_threads)
+
+                def update():
+                    sum_tree[index] = priority
+                    min_tree[index] = priority
+
+                t_update = timeit(update, args.n_iter)
+                t_at = timeit(lambda: sum_tree[index], args.n_iter)
+                t_scan = timeit(lambda: sum_tree.scan_lower_bound(mass), args.n_iter)
+                t_strat = timeit(
+                    lambda: sum_tree.stratified_sample(batch_size), args.n_iter
+                )
+                print(
+                    f"{capacity:>10} {batch_size:>7} {num_threads:>7} "
+                    f"{t_update:>12.1f} {t_at:>10.1f} {t_scan:>10.1f} "
+                    f"{t_strat:>16.1f}"
+                )
@@ -0,0 +1,87 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Measures the per-operation overhead of building and writing TensorDicts
+with small tensors, such that the Python overhead dominates: the regular
+constructor and set/set_ are compared with TensorDict.from_trusted and with
+the same writes on a schema-locked tensordict.
+
+Usage:
+    python tensordict_set_overhead.py --n_keys 4 40 --n_iter 10000
+"""
+
+import argparse
+import time
+
+import torch
+from torchrl.data import TensorDict
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--n_keys", default=[4, 40], type=int, nargs="+")
+parser.add_argument("--batch_size", default=8, type=int)
+parser.add_argument("--n_iter", default=10000, type=int)
+
+
+def time_per_op(fun, n_iter, n_ops):
+    fun()  # warmup
+    t0 = time.perf_counter()
+    for _ in range(n_iter):
+        fun()
+    return (time.perf_counter() - t0) / (n_iter * n_ops) * 1e6
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print(
+        f"{'keys':>5} {'operation':>12} {'default (us/op)':>16} "
+        f"{'fast (us/op)':>13}"
+    )
+    for n_keys in args.n_keys:
+        batch_size = torch.Size([args.batch_size])
+        source = {f"key{i}": torch.zeros(args.batch_size, 3) for i in range(n_keys)}
+        # two sets of values are alternated, as setting the tensor that is
+        # already stored is a no-op
+        values = [
+            {key: value.clone() for key, value in source.items()} for _ in range(2)
+        ]
+
+        td = TensorDict(source, batch_size)
+        locked = TensorDict(source, batch_size).lock_schema_()
+
+        def construct():
+            TensorDict(source, batch_size)
+
+        def construct_trusted():
+            TensorDict.from_trusted(source, batch_size)
+
+        def set_all(td):
+            for _values in values:
+                for key, value in _values.items():
+                    td.set(key, value)
+
+        def set_all_(td):
+            for _values in values:
+                for key, value in _values.items():
+                    td.set_(key, value)
+
+        results = [
+            (
+                "construct",
+                time_per_op(construct, args.n_iter, n_keys),
+                time_per_op(construct_trusted, args.n_iter, n_keys),
+            ),
+            (
+                "set",
+                time_per_op(lambda: set_all(td), args.n_iter, 2 * n_keys),
+                time_per_op(lambda: set_all(locked), args.n_iter, 2 * n_keys),
+            ),
+            (
+                "set_",
+                time_per_op(lambda: set_all_(td), args.n_iter, 2 * n_keys),
+                time_per_op(lambda: set_all_(locked), args.n_iter, 2 * n_keys),
+            ),
+        ]
+        for name, default, fast in results:
+            print(f"{n_keys:>5} {name:>12} {default:>16.2f} {fast:>13.2f}")
@@ -2,6 +2,7 @@
 #
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
+import time
 from typing import Optional
 
 import torch
@@ -122,6 +123,64 @@ class MockSerialEnv(_EnvClass):
         return self.step(tensordict)
 
 
+class CountingEnv(_EnvClass):
+    """Environment whose episodes last max_steps steps, each step sleeping
+    step_time seconds."""
+
+    def __init__(self, max_steps: int = 5, step_time: float = 0.0):
+        super().__init__(device="cpu")
+        self.action_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.observation_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.reward_spec = NdUnboundedContinuousTensorSpec((1,))
+        self.max_steps = max_steps
+        self.step_time = step_time
+        self.count = 0
+        self.is_closed = False
+
+    def set_seed(self, seed: int) -> int:
+        return seed_generator(seed)
+
+    def _step(self, tensordict):
+        time.sleep(self.step_time)
+        self.count += 1
+        obs = torch.full((1,), float(self.count))
+        done = torch.tensor([self.count >= self.max_steps])
+        return TensorDict({"next_observation": obs, "reward": obs, "done": done}, [])
+
+    def _reset(self, tensordict: TensorDictBase, **kwargs) -> TensorDictBase:
+        self.count = 0
+        return TensorDict(
+            {
+                "next_observation": torch.zeros(1),
+                "done": torch.zeros(1, dtype=torch.bool),
+            },
+            [],
+        )
+
+
+class NestedCountingEnv(CountingEnv):
+    """CountingEnv whose observation also holds the count in a nested
+    "next_state" tensordict."""
+
+    def __init__(self, max_steps: int = 5, step_time: float = 0.0):
+        super().__init__(max_steps=max_steps, step_time=step_time)
+        self.observation_spec = CompositeSpec(
+            next_observation=NdUnboundedContinuousTensorSpec((1,)),
+            next_state=CompositeSpec(count=NdUnboundedContinuousTensorSpec((1,))),
+        )
+
+    def _step(self, tensordict):
+        tensordict_out = super()._step(tensordict)
+        count = tensordict_out.get("next_observation").clone()
+        tensordict_out.set("next_state", TensorDict({"count": count}, []))
+        return tensordict_out
+
+    def _reset(self, tensordict: TensorDictBase, **kwargs) -> TensorDictBase:
+        tensordict_out = super()._reset(tensordict, **kwargs)
+        tensordict_out.set("next_state", TensorDict({"count": torch.zeros(1)}, []))
+        return tensordict_out
+
+
 class DiscreteActionVecMockEnv(_MockEnv):
     size = 7
     observation_spec = CompositeSpec(
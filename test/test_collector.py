@@ -4,10 +4,12 @@
 # LICENSE file in the root directory of this source tree.
 
 import argparse
+import threading
 
 import numpy as np
 import pytest
 import torch
+import torch.multiprocessing as mp
 from _utils_internal import generate_seeds
 from mocking_classes import (
     DiscreteActionConvMockEnv,
@@ -15,18 +17,25 @@ from mocking_classes import (
     DiscreteActionVecPolicy,
     DiscreteActionConvPolicy,
     ContinuousActionVecMockEnv,
+    NestedCountingEnv,
 )
 from torch import nn
 from torchrl import seed_generator
-from torchrl.collectors import SyncDataCollector, aSyncDataCollector
+from torchrl.collectors import (
+    SharedPolicyWeights,
+    SyncDataCollector,
+    aSyncDataCollector,
+)
 from torchrl.collectors.collectors import (
     RandomPolicy,
     MultiSyncDataCollector,
     MultiaSyncDataCollector,
 )
-from torchrl.data.tensordict.tensordict import assert_allclose_td
+from torchrl.collectors.inference import _InferenceServer, _PolicyClient
+from torchrl.data import TensorDict
+from torchrl.data.tensordict.tensordict import TensorDictBase, assert_allclose_td
 from torchrl.envs import EnvCreator
-from torchrl.envs import ParallelEnv
+from torchrl.envs import ParallelEnv, SerialEnv
 from torchrl.envs.libs.gym import _has_gym
 from torchrl.envs.transforms import TransformedEnv, VecNorm
 from torchrl.modules import OrnsteinUhlenbeckProcessWrapper, Actor
@@ -594,6 +603,298 @@ def test_excluded_keys(collector_class, exclude):
     dummy_env.close()
 
 
+def test_shared_policy_weights():
+    policy = nn.Sequential(nn.Linear(3, 4), nn.BatchNorm1d(4))
+    weights = SharedPolicyWeights(policy)
+    assert weights.version == 0
+    policy_copy = nn.Sequential(nn.Linear(3, 4), nn.BatchNorm1d(4))
+    assert weights.load_into(policy_copy) == 0
+    for p1, p2 in zip(policy.state_dict().values(), policy_copy.state_dict().values()):
+        torch.testing.assert_close(p1, p2)
+    # no newer weights
+    with torch.no_grad():
+        policy_copy[0].weight.zero_()
+    assert weights.load_into(policy_copy, 0) == 0
+    assert (policy_copy[0].weight == 0).all()
+
+    with torch.no_grad():
+        policy[0].weight.add_(1.0)
+    policy[1].num_batches_tracked += 1
+    assert weights.publish(policy) == 1
+    assert weights.load_into(policy_copy, 0) == 1
+    for p1, p2 in zip(policy.state_dict().values(), policy_copy.state_dict().values()):
+        torch.testing.assert_close(p1, p2)
+    # state_dicts can be published too
+    assert weights.publish(policy_copy.state_dict()) == 2
+
+
+@pytest.mark.parametrize(
+    "collector_class", [SyncDataCollector, MultiaSyncDataCollector]
+)
+def test_shared_weights_collector(collector_class):
+    make_env = lambda: ContinuousActionVecMockEnv()
+    dummy_env = make_env()
+    obs_spec = dummy_env.observation_spec["next_observation"]
+    policy_module = nn.Linear(obs_spec.shape[-1], dummy_env.action_spec.shape[-1])
+    policy = Actor(policy_module, spec=dummy_env.action_spec)
+    dummy_env.close()
+
+    if collector_class is SyncDataCollector:
+        shared_weights = SharedPolicyWeights(policy)
+        collector = SyncDataCollector(
+            make_env,
+            policy,
+            frames_per_batch=10,
+            shared_weights=shared_weights,
+        )
+        update = lambda: shared_weights.publish(policy)
+    else:
+        collector = MultiaSyncDataCollector(
+            [make_env, make_env],
+            policy,
+            frames_per_batch=10,
+            shared_weights=True,
+        )
+        update = collector.update_policy_weights_
+    # the batches of the workers of MultiaSyncDataCollector are interleaved,
+    # the worker of each batch is recorded when it is read from the queue
+    worker_ids = []
+    if collector_class is MultiaSyncDataCollector:
+        get_from_queue = collector._get_from_queue
+
+        def _get_from_queue(*args, **kwargs):
+            idx, j, out = get_from_queue(*args, **kwargs)
+            worker_ids.append(idx)
+            return idx, j, out
+
+        collector._get_from_queue = _get_from_queue
+    versions = []
+    for i, b in enumerate(collector):
+        versions.append(b.get("policy_version").max().item())
+        assert b.get("policy_version").shape == (*b.shape, 1)
+        # the workers may collect a few batches ahead of the updates
+        if (i >= 3 and max(versions) > 0) or i == 19:
+            break
+        with torch.no_grad():
+            policy_module.weight.add_(1.0)
+        update()
+    collector.shutdown()
+    if collector_class is SyncDataCollector:
+        worker_ids = [0] * len(versions)
+    assert len(worker_ids) == len(versions)
+    assert versions[0] == 0
+    assert max(versions) > 0
+    # the versions only increase within the batches of each worker
+    for idx in set(worker_ids):
+        worker_versions = [
+            version
+            for version, worker_id in zip(versions, worker_ids)
+            if worker_id == idx
+        ]
+        assert worker_versions == sorted(worker_versions)
+
+
+@pytest.mark.parametrize(
+    "collector_class", [MultiSyncDataCollector, MultiaSyncDataCollector]
+)
+@pytest.mark.parametrize("shared_weights", [False, True])
+def test_inference_server(collector_class, shared_weights):
+    make_env = lambda: ContinuousActionVecMockEnv()
+    dummy_env = make_env()
+    obs_spec = dummy_env.observation_spec["next_observation"]
+    policy_module = nn.Linear(obs_spec.shape[-1], dummy_env.action_spec.shape[-1])
+    policy = Actor(policy_module, spec=dummy_env.action_spec)
+    dummy_env.close()
+
+    collector = collector_class(
+        [make_env] * 3,
+        policy,
+        frames_per_batch=30,
+        total_frames=120,
+        max_frames_per_traj=10,
+        split_trajs=False,
+        shared_weights=shared_weights,
+        inference_server=True,
+    )
+    versions = []
+    for b in collector:
+        if not shared_weights:
+            # the actions are computed by the policy of the server
+            with torch.no_grad():
+                expected = policy_module(b.get("observation"))
+            torch.testing.assert_close(b.get("action"), expected)
+        else:
+            versions.append(b.get("policy_version").max().item())
+            with torch.no_grad():
+                policy_module.bias.add_(0.1)
+            collector.update_policy_weights_()
+    collector.shutdown()
+    if shared_weights:
+        assert versions[0] == 0
+        assert versions[-1] > 0
+
+
+def test_inference_server_stateful_policy():
+    # the state written by an exploration wrapper must survive the round
+    # trips through the server, and only the input keys are sent to it
+    dummy_env = ContinuousActionVecMockEnv()
+    obs_spec = dummy_env.observation_spec["next_observation"]
+    policy = OrnsteinUhlenbeckProcessWrapper(
+        Actor(
+            nn.Linear(obs_spec.shape[-1], dummy_env.action_spec.shape[-1]),
+            spec=dummy_env.action_spec,
+        ),
+        safe=False,
+    )
+    dummy_env.close()
+    n_clients = 2
+    pipes = [mp.Pipe() for _ in range(n_clients)]
+    server = _InferenceServer(
+        policy, "cpu", [server_conn for server_conn, _ in pipes], "random"
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    clients = [_PolicyClient(conn, policy.in_keys) for _, conn in pipes]
+    tds = [
+        TensorDict(
+            {
+                "observation": torch.randn(obs_spec.shape),
+                "next_pixels": torch.randn(3, 8, 8),
+            },
+            [],
+        )
+        for _ in range(n_clients)
+    ]
+    for step in range(1, 5):
+        # the clients are served in a different order at each step
+        order = range(n_clients) if step % 2 else reversed(range(n_clients))
+        for i in order:
+            clients[i](tds[i])
+            assert tds[i].get("_ou_steps").item() == step
+    for client in clients:
+        assert set(client._inputs.keys()) == set(policy.in_keys)
+        client.conn.close()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+@pytest.mark.parametrize("num_env", [1, 3])
+def test_collector_preallocated_output(num_env):
+    if num_env == 1:
+        make_env = lambda: ContinuousActionVecMockEnv()
+    else:
+        make_env = lambda: SerialEnv(num_env, ContinuousActionVecMockEnv)
+    collector = SyncDataCollector(
+        make_env,
+        frames_per_batch=20,
+        max_frames_per_traj=7,
+        split_trajs=False,
+        return_same_td=True,
+    )
+    data_ptrs = None
+    for i, b in enumerate(collector):
+        if data_ptrs is None:
+            data_ptrs = {key: value.data_ptr() for key, value in b.items()}
+        else:
+            # the same pre-allocated tensors are filled at each iteration
+            assert data_ptrs == {key: value.data_ptr() for key, value in b.items()}
+        steps = b.get("step_count").squeeze(-1)
+        next_obs = b.get("next_observation")
+        obs = b.get("observation")
+        # observations of consecutive steps of a trajectory match
+        same_traj = steps[..., 1:] > 1
+        torch.testing.assert_close(
+            next_obs[..., :-1, :][same_traj], obs[..., 1:, :][same_traj]
+        )
+        if i == 2:
+            break
+    collector.shutdown()
+
+
+@pytest.mark.parametrize("num_env", [1, 2])
+def test_collector_nested_observation(num_env):
+    if num_env == 1:
+        make_env = lambda: NestedCountingEnv(max_steps=3)
+    else:
+        make_env = lambda: SerialEnv(num_env, lambda: NestedCountingEnv(max_steps=3))
+    collector = SyncDataCollector(
+        make_env,
+        frames_per_batch=12,
+        split_trajs=False,
+    )
+    for i, b in enumerate(collector):
+        state = b.get("state")
+        assert isinstance(state, TensorDictBase)
+        assert state.batch_size == b.batch_size
+        torch.testing.assert_close(state.get("count"), b.get("observation"))
+        torch.testing.assert_close(
+            b.get("next_state").get("count"), b.get("next_observation")
+        )
+        if i == 1:
+            break
+    collector.shutdown()
+
+
+@pytest.mark.parametrize(
+    "collector_class",
+    [SyncDataCollector, MultiSyncDataCollector, MultiaSyncDataCollector],
+)
+def test_collector_profiling(collector_class):
+    make_env = lambda: ContinuousActionVecMockEnv()
+    dummy_env = make_env()
+    obs_spec = dummy_env.observation_spec["next_observation"]
+    policy_module = nn.Linear(obs_spec.shape[-1], dummy_env.action_spec.shape[-1])
+    policy = Actor(policy_module, spec=dummy_env.action_spec)
+    dummy_env.close()
+
+    if collector_class is SyncDataCollector:
+        collector = collector_class(
+            make_env,
+            policy,
+            frames_per_batch=10,
+            max_frames_per_traj=4,
+            profile=True,
+        )
+    else:
+        collector = collector_class(
+            [make_env, make_env],
+            policy,
+            frames_per_batch=10,
+            max_frames_per_traj=4,
+            profile=True,
+        )
+    for i, b in enumerate(collector):
+        if i == 2:
+            break
+    stats = collector.profiling_stats()
+    collector.shutdown()
+    if collector_class is SyncDataCollector:
+        worker_prefixes = [""]
+        assert stats["frames"] == 30
+    else:
+        worker_prefixes = ["worker0/", "worker1/"]
+        assert stats["queue_wait/count"] > 0
+        assert "queue_size/last" in stats
+    assert stats["fps"] > 0
+    assert stats["split_trajs/count"] == 3
+    for prefix in worker_prefixes:
+        assert stats[prefix + "fps"] > 0
+        assert stats[prefix + "step/count"] == stats[prefix + "frames"]
+        for phase in ("policy", "env_step", "cast_to_policy", "cast_to_env"):
+            assert stats[prefix + f"{phase}/count"] == stats[prefix + "frames"]
+            assert (
+                0
+                <= stats[prefix + f"{phase}/p50"]
+                <= stats[prefix + f"{phase}/p99"]
+            )
+        assert stats[prefix + "reset/count"] > 0
+
+    collector = SyncDataCollector(make_env, frames_per_batch=10)
+    next(iter(collector))
+    assert collector.profiling_stats() == {}
+    collector.shutdown()
+
+
 def weight_reset(m):
     if isinstance(m, nn.Conv2d) or isinstance(m, nn.Linear):
         m.reset_parameters()
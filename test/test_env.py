@@ -5,6 +5,7 @@
 
 import argparse
 import os.path
+import time
 from collections import defaultdict
 
 import numpy as np
@@ -13,6 +14,7 @@ import torch
 import yaml
 from _utils_internal import get_available_devices
 from mocking_classes import (
+    CountingEnv,
     DiscreteActionVecMockEnv,
     MockSerialEnv,
     DiscreteActionConvMockEnv,
@@ -270,6 +272,24 @@ def _make_envs(
     return env_parallel, env_serial, env0
 
 
+class _FailingMockEnv(DiscreteActionVecMockEnv):
+    # crashes or hangs at a given step after its creation
+    def __init__(self, failure=None, fail_at=3, **kwargs):
+        super().__init__(**kwargs)
+        self.failure = failure
+        self.fail_at = fail_at
+        self.step_count = 0
+
+    def _step(self, tensordict):
+        self.step_count += 1
+        if self.step_count == self.fail_at:
+            if self.failure == "crash":
+                os._exit(1)
+            elif self.failure == "hang":
+                time.sleep(1000)
+        return super()._step(tensordict)
+
+
 class TestParallel:
     @pytest.mark.skipif(not _has_gym, reason="no gym")
     @pytest.mark.parametrize("env_name", ["ALE/Pong-v5", "Pendulum-v1"])
@@ -650,6 +670,219 @@ class TestParallel:
         env0_in.close()
         env0_in.close()
 
+    @pytest.mark.parametrize("envs_per_process", [1, 2])
+    def test_parallel_env_step_async(self, envs_per_process):
+        num_env = 4
+        env_sync = ParallelEnv(num_env, DiscreteActionVecMockEnv)
+        env_async = ParallelEnv(
+            num_env, DiscreteActionVecMockEnv, envs_per_process=envs_per_process
+        )
+        env_sync.set_seed(0)
+        env_async.set_seed(0)
+        td_sync = env_sync.reset()
+        td_async = env_async.reset()
+        assert_allclose_td(td_sync, td_async)
+        td_sync.set("action", env_sync.action_spec.rand(env_sync.batch_size))
+        td_async.set("action", td_sync.get("action").clone())
+        td_sync = env_sync.step(td_sync)
+
+        env_async.step_async(td_async)
+        with pytest.raises(RuntimeError, match="pending"):
+            env_async.step_async(td_async[:1], [0])
+        with pytest.raises(RuntimeError, match="pending"):
+            env_async.step(td_async)
+        td_ready, env_ids = env_async.step_wait(min_ready=1)
+        assert len(env_ids) >= 1
+        assert td_ready.batch_size == env_ids.shape
+        results = dict(zip(env_ids.tolist(), td_ready.unbind(0)))
+        if len(results) < num_env:
+            td_ready, env_ids = env_async.step_wait()
+            results.update(zip(env_ids.tolist(), td_ready.unbind(0)))
+        assert sorted(results) == list(range(num_env))
+        for i, td in results.items():
+            for key in ("next_observation", "reward", "done"):
+                torch.testing.assert_close(td.get(key), td_sync[i].get(key))
+        with pytest.raises(RuntimeError, match="No worker"):
+            env_async.step_wait()
+
+        # step a subset of the workers
+        td_async = step_tensordict(td_sync)
+        td_async.set("action", env_async.action_spec.rand(env_async.batch_size))
+        env_async.step_async(td_async[1:3], [1, 2])
+        td_ready, env_ids = env_async.step_wait()
+        assert env_ids.tolist() == [1, 2]
+        env_async.step_async(td_async[:1], [0])
+        env_sync.close()
+        # pending steps are collected before closing the env
+        env_async.close()
+
+    @pytest.mark.parametrize(
+        "signal_mode,double_buffer", [("pipe", False), ("flags", True)]
+    )
+    def test_parallel_env_reset_while_pending(self, signal_mode, double_buffer):
+        # the first env finishes its episode while the others are stepping
+        env = ParallelEnv(
+            3,
+            [
+                lambda: CountingEnv(max_steps=1),
+                lambda: CountingEnv(max_steps=100, step_time=0.5),
+                lambda: CountingEnv(max_steps=100, step_time=0.5),
+            ],
+            signal_mode=signal_mode,
+            double_buffer=double_buffer,
+        )
+        td = env.reset()
+        td.set("action", torch.zeros(3, 1))
+        env.step_async(td)
+        td_ready, env_ids = env.step_wait(min_ready=1)
+        assert env_ids.tolist() == [0]
+        assert td_ready.get("done").all()
+
+        reset_workers = torch.tensor([[True], [False], [False]])
+        td_reset = env.reset(TensorDict({"reset_workers": reset_workers}, [3]))
+        assert td_reset.get("observation")[0] == 0
+        assert not td_reset.get("done")[0]
+        # the reset env is stepped again without waiting for the others
+        env.step_async(td[:1], [0])
+        with pytest.raises(RuntimeError, match="pending"):
+            env.reset()
+        td_ready, env_ids = env.step_wait()
+        assert env_ids.tolist() == [0, 1, 2]
+        assert td_ready.get("next_observation").view(-1).tolist() == [1, 1, 1]
+        env.close()
+
+    @pytest.mark.parametrize("envs_per_process", [1, 2, 3])
+    @pytest.mark.parametrize("signal_mode", ["pipe", "flags"])
+    def test_parallel_env_envs_per_process(self, envs_per_process, signal_mode):
+        num_env = 5
+        env_serial = SerialEnv(num_env, DiscreteActionVecMockEnv)
+        env_parallel = ParallelEnv(
+            num_env,
+            DiscreteActionVecMockEnv,
+            envs_per_process=envs_per_process,
+            signal_mode=signal_mode,
+        )
+        env_serial.set_seed(0)
+        env_parallel.set_seed(0)
+        assert len(env_parallel._workers) == -(-num_env // envs_per_process)
+        td_serial = env_serial.reset()
+        td_parallel = env_parallel.reset()
+        assert_allclose_td(td_serial, td_parallel)
+        for _ in range(3):
+            td_serial.set("action", env_serial.action_spec.rand(env_serial.batch_size))
+            td_parallel.set("action", td_serial.get("action").clone())
+            td_serial = env_serial.step(td_serial)
+            td_parallel = env_parallel.step(td_parallel)
+            assert_allclose_td(td_serial, td_parallel)
+            td_serial = step_tensordict(td_serial)
+            td_parallel = step_tensordict(td_parallel)
+
+        # partial reset
+        reset_workers = torch.zeros(num_env, 1, dtype=torch.bool)
+        reset_workers[1] = reset_workers[3] = True
+        td_serial = env_serial.reset(
+            TensorDict({"reset_workers": reset_workers}, [num_env])
+        )
+        td_parallel = env_parallel.reset(
+            TensorDict({"reset_workers": reset_workers}, [num_env])
+        )
+        # only the envs that have been reset are updated
+        assert_allclose_td(
+            td_serial[reset_workers.squeeze(-1)].exclude("reset_workers"),
+            td_parallel[reset_workers.squeeze(-1)].exclude("reset_workers"),
+        )
+
+        assert len(env_parallel.custom_fun()) == num_env
+        assert list(env_parallel.state_dict().keys()) == [
+            f"worker{i}" for i in range(num_env)
+        ]
+        env_serial.close()
+        env_parallel.close()
+
+    @pytest.mark.parametrize("signal_mode", ["pipe", "flags"])
+    def test_parallel_env_double_buffer(self, signal_mode):
+        num_env = 3
+        env_serial = SerialEnv(num_env, DiscreteActionVecMockEnv)
+        env_parallel = ParallelEnv(
+            num_env,
+            DiscreteActionVecMockEnv,
+            envs_per_process=2,
+            signal_mode=signal_mode,
+            double_buffer=True,
+        )
+        env_serial.set_seed(0)
+        env_parallel.set_seed(0)
+        td_serial = env_serial.reset()
+        td_parallel = env_parallel.reset()
+        assert_allclose_td(td_serial, td_parallel)
+        previous = None
+        data_ptrs = []
+        for _ in range(4):
+            td_serial.set("action", env_serial.action_spec.rand(env_serial.batch_size))
+            td_parallel.set("action", td_serial.get("action").clone())
+            td_serial = env_serial.step(td_serial)
+            # the results are not copied out of the shared tensordicts
+            td_parallel = env_parallel.step(td_parallel.select(*td_serial.keys()))
+            assert_allclose_td(td_serial, td_parallel)
+            data_ptrs.append(td_parallel.get("next_observation").data_ptr())
+            # the results of the previous step are left untouched
+            if previous is not None:
+                assert_allclose_td(previous[0], previous[1])
+            step_results = td_parallel.select("next_observation", "reward", "done")
+            previous = (step_results, step_results.clone())
+            td_serial = step_tensordict(td_serial)
+            td_parallel = step_tensordict(td_parallel)
+        assert data_ptrs[0] == data_ptrs[2] != data_ptrs[1] == data_ptrs[3]
+
+        # partial reset
+        reset_workers = torch.zeros(num_env, 1, dtype=torch.bool)
+        reset_workers[1] = True
+        td_serial = env_serial.reset(
+            TensorDict({"reset_workers": reset_workers}, [num_env])
+        )
+        td_parallel = env_parallel.reset(
+            TensorDict({"reset_workers": reset_workers}, [num_env])
+        )
+        assert_allclose_td(
+            td_serial[reset_workers.squeeze(-1)].exclude("reset_workers"),
+            td_parallel[reset_workers.squeeze(-1)].exclude("reset_workers"),
+        )
+        # the envs that have not been reset keep the results of the last step
+        torch.testing.assert_close(
+            td_parallel.get("observation")[~reset_workers.squeeze(-1)],
+            previous[1].get("next_observation")[~reset_workers.squeeze(-1)],
+        )
+        env_serial.close()
+        env_parallel.close()
+
+    @pytest.mark.parametrize("signal_mode", ["pipe", "flags"])
+    @pytest.mark.parametrize("failure", ["crash", "hang"])
+    def test_parallel_env_restart(self, signal_mode, failure):
+        num_env = 3
+        env = ParallelEnv(
+            num_env,
+            _FailingMockEnv,
+            create_env_kwargs=[{}, {"failure": failure}, {}],
+            signal_mode=signal_mode,
+            max_restarts=1,
+            worker_timeout=5.0,
+        )
+        td = env.reset()
+        for i in range(4):
+            td.set("action", env.action_spec.rand(env.batch_size))
+            td = env.step(td)
+            if i == 2:
+                # the second env failed and has been restarted
+                assert env.restart_counts == [0, 1, 0]
+                assert td.get("done").squeeze(-1).tolist() == [False, True, False]
+                td.set("reset_workers", td.get("done").clone())
+                td.update(env.reset(td))
+            else:
+                assert not td.get("done").any()
+            td = step_tensordict(td)
+        assert env.restart_counts == [0, 1, 0]
+        env.close()
+
     @pytest.mark.parametrize("parallel", [True, False])
     def test_parallel_env_kwargs_set(self, parallel):
         num_env = 3
@@ -691,6 +924,23 @@ class TestParallel:
         env1.close()
         env2.close()
 
+    @pytest.mark.parametrize("signal_mode", ["pipe", "flags"])
+    def test_parallel_env_reset_latency(self, signal_mode):
+        # idle processes answer the commands sent through their pipe right away
+        env = ParallelEnv(
+            2, lambda: CountingEnv(max_steps=100), signal_mode=signal_mode
+        )
+        env.reset()
+        latencies = []
+        for _ in range(5):
+            env.rand_step()
+            time.sleep(0.05)
+            t0 = time.perf_counter()
+            env.reset()
+            latencies.append(time.perf_counter() - t0)
+        env.close()
+        assert sorted(latencies)[2] < 0.1
+
 
 class TestSpec:
     def test_discrete_action_spec_reconstruct(self):
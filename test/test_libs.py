@@ -18,7 +18,14 @@ if _has_dmc:
     from dm_control.suite.wrappers import pixels
 
 from torchrl.data.tensordict.tensordict import assert_allclose_td
-from torchrl.envs import GymEnv, GymWrapper, DMControlEnv, DMControlWrapper
+from torchrl.envs import (
+    GymEnv,
+    GymWrapper,
+    GymVecEnvWrapper,
+    DMControlEnv,
+    DMControlWrapper,
+)
+from torchrl.envs.utils import step_tensordict
 
 
 @pytest.mark.skipif(not _has_gym, reason="no gym library found")
@@ -104,6 +111,60 @@ def test_gym(env_name, frame_skip, from_pixels, pixels_only):
     assert_allclose_td(rollout0, rollout2)
 
 
+@pytest.mark.skipif(not _has_gym, reason="no gym library found")
+@pytest.mark.parametrize("env_name", ["CartPole-v1", "Pendulum-v1"])
+def test_gym_vec_env(env_name):
+    num_envs = 3
+    env = GymVecEnvWrapper(
+        gym.vector.SyncVectorEnv([lambda: gym.make(env_name)] * num_envs)
+    )
+    assert env.batch_size == torch.Size([num_envs])
+    env.set_seed(0)
+    tensordict = env.reset()
+    obs_shape = torch.Size([num_envs, *env.observation_spec["next_observation"].shape])
+    assert tensordict.get("observation").shape == obs_shape
+    for _ in range(50):
+        tensordict = env.rand_step(tensordict)
+        assert tensordict.get("next_observation").shape == obs_shape
+        assert tensordict.get("reward").shape == torch.Size([num_envs, 1])
+        done = tensordict.get("done")
+        assert done.shape == torch.Size([num_envs, 1])
+        tensordict = step_tensordict(tensordict)
+        if done.any():
+            # only the envs that are done are reset
+            reset_workers = done.clone()
+            tensordict_reset = env.reset(
+                tensordict.select().set("reset_workers", reset_workers)
+            )
+            assert not tensordict_reset.get("done").any()
+            not_reset = ~reset_workers.squeeze(-1)
+            torch.testing.assert_close(
+                tensordict_reset.get("observation")[not_reset],
+                tensordict.get("observation")[not_reset],
+            )
+            tensordict.update(tensordict_reset)
+    env.close()
+
+
+@pytest.mark.skipif(not _has_gym, reason="no gym library found")
+def test_gym_vec_env_step_before_reset():
+    num_envs = 2
+    env = GymVecEnvWrapper(
+        gym.vector.SyncVectorEnv([lambda: gym.make("CartPole-v1")] * num_envs)
+    )
+    assert (env._pending_reset == torch.zeros(num_envs, dtype=torch.bool)).all()
+    # the underlying envs are ready, but the wrapper has never been reset
+    env._env.reset()
+    done = torch.zeros(num_envs, 1, dtype=torch.bool)
+    for _ in range(500):
+        done |= env.rand_step().get("done")
+        if done.all():
+            break
+    assert done.all()
+    assert env._pending_reset.all()
+    env.close()
+
+
 @pytest.mark.skipif(not _has_dmc, reason="no dm_control library found")
 @pytest.mark.parametrize("env_name,task", [["cheetah", "run"], ["humanoid", "walk"]])
 @pytest.mark.parametrize("frame_skip", [1, 3])
@@ -11,7 +11,7 @@ import numpy as np
 import pytest
 import torch
 from _utils_internal import get_available_devices
-from torchrl.data.tensordict.memmap import MemmapTensor
+from torchrl.data.tensordict.memmap import MemmapArena, MemmapTensor
 
 
 def test_memmap_type():
@@ -195,6 +195,86 @@ def test_memmap_zero_value(device, value, shape):
     assert torch.all(m + torch.ones([3, 4], device=device) == 1)
 
 
+def test_memmap_filename(tmpdir):
+    filename = os.path.join(tmpdir, "tensor.memmap")
+    m = MemmapTensor(3, 4, dtype=torch.int, filename=filename)
+    assert m.filename == filename
+    m[1] = torch.arange(4, dtype=torch.int)
+    m.memmap_array.flush()
+    del m
+    # the file is not deleted and can be re-opened without erasing its content
+    assert os.path.isfile(filename)
+    m = MemmapTensor(3, 4, dtype=torch.int, filename=filename)
+    assert (m[1] == torch.arange(4)).all()
+    assert (m[0] == 0).all()
+
+
+@pytest.mark.parametrize("interleaved", [False, True])
+def test_memmap_arena(interleaved):
+    tensors = [
+        torch.randn(5, 3),
+        torch.arange(5),
+        torch.zeros(5, 2, 2, dtype=torch.bool).bernoulli_(),
+    ]
+    arena = MemmapArena(
+        [(tensor.shape, tensor.dtype) for tensor in tensors], interleaved=interleaved
+    )
+    memmaps = [arena.tensor(i) for i in range(len(arena))]
+    for memmap, tensor in zip(memmaps, tensors):
+        assert memmap.filename == arena.filename
+        assert memmap.shape == tensor.shape
+        assert memmap.dtype == tensor.dtype
+        memmap.copy_(tensor)
+    for offset in arena.offsets:
+        assert offset % 8 == 0 if interleaved else offset % 64 == 0
+    index = torch.tensor([3, 0, 3])
+    for memmap, tensor in zip(memmaps, tensors):
+        assert (memmap[index] == tensor[index]).all()
+        assert (memmap.clone()._tensor == tensor).all()
+    memmaps[0][1] = torch.ones(3)
+    assert (memmaps[0][1] == 1).all()
+    assert (memmaps[1]._tensor == tensors[1]).all()
+
+    # the tensors share the arena across processes, which keeps the file
+    memmap = pickle.loads(pickle.dumps(memmaps[0]))
+    assert (memmap._tensor == memmaps[0]._tensor).all()
+    filename = arena.filename
+    del memmap, arena
+    assert os.path.isfile(filename)
+    del memmaps
+    assert not os.path.isfile(filename)
+
+
+def test_memmap_arena_interleaved_error():
+    with pytest.raises(ValueError, match="same first dimension"):
+        MemmapArena([((5, 3), torch.float), ((4,), torch.float)], interleaved=True)
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+@pytest.mark.parametrize("sorted_reads", [False, True])
+def test_memmap_index_select(num_threads, sorted_reads):
+    tensor = torch.randn(20, 3, 4)
+    m = MemmapTensor(tensor)
+    index = torch.tensor([7, 2, 7, 19, -1, 0])
+    out = m.index_select(0, index, num_threads=num_threads, sorted_reads=sorted_reads)
+    assert (out == tensor[index]).all()
+    # the output can be provided, and is returned as such on cpu
+    out = torch.zeros(6, 3, 4)
+    res = m.index_select(
+        0, index, out=out, num_threads=num_threads, sorted_reads=sorted_reads
+    )
+    assert res is out
+    assert (out == tensor[index]).all()
+    with pytest.raises(RuntimeError, match="out must be a CPU tensor"):
+        m.index_select(0, index, out=torch.zeros(5, 3, 4))
+    # other dimensions and torch.index_select
+    index = torch.tensor([3, 0])
+    assert (torch.index_select(m, 2, index) == tensor.index_select(2, index)).all()
+    # long tensors indexing goes through index_select
+    index = torch.randint(20, (10,))
+    assert (m[index] == tensor[index]).all()
+
+
 if __name__ == "__main__":
     args, unknown = argparse.ArgumentParser().parse_known_args()
     pytest.main([__file__, "--capture", "no", "--exitfirst"] + unknown)
@@ -4,24 +4,38 @@
 # LICENSE file in the root directory of this source tree.
 
 import argparse
+import threading
+
+from torch import multiprocessing as mp
 
 import numpy as np
 import pytest
 import torch
 from _utils_internal import get_available_devices
+from torchrl._torchrl import SumSegmentTreeFp32, MinSegmentTreeFp32
 from torchrl.data import (
     TensorDict,
     ReplayBuffer,
     PrioritizedReplayBuffer,
     TensorDictReplayBuffer,
 )
-from torchrl.data.replay_buffers import TensorDictPrioritizedReplayBuffer
+from torchrl.data.replay_buffers import (
+    PinnedPrefetcher,
+    ShardedReplayBuffer,
+    SharedReplayBuffer,
+    TensorDictPrioritizedReplayBuffer,
+    TensorDictSliceReplayBuffer,
+)
 from torchrl.data.replay_buffers.storages import (
+    CompressedStorage,
+    FrameStackStorage,
     ListStorage,
     LazyMemmapStorage,
     LazyTensorStorage,
+    _memmap_leaves,
 )
 from torchrl.data.tensordict.tensordict import assert_allclose_td, TensorDictBase
+from torchrl.envs.transforms import CatFrames
 
 
 collate_fn_dict = {
@@ -277,6 +291,635 @@ def test_prb(priority_key, contiguous, device):
     )
 
 
+@pytest.mark.parametrize(
+    "storage_type", [LazyTensorStorage, LazyMemmapStorage, CompressedStorage]
+)
+@pytest.mark.parametrize("prioritized", [False, True])
+def test_rb_tensor_storage_sample(storage_type, prioritized):
+    torch.manual_seed(0)
+    size = 20
+    if prioritized:
+        rb = TensorDictPrioritizedReplayBuffer(
+            size, alpha=0.7, beta=0.9, storage=storage_type(size)
+        )
+    else:
+        rb = TensorDictReplayBuffer(size, storage=storage_type(size))
+    data = TensorDict(
+        {
+            "a": torch.arange(10),
+            "b": TensorDict({"c": torch.arange(10).view(10, 1).expand(10, 3)}, [10]),
+        },
+        [10],
+    )
+    rb.extend(data)
+    sample = rb.sample(7)
+    # the batch is gathered at once from the storage, not stacked
+    assert type(sample) is TensorDict
+    assert sample.batch_size == torch.Size([7])
+    assert (sample.get("a") < 10).all()
+    assert (sample.get("b").get("c") == sample.get("a")).all()
+
+
+@pytest.mark.parametrize("storage_type", [LazyTensorStorage, LazyMemmapStorage])
+def test_tensor_storage_sample_index(storage_type):
+    storage = storage_type(10)
+    storage.set(torch.arange(4), TensorDict({"a": torch.arange(4)}, [4]))
+    index = storage.sample_index(100)
+    assert isinstance(index, torch.Tensor)
+    assert index.dtype is torch.long
+    assert ((index >= 0) & (index < 4)).all()
+    assert (storage.get(index).get("a").squeeze(-1) == index).all()
+
+
+@pytest.mark.parametrize("layout", ["files", "packed", "interleaved"])
+def test_memmap_storage_layout(layout):
+    storage = LazyMemmapStorage(10, layout=layout)
+    data = TensorDict(
+        {
+            "a": torch.randn(4, 3),
+            "b": TensorDict({"c": torch.arange(4)}, [4]),
+        },
+        [4],
+    )
+    storage.set(torch.arange(4), data)
+    filenames = {leaf.filename for leaf in _memmap_leaves(storage._storage)}
+    assert len(filenames) == (2 if layout == "files" else 1)
+    index = torch.tensor([3, 1])
+    sample = storage.get(index)
+    assert (sample.get("a") == data.get("a")[index]).all()
+    assert (sample.get("b").get("c") == data.get("b").get("c")[index]).all()
+    assert (storage.get(5).get("a") == 0).all()
+
+
+@pytest.mark.parametrize("dtype", [torch.float, torch.double])
+def test_prb_update_priority(dtype):
+    torch.manual_seed(0)
+    rb = PrioritizedReplayBuffer(10, alpha=0.7, beta=0.9, eps=1e-2, dtype=dtype)
+    rb.extend([torch.randn(3) for _ in range(10)])
+    index = torch.tensor([1, 4, 7])
+    priority = torch.tensor([0.5, 3.0, 2.0])
+    rb.update_priority(index, priority)
+    expected = (priority.to(dtype) + 1e-2) ** 0.7
+    torch.testing.assert_close(rb._sum_tree[index], expected)
+    torch.testing.assert_close(rb._min_tree[index], expected)
+    assert rb.max_priority == 3.0
+
+    # scalar priority is broadcast over the index
+    rb.update_priority(index, 1.0)
+    torch.testing.assert_close(
+        rb._sum_tree[index], torch.full((3,), (1.0 + 1e-2) ** 0.7, dtype=dtype)
+    )
+    with pytest.raises(RuntimeError, match="priority should be"):
+        rb.update_priority(index, torch.ones(2))
+
+
+@pytest.mark.parametrize("tree_type", [SumSegmentTreeFp32, MinSegmentTreeFp32])
+def test_segment_tree_batched_update(tree_type):
+    torch.manual_seed(0)
+    size = 10000
+    tree = tree_type(size)
+    tree_ref = tree_type(size)
+    # batches larger than the grain size are written in parallel, with
+    # duplicated indices
+    index = torch.randint(size, (5000,))
+    value = torch.rand(5000)
+    tree[index] = value
+    for i, v in zip(index.tolist(), value.tolist()):
+        tree_ref[i] = v
+    torch.testing.assert_close(
+        tree[torch.arange(size)], tree_ref[torch.arange(size)]
+    )
+    left = torch.randint(size // 2, (2000,))
+    right = left + torch.randint(1, size // 2, (2000,))
+    torch.testing.assert_close(tree.query(left, right), tree_ref.query(left, right))
+
+
+def test_segment_tree_stratified_sample():
+    torch.manual_seed(0)
+    size, batch_size = 10000, 2000
+    tree = SumSegmentTreeFp32(size)
+    tree[torch.arange(size)] = 1.0
+    index = tree.stratified_sample(batch_size)
+    assert index.shape == torch.Size([batch_size])
+    # one index per segment of equal mass
+    segment = size // batch_size
+    assert (index // segment == torch.arange(batch_size)).all()
+
+
+def test_prb_concurrent_sample_update():
+    torch.manual_seed(0)
+    rb = PrioritizedReplayBuffer(
+        1000,
+        alpha=0.7,
+        beta=0.9,
+        prefetch=3,
+        collate_fn=lambda x: torch.stack(x, 0),
+    )
+    rb.extend([torch.randn(3) for _ in range(1000)])
+    errors = []
+
+    def update():
+        try:
+            for _ in range(50):
+                rb.update_priority(torch.randint(1000, (64,)), torch.rand(64))
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    for _ in range(50):
+        data, weight, index = rb.sample(64)
+        assert data.shape == torch.Size([64, 3])
+        assert ((index >= 0) & (index < 1000)).all()
+        assert (weight > 0).all()
+    thread.join()
+    assert not errors
+
+
+@pytest.mark.parametrize("prioritized", [False, True])
+def test_sharded_rb(prioritized):
+    torch.manual_seed(0)
+    num_shards, shard_size = 3, 100
+    if prioritized:
+        shards = [
+            TensorDictPrioritizedReplayBuffer(
+                shard_size, alpha=0.7, beta=0.9, storage=LazyTensorStorage(shard_size)
+            )
+            for _ in range(num_shards)
+        ]
+    else:
+        shards = [
+            TensorDictReplayBuffer(shard_size, storage=LazyTensorStorage(shard_size))
+            for _ in range(num_shards)
+        ]
+    rb = ShardedReplayBuffer(shards)
+    assert rb.capacity == num_shards * shard_size
+
+    def extend(worker):
+        for i in range(5):
+            rb.extend(TensorDict({"a": torch.full((10, 1), worker * 100 + i)}, [10]))
+
+    threads = [threading.Thread(target=extend, args=(w,)) for w in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(rb) == 300
+    # writes are dispatched evenly across the shards
+    assert all(len(shard) == 100 for shard in rb.shards)
+
+    # global indices point to the sampled data
+    if prioritized:
+        sample, weight, index = rb.sample(64)
+        assert (weight > 0).all()
+        assert (sample.get("index").squeeze(-1) == index).all()
+        rb.update_priority(index[:1], 1e8)
+        sample, _, index2 = rb.sample(64)
+        assert (index2 == index[0]).sum() > 32
+    else:
+        sample = rb.sample(64)
+        index = torch.randint(300, (10,))
+        expected = torch.stack([rb[i].get("a") for i in index.tolist()], 0)
+        assert (rb[index].get("a") == expected).all()
+    assert sample.batch_size == torch.Size([64])
+
+
+def test_sharded_rb_errors():
+    with pytest.raises(ValueError, match="same type"):
+        ShardedReplayBuffer(
+            [ReplayBuffer(10), PrioritizedReplayBuffer(10, alpha=0.7, beta=0.9)]
+        )
+    with pytest.raises(ValueError, match="must not pin memory or prefetch"):
+        ShardedReplayBuffer([ReplayBuffer(10, prefetch=2)])
+    with pytest.raises(RuntimeError, match="prioritized shards"):
+        ShardedReplayBuffer([ReplayBuffer(10)]).update_priority(0, 1.0)
+
+
+@pytest.mark.parametrize("prioritized", [False, True])
+def test_persistent_memmap_storage(tmpdir, prioritized):
+    torch.manual_seed(0)
+    size = 20
+
+    def make_rb(storage):
+        if prioritized:
+            return TensorDictPrioritizedReplayBuffer(
+                size, alpha=0.7, beta=0.9, storage=storage
+            )
+        return TensorDictReplayBuffer(size, storage=storage)
+
+    rb = make_rb(LazyMemmapStorage(size, scratch_dir=tmpdir, persistent=True))
+    data = TensorDict(
+        {
+            "a": torch.randn(15, 3),
+            "b": TensorDict({"c": torch.randint(10, (15, 2))}, [15]),
+        },
+        [15],
+    )
+    rb.extend(data)
+    rb.extend(data[:10])
+    if prioritized:
+        rb.update_priority(
+            TensorDict(
+                {"index": torch.tensor([0, 1]), "td_error": torch.tensor([2.0, 3.0])},
+                [2],
+            )
+        )
+        priority = rb._sum_tree[torch.arange(size)]
+    rb.checkpoint()
+    stored = rb._storage._storage.to_tensordict()
+    del rb
+
+    storage = LazyMemmapStorage.load(tmpdir)
+    rb = make_rb(storage)
+    assert len(rb) == size
+    assert rb.cursor == 5
+    assert (storage._storage.to_tensordict() == stored).all()
+    assert storage._storage.get("b").get("c").dtype is torch.long
+    if prioritized:
+        torch.testing.assert_close(rb._sum_tree[torch.arange(size)], priority)
+        assert rb.max_priority == 3.0
+    # the buffer keeps on writing where it stopped
+    rb.extend(data[:2])
+    assert rb.cursor == 7
+    assert (storage.get(5).get("a") == data[0].get("a")).all()
+
+
+def test_persistent_memmap_storage_errors(tmpdir):
+    with pytest.raises(ValueError, match="requires a scratch_dir"):
+        LazyMemmapStorage(10, persistent=True)
+    rb = TensorDictReplayBuffer(10, storage=LazyMemmapStorage(10, scratch_dir=tmpdir))
+    with pytest.raises(RuntimeError, match="persistent LazyMemmapStorage"):
+        rb.checkpoint()
+
+
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_compressed_storage(num_threads):
+    torch.manual_seed(0)
+    storage = CompressedStorage(10, num_threads=num_threads)
+    rb = ReplayBuffer(10, storage=storage)
+    frames = torch.zeros(6, 4, 84, 84, dtype=torch.uint8)
+    frames[:, :, 20:40, 20:40] = torch.randint(256, (6, 4, 20, 20), dtype=torch.uint8)
+    rb.extend(frames)
+    assert len(rb) == 6
+    assert (storage.get(torch.arange(6)) == frames).all()
+    assert (storage.get(3) == frames[3]).all()
+    sample = rb.sample(5)
+    assert sample.shape == torch.Size([5, 4, 84, 84])
+    assert sample.dtype is torch.uint8
+    stats = storage.stats()
+    assert stats["raw_bytes"] == frames.numel()
+    assert stats["compression_ratio"] > 5
+    assert stats["encode_time"] > 0 and stats["decode_time"] > 0
+    # overwriting an element replaces its compressed size
+    compressed_bytes = stats["compressed_bytes"]
+    rb.extend(frames[:4])
+    assert storage.stats()["raw_bytes"] == frames.numel() + 4 * frames[0].numel()
+    assert storage.stats()["compressed_bytes"] > compressed_bytes
+    storage.set(0, frames[0])
+    assert (storage.get(0) == frames[0]).all()
+
+
+def test_compressed_storage_errors():
+    storage = CompressedStorage(3)
+    with pytest.raises(RuntimeError, match="unitialized CompressedStorage"):
+        storage.get(0)
+    with pytest.raises(IndexError, match="out of bounds"):
+        storage.set(3, torch.zeros(2))
+    with pytest.raises(ValueError, match="compression_level"):
+        CompressedStorage(3, compression_level=10)
+
+
+def _catframes_rollout(n_envs, T, ep_len, N=4):
+    """Collects [n_envs, T] transitions of random 8x8 frames stacked by CatFrames."""
+    envs = []
+    for env_idx in range(n_envs):
+        cat_frames = CatFrames(N=N, keys_in=["next_pixels"])
+        traj_id = env_idx * T
+        obs = cat_frames._apply_transform(torch.randint(256, (1, 8, 8)).byte())
+        steps = []
+        for t in range(T):
+            next_obs = cat_frames._apply_transform(torch.randint(256, (1, 8, 8)).byte())
+            done = (t + 1) % ep_len == 0
+            steps.append(
+                TensorDict(
+                    {
+                        "pixels": obs,
+                        "next_pixels": next_obs,
+                        "done": torch.tensor([done]),
+                        "traj_ids": torch.tensor([traj_id]),
+                        "reward": torch.randn(1),
+                    },
+                    [],
+                )
+            )
+            obs = next_obs
+            if done:
+                cat_frames.reset(None)
+                traj_id += 1
+                obs = cat_frames._apply_transform(torch.randint(256, (1, 8, 8)).byte())
+        envs.append(torch.stack(steps, 0))
+    return torch.stack(envs, 0).contiguous()
+
+
+def test_frame_stack_storage():
+    torch.manual_seed(0)
+    storage = FrameStackStorage(100, N=4)
+    rb = TensorDictReplayBuffer(100, storage=storage)
+    data = _catframes_rollout(n_envs=3, T=20, ep_len=7)
+    # the trajectories are continued across calls to extend
+    rb.extend(data[:, :10].reshape(-1))
+    rb.extend(data[:, 10:].reshape(-1))
+    stored = storage.get(torch.arange(60))
+    expected = torch.cat([data[:, :10].reshape(-1), data[:, 10:].reshape(-1)], 0)
+    assert (stored.get("pixels") == expected.get("pixels")).all()
+    assert (stored.get("next_pixels") == expected.get("next_pixels")).all()
+    assert (stored.get("reward") == expected.get("reward")).all()
+    # one frame per transition and one per new trajectory
+    assert storage._frame_count == 60 + 9
+    sample = rb.sample(7)
+    assert sample.get("pixels").shape == torch.Size([7, 4, 8, 8])
+    assert (storage.get(3).get("pixels") == expected[3].get("pixels")).all()
+
+    # the frame ring wraps around with the storage
+    for _ in range(3):
+        data = _catframes_rollout(n_envs=3, T=20, ep_len=7)
+        rb.extend(data.reshape(-1))
+    index = torch.arange(rb.cursor - 60, rb.cursor) % 100
+    expected = data.reshape(-1).get("next_pixels")
+    assert (storage.get(index).get("next_pixels") == expected).all()
+
+
+def test_frame_stack_storage_errors():
+    data = _catframes_rollout(n_envs=1, T=20, ep_len=5)
+    storage = FrameStackStorage(20, N=4, frame_capacity=20)
+    storage.set(torch.arange(5), data[0, :5])
+    frames = storage._frames.clone()
+    frame_index = storage._frame_index.clone()
+    with pytest.raises(RuntimeError, match="frame capacity"):
+        storage.set(torch.arange(5, 20), data[0, 5:])
+    # a failed write leaves the storage untouched
+    assert (storage._frames == frames).all()
+    assert (storage._frame_index == frame_index).all()
+    assert len(storage) == 5
+    stored = storage.get(torch.arange(5))
+    assert (stored.get("pixels") == data[0, :5].get("pixels")).all()
+    storage.set(torch.arange(5, 10), data[0, 5:10])
+    stored = storage.get(torch.arange(10))
+    assert (stored.get("next_pixels") == data[0, :10].get("next_pixels")).all()
+    with pytest.raises(TypeError, match="only supports tensordicts"):
+        storage.set(0, torch.zeros(4, 8, 8))
+    with pytest.raises(ValueError, match="cat_dim must be negative"):
+        FrameStackStorage(20, cat_dim=0)
+
+
+@pytest.mark.parametrize("storage_type", [ListStorage, LazyTensorStorage])
+def test_slice_rb(storage_type):
+    torch.manual_seed(0)
+    storage = storage_type() if storage_type is ListStorage else storage_type(15)
+    rb = TensorDictSliceReplayBuffer(15, slice_len=3, burn_in=1, storage=storage)
+    # trajectory 1 is continued by the second call, the buffer wraps around
+    # and overwrites the beginning of trajectory 0
+    rb.extend(
+        TensorDict(
+            {"obs": torch.arange(10), "traj_ids": torch.tensor([0] * 6 + [1] * 4)},
+            [10],
+        )
+    )
+    rb.extend(
+        TensorDict(
+            {
+                "obs": torch.arange(10, 20),
+                "traj_ids": torch.tensor([1] * 3 + [2] * 7),
+                "done": torch.tensor([False] * 9 + [True]),
+            },
+            [10],
+        )
+    )
+    trajs = {
+        obs: traj
+        for traj, steps in enumerate([range(5, 6), range(6, 13), range(13, 20)])
+        for obs in steps
+    }
+    sample = rb.sample(100)
+    assert sample.shape == torch.Size([100, 4])
+    assert sample.get("mask").all()
+    obs = sample.get("obs").squeeze(-1)
+    assert (obs[:, 1:] == obs[:, :-1] + 1).all()
+    assert all(len({trajs[o] for o in row}) == 1 for row in obs.tolist())
+
+    # with padding, the first step of a trajectory can end a slice
+    rb.pad = True
+    sample = rb.sample(100)
+    obs = sample.get("obs").squeeze(-1)
+    mask = sample.get("mask").squeeze(-1)
+    assert (~mask).any()
+    assert ((obs[:, 1:] == obs[:, :-1] + 1) | ~mask[:, :-1]).all()
+    # padded steps are copies of the first step of the trajectory
+    first = obs[:, -1:] - mask.sum(-1, keepdim=True) + 1
+    assert (obs[~mask] == first.expand_as(obs)[~mask]).all()
+
+    # a new trajectory starts after a done
+    rb.extend(
+        TensorDict(
+            {"obs": torch.arange(20, 23), "traj_ids": torch.full((3,), 2)}, [3]
+        )
+    )
+    assert rb._traj_len[torch.arange(5, 8)].tolist() == [1, 2, 3]
+
+
+def test_slice_rb_errors():
+    with pytest.raises(ValueError, match="slice_len must be positive"):
+        TensorDictSliceReplayBuffer(10, slice_len=0)
+    rb = TensorDictSliceReplayBuffer(10, slice_len=4)
+    rb.extend(TensorDict({"traj_ids": torch.tensor([0, 0, 1, 1, 1])}, [5]))
+    with pytest.raises(RuntimeError, match="at least 4 steps"):
+        rb.sample(2)
+
+
+@pytest.mark.parametrize("storage_type", [LazyTensorStorage, LazyMemmapStorage])
+@pytest.mark.parametrize("device", get_available_devices())
+def test_pinned_prefetcher(storage_type, device):
+    torch.manual_seed(0)
+    rb = TensorDictReplayBuffer(100, storage=storage_type(100))
+    rb.extend(
+        TensorDict(
+            {
+                "a": torch.arange(50),
+                "b": TensorDict(
+                    {"c": torch.arange(50).view(50, 1).expand(50, 3)}, [50]
+                ),
+            },
+            [50],
+        )
+    )
+    prefetcher = PinnedPrefetcher(rb, 8, device=device, num_slots=3)
+    data_ptrs = set()
+    for i, batch in enumerate(prefetcher):
+        assert batch.batch_size == torch.Size([8])
+        assert batch.get("a").device == device
+        assert (batch.get("a") < 50).all()
+        assert (batch.get("b").get("c") == batch.get("a")).all()
+        data_ptrs.add(batch.get("a").data_ptr())
+        if i == 10:
+            break
+    # the slots are recycled
+    assert len(data_ptrs) == 3
+    handle = prefetcher.get()
+    assert not handle._released
+    with handle as batch:
+        assert (batch.get("a") < 50).all()
+    assert handle._released
+    prefetcher.close()
+    with pytest.raises(RuntimeError, match="has been closed"):
+        prefetcher.get()
+
+
+def test_pinned_prefetcher_errors():
+    rb = TensorDictReplayBuffer(10)
+    rb.extend(TensorDict({"a": torch.arange(5)}, [5]))
+    with pytest.raises(TypeError, match="only supports uniform replay buffers"):
+        PinnedPrefetcher(rb, 4)
+    rb = TensorDictReplayBuffer(10, storage=LazyTensorStorage(10))
+    with pytest.raises(RuntimeError, match="empty replay buffer"):
+        PinnedPrefetcher(rb, 4)
+
+
+def _shared_rb_collect(rb, worker_id):
+    for i in range(5):
+        rb.extend(
+            TensorDict(
+                {
+                    "a": torch.full((4,), worker_id),
+                    "b": TensorDict({"c": torch.full((4, 3), worker_id)}, [4]),
+                },
+                [4],
+            )
+        )
+
+
+def _shared_rb_learn(rb, queue):
+    for _ in range(10):
+        sample = rb.sample(8)
+        sample.set(rb.priority_key, sample.get("a").double() + 1)
+        rb.update_priority(sample)
+    queue.put(len(rb))
+
+
+@pytest.mark.parametrize("storage_type", [LazyTensorStorage, LazyMemmapStorage])
+def test_shared_rb(storage_type):
+    torch.manual_seed(0)
+    example = TensorDict(
+        {
+            "a": torch.zeros((), dtype=torch.long),
+            "b": TensorDict({"c": torch.zeros(3, dtype=torch.long)}, []),
+        },
+        [],
+    )
+    rb = SharedReplayBuffer(100, example, storage=storage_type(100), alpha=0.7)
+    # the data is written by other processes
+    collectors = [
+        mp.Process(target=_shared_rb_collect, args=(rb, worker_id))
+        for worker_id in (1, 2)
+    ]
+    for proc in collectors:
+        proc.start()
+    for proc in collectors:
+        proc.join()
+        assert proc.exitcode == 0
+    assert len(rb) == 40
+    assert rb.cursor == 40
+    stored = rb[torch.arange(40)]
+    assert (stored.get("a") > 0).all()
+    assert (stored.get("a").view(-1, 1) == stored.get("b").get("c")).all()
+    assert set(stored.get("a").view(-1).tolist()) == {1, 2}
+
+    queue = mp.Queue()
+    learner = mp.Process(target=_shared_rb_learn, args=(rb, queue))
+    learner.start()
+    assert queue.get(timeout=30) == 40
+    learner.join()
+    # the priorities updated by the learner are shared
+    updated = ~torch.isclose(rb._priority[:40], torch.ones((), dtype=torch.double))
+    assert updated.any()
+    expected = (stored.get("a").view(-1).double() + 1 + rb._eps) ** 0.7
+    torch.testing.assert_close(rb._priority[:40][updated], expected[updated])
+    sample = rb.sample(16)
+    assert sample.batch_size == torch.Size([16])
+    assert "index" in sample.keys() and "_weight" in sample.keys()
+
+
+def _shared_rb_overwrite(rb, n_writes):
+    for i in range(1, n_writes + 1):
+        rb.extend(
+            TensorDict(
+                {
+                    "a": torch.full((4,), i),
+                    "b": TensorDict({"c": torch.full((4, 3), i)}, [4]),
+                },
+                [4],
+            )
+        )
+
+
+@pytest.mark.parametrize("alpha", [None, 0.7])
+def test_shared_rb_concurrent_sampling(alpha):
+    example = TensorDict(
+        {
+            "a": torch.zeros((), dtype=torch.long),
+            "b": TensorDict({"c": torch.zeros(3, dtype=torch.long)}, []),
+        },
+        [],
+    )
+    rb = SharedReplayBuffer(16, example, alpha=alpha)
+    _shared_rb_overwrite(rb, 4)
+
+    # sampling never waits for the lock of the writers
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with rb._replay_lock:
+            locked.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_lock, daemon=True)
+    holder.start()
+    locked.wait()
+    samples = []
+    sampler = threading.Thread(target=lambda: samples.append(rb.sample(8)))
+    sampler.start()
+    sampler.join(timeout=10)
+    release.set()
+    holder.join()
+    assert len(samples) == 1
+
+    # the samples are consistent while a process overwrites the buffer
+    writer = mp.Process(target=_shared_rb_overwrite, args=(rb, 500))
+    writer.start()
+    while writer.is_alive():
+        sample = rb.sample(8)
+        assert (sample.get("a").view(-1, 1) == sample.get("b").get("c")).all()
+    writer.join()
+    assert writer.exitcode == 0
+    assert (rb.sample(8).get("a") > 496).all()
+
+
+def test_shared_rb_uniform():
+    rb = SharedReplayBuffer(
+        10, TensorDict({"a": torch.zeros((), dtype=torch.long)}, [])
+    )
+    rb.extend(TensorDict({"a": torch.arange(8)}, [8]))
+    rb.extend(TensorDict({"a": torch.arange(8, 12)}, [4]))
+    assert len(rb) == 10
+    assert rb.cursor == 2
+    assert (rb[torch.arange(2)].get("a").view(-1) == torch.tensor([10, 11])).all()
+    sample = rb.sample(5)
+    assert "index" not in sample.keys()
+    with pytest.raises(RuntimeError, match="uniform SharedReplayBuffer"):
+        rb.update_priority(sample)
+    with pytest.raises(TypeError, match="requires a LazyTensorStorage"):
+        SharedReplayBuffer(10, TensorDict({}, []), storage=ListStorage())
+
+
 @pytest.mark.parametrize("stack", [False, True])
 def test_rb_trajectories(stack):
     traj_td = TensorDict(
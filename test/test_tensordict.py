@@ -1817,6 +1817,37 @@ def test_mp(td_type):
     _driver_func(tensordict, tensordict.unbind(0))
 
 
+@pytest.mark.parametrize("layout", ["files", "packed", "interleaved"])
+def test_memmap_layout(layout):
+    td = TensorDict(
+        {
+            "a": torch.randn(4, 3),
+            "b": TensorDict({"c": torch.arange(4)}, [4]),
+            "d": torch.zeros(4, 2, dtype=torch.bool).bernoulli_(),
+        },
+        [4],
+    )
+    td_clone = td.clone()
+    td.memmap_(layout=layout)
+    assert td.is_memmap() and td.get("b").is_memmap()
+    filenames = {td._tensordict[key].filename for key in ("a", "d")}
+    filenames.add(td.get("b")._tensordict["c"].filename)
+    assert len(filenames) == (3 if layout == "files" else 1)
+    assert (td == td_clone).all()
+    index = torch.tensor([2, 0])
+    assert (td[index] == td_clone[index]).all()
+    td[1] = td_clone[3]
+    assert (td[1] == td_clone[3]).all()
+
+
+def test_memmap_layout_errors():
+    td = TensorDict({"a": torch.randn(3)}, [])
+    with pytest.raises(ValueError, match="at least one batch dimension"):
+        td.memmap_(layout="interleaved")
+    with pytest.raises(ValueError, match="layout must be one of"):
+        td.memmap_(layout="rows")
+
+
 def test_saved_delete():
     td = TensorDict(source={"a": torch.randn(3)}, batch_size=[])
     td = td.to(SavedTensorDict)
@@ -1826,6 +1857,155 @@ def test_saved_delete():
     assert not os.path.isfile(file)
 
 
+@pytest.mark.parametrize("stack_dim", [0, 1])
+def test_stack_get_strided_view(stack_dim):
+    parent = TensorDict({"a": torch.randn(4, 3, 2)}, [4, 3])
+    td = torch.stack(parent.unbind(stack_dim), stack_dim)
+    a = td.get("a")
+    assert (a == parent.get("a")).all()
+    # the stack is a view on the parent tensor
+    assert a.data_ptr() == parent.get("a").data_ptr()
+    parent.get("a").zero_()
+    assert (td.get("a") == 0).all()
+    # the views are distinct tensor objects
+    assert td.get("a") is not td.get("a")
+
+
+def test_stack_get_copies():
+    tds = [TensorDict({"a": torch.randn(3, 2)}, [3]) for _ in range(4)]
+    td = torch.stack(tds, 0)
+    # the tensors are not views on a common tensor: every caller gets its own
+    # stacked tensor
+    a = td.get("a")
+    b = td.get("a")
+    assert a.data_ptr() != b.data_ptr()
+    a.add_(1)
+    assert (b == td.get("a")).all()
+    assert (a == td.get("a") + 1).all()
+    # and the stacked tensors are read anew
+    tds[1].get("a").fill_(1.0)
+    assert (td.get("a")[1] == 1).all()
+    tds[2].set("a", torch.full((3, 2), 2.0), inplace=False)
+    assert (td.get("a")[2] == 2).all()
+
+
+def test_from_trusted():
+    a = torch.randn(3, 4)
+    nested = TensorDict({"b": torch.randn(3, 2)}, [3])
+    td = TensorDict.from_trusted({"a": a, "nested": nested}, torch.Size([3]))
+    assert td.get("a") is a
+    assert td.get("nested") is nested
+    assert td.batch_size == torch.Size([3])
+    assert td.device == torch.device("cpu")
+    assert (td.clone() == td).all()
+    assert td.select("a").get("a") is a
+
+
+def test_schema_lock():
+    td = TensorDict({"a": torch.zeros(3, 4), "b": torch.zeros(3, 1)}, [3])
+    assert td.lock_schema_() is td
+    assert td.is_schema_locked
+    a = torch.ones(3, 4)
+    td.set("a", a)
+    assert td.get("a") is a
+    b = td.get("b")
+    td.set_("b", torch.ones(3, 1))
+    assert td.get("b") is b
+    assert (b == 1).all()
+    td.set("b", torch.full((3, 1), 2.0), inplace=True)
+    assert td.get("b") is b
+    assert (b == 2).all()
+    with pytest.raises(KeyError, match="locked schema"):
+        td.set("c", torch.zeros(3, 1))
+    with pytest.raises(RuntimeError, match="locked schema"):
+        td.set("a", torch.zeros(3, 5))
+    with pytest.raises(RuntimeError, match="locked schema"):
+        td.set("a", torch.zeros(3, 4, dtype=torch.double))
+    with pytest.raises(RuntimeError, match="locked schema"):
+        td.set_("b", torch.zeros(3))
+    with pytest.raises(RuntimeError, match="schema is locked"):
+        td.del_("a")
+    with pytest.raises(KeyError, match="locked schema"):
+        td.rename_key("a", "c")
+    td.unlock_schema_()
+    assert not td.is_schema_locked
+    td.set("c", torch.zeros(3, 1))
+    td.del_("a")
+    assert set(td.keys()) == {"b", "c"}
+
+
+def test_flat_buffer():
+    td = TensorDict(
+        {
+            "a": torch.randn(4, 3),
+            "b": torch.randn(4, 2, 2),
+            "c": torch.randint(10, (4, 1)),
+            "nested": TensorDict({"d": torch.randn(4, 5)}, [4]),
+        },
+        [4],
+    )
+    ref = td.clone()
+    td.flat_buffer_()
+    assert td.is_flat_buffer()
+    assert (td == ref).all()
+    a, b, c = td.get("a"), td.get("b"), td.get("c")
+    # tensors of the same dtype share one storage
+    assert a.untyped_storage().data_ptr() == b.untyped_storage().data_ptr()
+    assert a.untyped_storage().data_ptr() != c.untyped_storage().data_ptr()
+    assert b.is_contiguous()
+
+    mask = torch.tensor([True, False, True, False])
+    td.masked_fill_(mask, 0)
+    ref.masked_fill_(mask, 0)
+    assert (td == ref).all()
+
+    td_clone = td.clone()
+    assert td_clone.is_flat_buffer()
+    assert (td_clone == td).all()
+    td_clone.zero_()
+    assert (td_clone == 0).all()
+    assert (td == ref).all()
+    td_clone.update_(td)
+    assert (td_clone == ref).all()
+    assert td.to("cpu") is td
+
+    # in-place operations on the leaves are reflected in the buffers
+    a.detach_()
+    a.fill_(1.0)
+    assert (td.clone().get("a") == 1).all()
+    # replacing a tensor falls back on the key by key operations
+    td.set("a", torch.ones(4, 3))
+    assert not td.is_flat_buffer()
+    td.zero_()
+    assert (td == 0).all()
+
+
+@pytest.mark.parametrize("uniform", [True, False])
+def test_flat_buffer_masked_fill(uniform):
+    td = TensorDict(
+        {
+            "a": torch.randn(4, 3, 2),
+            "b": torch.randn(4, 3, 2 if uniform else 5),
+            "c": torch.randint(10, (4, 3)),
+        },
+        [4, 3],
+    )
+    ref = td.clone()
+    td.flat_buffer_()
+    storage = td._flat_storage
+    for mask in (
+        torch.rand(4) > 0.5,
+        torch.rand(4, 3) > 0.5,
+        torch.ones(4, 3, dtype=torch.bool),
+    ):
+        td.masked_fill_(mask, 0)
+        ref.masked_fill_(mask, 0)
+        assert (td == ref).all()
+    assert td._flat_storage is storage
+    # no index is kept per mask shape
+    assert set(vars(storage)) == {"buffers", "layout", "leaves"}
+
+
 def test_stack_keys():
     td1 = TensorDict(source={"a": torch.randn(3)}, batch_size=[])
     td2 = TensorDict(
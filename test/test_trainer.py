@@ -37,6 +37,7 @@ from torchrl.trainers.trainers import (
     BatchSubSampler,
     UpdateWeights,
     CountFramesLog,
+    LogCollectorStats,
 )
 from torchrl.trainers.trainers import _has_tqdm
 
@@ -308,6 +309,16 @@ def test_countframes():
     assert count_frames.frame_count == td.get("mask").sum() * frame_skip
 
 
+def test_log_collector_stats():
+    trainer = mocking_trainer()
+    trainer.collector.profiling_stats = lambda: {"fps": 10.0, "step/p99": 0.1}
+    log_stats = LogCollectorStats(trainer.collector, keys=["fps", "missing"])
+    trainer.register_op("post_steps_log", log_stats)
+    assert log_stats(None) == {"collector/fps": 10.0}
+    log_stats = LogCollectorStats(trainer.collector, prefix="")
+    assert log_stats(None) == {"fps": 10.0, "step/p99": 0.1}
+
+
 if __name__ == "__main__":
     args, unknown = argparse.ArgumentParser().parse_known_args()
     pytest.main([__file__, "--capture", "no", "--exitfirst"] + unknown)
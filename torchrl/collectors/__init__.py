@@ -4,3 +4,5 @@
 # LICENSE file in the root directory of this source tree.
 
 from .collectors import *
+from .profiling import *
+from .weights import *
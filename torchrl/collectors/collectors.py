@@ -11,17 +11,20 @@ from collections import OrderedDict
 from copy import deepcopy
 from multiprocessing import connection, queues
 from textwrap import indent
-from typing import Callable, Iterator, Optional, Sequence, Tuple, Union
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
 from torch import multiprocessing as mp
 from torch.utils.data import IterableDataset
 
-from torchrl.envs.utils import set_exploration_mode, step_tensordict
+from torchrl.envs.utils import set_exploration_mode
 from .. import _check_for_faulty_process, prod
 from ..modules.tensordict_module import ProbabilisticTensorDictModule
+from .inference import _PolicyClient, _main_inference_server
+from .profiling import CollectorProfiler, _null_phase
 from .utils import split_trajectories
+from .weights import SharedPolicyWeights
 
 __all__ = [
     "SyncDataCollector",
@@ -77,6 +80,28 @@ def recursive_map_to_cpu(dictionary: OrderedDict) -> OrderedDict:
     )
 
 
+def _empty_steps(
+    value: Union[torch.Tensor, TensorDictBase],
+    batch_size: torch.Size,
+    time_dim: int,
+    device: DEVICE_TYPING,
+) -> Union[torch.Tensor, TensorDictBase]:
+    # allocates the storage of the steps of a value: the leading dims of the
+    # value are replaced by batch_size, nested tensordicts are allocated
+    # recursively
+    shape = torch.Size([*batch_size, *value.shape[time_dim:]])
+    if isinstance(value, TensorDictBase):
+        return TensorDict(
+            {
+                key: _empty_steps(item, batch_size, time_dim, device)
+                for key, item in value.items()
+            },
+            shape,
+            device=device,
+        )
+    return torch.empty(shape, dtype=value.dtype, device=device)
+
+
 class _DataCollector(IterableDataset, metaclass=abc.ABCMeta):
     def _get_policy_and_device(
         self,
@@ -165,6 +190,15 @@ class _DataCollector(IterableDataset, metaclass=abc.ABCMeta):
     def load_state_dict(self, state_dict: OrderedDict) -> None:
         raise NotImplementedError
 
+    def profiling_stats(self) -> Dict[str, float]:
+        """Returns the profiling counters of the collector as a flat
+        dictionary of floats (see :obj:`CollectorProfiler.stats`), or an
+        empty dictionary if the collector was built with :obj:`profile=False`.
+        """
+        if self.profiler is None:
+            return {}
+        return self.profiler.stats()
+
     def __repr__(self) -> str:
         string = f"{self.__class__.__name__}()"
         return string
@@ -225,6 +259,14 @@ class SyncDataCollector(_DataCollector):
             updated. This feature should be used cautiously: if the same tensordict is added to a replay buffer for instance,
             the whole content of the buffer will be identical.
             Default is False.
+        shared_weights (SharedPolicyWeights, optional): if provided, the collector keeps a private copy of the policy
+            whose weights are updated with the latest published version before each step, and the version used for
+            each step is written in the "policy_version" entry of the output.
+            Default is None.
+        profile (bool, optional): if True, the collector times its phases (policy, casts to and from the policy
+            device, env step, resets, writing of the output, split_trajectories and postproc) along with the
+            whole steps and the number of frames collected. The counters are read with profiling_stats().
+            Default is False.
     """
 
     def __init__(
@@ -254,8 +296,12 @@ class SyncDataCollector(_DataCollector):
         exploration_mode: str = "random",
         init_with_lag: bool = False,
         return_same_td: bool = False,
+        shared_weights: Optional[SharedPolicyWeights] = None,
+        profile: bool = False,
     ):
         self.closed = True
+        self.profiler = CollectorProfiler() if profile else None
+        self._phase = self.profiler.phase if profile else _null_phase
         if seed is not None:
             torch.manual_seed(seed)
             np.random.seed(seed)
@@ -304,6 +350,13 @@ class SyncDataCollector(_DataCollector):
         self._tensordict.set(
             "step_count", torch.zeros(*self.env.batch_size, 1, dtype=torch.int)
         )
+        self.shared_weights = shared_weights
+        self._policy_version = -1
+        if shared_weights is not None:
+            # the weights of the policy are only modified between steps
+            self.policy = deepcopy(self.policy)
+            self.get_weights_fn = None
+            self._sync_policy_weights()
         self._tensordict_out = TensorDict(
             {},
             batch_size=[*self.env.batch_size, self.frames_per_batch],
@@ -356,13 +409,17 @@ class SyncDataCollector(_DataCollector):
             self._iter = i
             tensordict_out = self.rollout()
             self._frames += tensordict_out.numel()
+            if self.profiler is not None:
+                self.profiler.add_frames(tensordict_out.numel())
             if self._frames >= total_frames:
                 self.env.close()
 
             if self.split_trajs:
-                tensordict_out = split_trajectories(tensordict_out)
+                with self._phase("split_trajs"):
+                    tensordict_out = split_trajectories(tensordict_out)
             if self.postproc is not None:
-                tensordict_out = self.postproc(tensordict_out)
+                with self._phase("postproc"):
+                    tensordict_out = self.postproc(tensordict_out)
             if self._exclude_private_keys:
                 excluded_keys = [
                     key for key in tensordict_out.keys() if key.startswith("_")
@@ -377,6 +434,20 @@ class SyncDataCollector(_DataCollector):
             if self._frames >= self.total_frames:
                 break
 
+    def _sync_policy_weights(self) -> None:
+        self._policy_version = self.shared_weights.load_into(
+            self.policy, self._policy_version
+        )
+        if "policy_version" in self._tensordict.keys():
+            self._tensordict.fill_("policy_version", self._policy_version)
+        else:
+            self._tensordict.set(
+                "policy_version",
+                torch.full(
+                    (*self.env.batch_size, 1), self._policy_version, dtype=torch.long
+                ),
+            )
+
     def _cast_to_policy(self, td: TensorDictBase) -> TensorDictBase:
         policy_device = self.device
         if hasattr(self.policy, "in_keys"):
@@ -425,7 +496,8 @@ class SyncDataCollector(_DataCollector):
             else:
                 self._tensordict.zero_()
 
-            self._tensordict.update(self.env.reset(), inplace=True)
+            with self._phase("reset"):
+                self._tensordict.update(self.env.reset(), inplace=True)
             if self._tensordict.get("done").any():
                 raise RuntimeError(
                     f"Got {sum(self._tensordict.get('done'))} done envs after reset."
@@ -447,44 +519,81 @@ class SyncDataCollector(_DataCollector):
             TensorDictBase containing the computed rollout.
 
         """
+        phase = self._phase
         if self.reset_at_each_iter:
-            self._tensordict.update(self.env.reset(), inplace=True)
+            with phase("reset"):
+                self._tensordict.update(self.env.reset(), inplace=True)
             self._tensordict.fill_("step_count", 0)
 
         n = self.env.batch_size[0] if len(self.env.batch_size) else 1
         self._tensordict.set("traj_ids", torch.arange(n).unsqueeze(-1))
 
-        tensordict_out = []
         with set_exploration_mode(self.exploration_mode):
             for t in range(self.frames_per_batch):
-                if self._frames < self.init_random_frames:
-                    self.env.rand_step(self._tensordict)
-                else:
-                    td_cast = self._cast_to_policy(self._tensordict)
-                    td_cast = self.policy(td_cast)
-                    self._cast_to_env(td_cast, self._tensordict)
-                    self.env.step(self._tensordict)
-
-                step_count = self._tensordict.get("step_count")
-                step_count += 1
-                tensordict_out.append(self._tensordict.clone())
-
-                self._reset_if_necessary()
-                self._tensordict.update(
-                    step_tensordict(
-                        self._tensordict.exclude("reward", "done"), keep_other=True
+                with phase("step"):
+                    if self.shared_weights is not None:
+                        self._sync_policy_weights()
+                    if self._frames < self.init_random_frames:
+                        with phase("env_step"):
+                            self.env.rand_step(self._tensordict)
+                    else:
+                        with phase("cast_to_policy"):
+                            td_cast = self._cast_to_policy(self._tensordict)
+                        with phase("policy"):
+                            td_cast = self.policy(td_cast)
+                        with phase("cast_to_env"):
+                            self._cast_to_env(td_cast, self._tensordict)
+                        with phase("env_step"):
+                            self.env.step(self._tensordict)
+
+                    step_count = self._tensordict.get("step_count")
+                    step_count += 1
+                    with phase("write"):
+                        self._write_step(t)
+
+                    self._reset_if_necessary()
+                    self._step_in_place()
+        return self._tensordict_out
+
+    def _write_step(self, t: int) -> None:
+        # copies the current step in the pre-allocated output, at index t of
+        # the time dimension (dim 0 for single env, dim 1 for batch)
+        time_dim = len(self.env.batch_size)
+        index = (slice(None),) * time_dim + (t,)
+        tensordict_out = self._tensordict_out
+        allocate = not (self.return_in_place and len(tensordict_out.keys()))
+        for key, value in self._tensordict.items():
+            if key not in tensordict_out.keys():
+                if not allocate:
+                    continue
+                if t > 0:
+                    raise RuntimeError(
+                        f"The key {key} appeared in the rollout at step {t}. "
+                        f"All the steps of a rollout must have the same keys."
+                    )
+                tensordict_out.set(
+                    key,
+                    _empty_steps(
+                        value,
+                        tensordict_out.batch_size,
+                        time_dim,
+                        tensordict_out.device,
                     ),
-                    inplace=True,
                 )
-            if self.return_in_place and len(self._tensordict_out.keys()) > 0:
-                tensordict_out = torch.stack(tensordict_out, len(self.env.batch_size))
-                tensordict_out = tensordict_out.select(*self._tensordict_out.keys())
-                return self._tensordict_out.update_(tensordict_out)
-        return torch.stack(
-            tensordict_out,
-            len(self.env.batch_size),
-            out=self._tensordict_out,
-        )  # dim 0 for single env, dim 1 for batch
+            tensordict_out.get(key)[index].copy_(value)
+
+    def _step_in_place(self) -> None:
+        # in-place equivalent of step_tensordict: the "next_" values become
+        # the current values of the next step
+        for key in list(self._tensordict.keys()):
+            if not key.startswith("next_"):
+                continue
+            new_key = key[5:]
+            value = self._tensordict.get(key)
+            if new_key in self._tensordict.keys():
+                self._tensordict.get(new_key).copy_(value)
+            else:
+                self._tensordict.set(new_key, value.clone())
 
     def reset(self, index=None, **kwargs) -> None:
         """Resets the environments to a new initial state."""
@@ -622,6 +731,21 @@ class _MultiDataCollector(_DataCollector):
        exploration_mode (str, optional): interaction mode to be used when collecting data. Must be one of "random",
             "mode" or "mean".
             default = "random"
+        shared_weights (bool, optional): if True, the weights of the policy are published in a SharedPolicyWeights
+            object by update_policy_weights_(), and the workers pick up the latest version between two steps
+            without waiting for a message. The version of the weights used for each step is written in the
+            "policy_version" entry of the output. The policy must be an nn.Module.
+            default = False
+        inference_server (bool, optional): if True, the policy is run by a dedicated process that gathers the
+            inputs of all the workers through shared memory and runs one batched forward pass for all the workers
+            that are waiting for an action. The workers only step their environment. All the environments must
+            have the same batch size.
+            default = False
+        profile (bool, optional): if True, each worker profiles its collection (see SyncDataCollector) and sends
+            its counters along with its batches, while the main process times its waits on the queue of batches,
+            samples the occupancy of that queue and times split_trajectories and postproc. The counters are read
+            with profiling_stats(), the ones of the workers being prefixed by "worker{idx}/".
+            default = False
 
     """
 
@@ -649,8 +773,14 @@ class _MultiDataCollector(_DataCollector):
         update_at_each_batch: bool = False,
         init_with_lag: bool = False,
         exploration_mode: str = "random",
+        shared_weights: bool = False,
+        inference_server: bool = False,
+        profile: bool = False,
     ):
         self.closed = True
+        self.profiler = CollectorProfiler() if profile else None
+        self._phase = self.profiler.phase if profile else _null_phase
+        self._worker_stats = {}
         self.create_env_fn = create_env_fn
         self.num_workers = len(create_env_fn)
         self.create_env_kwargs = (
@@ -734,6 +864,11 @@ class _MultiDataCollector(_DataCollector):
         self.init_with_lag = init_with_lag
         self.exploration_mode = exploration_mode
         self.frames_per_worker = np.inf
+        self._shared_weights = None
+        if shared_weights:
+            self._trained_policy = policy
+            self._shared_weights = SharedPolicyWeights(policy)
+        self.inference_server = inference_server
         self._run_processes()
         self._exclude_private_keys = True
 
@@ -742,6 +877,9 @@ class _MultiDataCollector(_DataCollector):
         raise NotImplementedError
 
     def update_policy_weights_(self) -> None:
+        if self._shared_weights is not None:
+            self._shared_weights.publish(self._trained_policy)
+            return
         for _device in self._policy_dict:
             if self._get_weights_fn_dict[_device] is not None:
                 self._policy_dict[_device].load_state_dict(
@@ -752,10 +890,59 @@ class _MultiDataCollector(_DataCollector):
     def _queue_len(self) -> int:
         raise NotImplementedError
 
+    def profiling_stats(self) -> Dict[str, float]:
+        if self.profiler is None:
+            return {}
+        stats = self.profiler.stats()
+        for idx, worker_stats in sorted(self._worker_stats.items()):
+            stats.update(
+                (f"worker{idx}/{key}", value) for key, value in worker_stats.items()
+            )
+        return stats
+
+    def _get_batch(self, timeout=None) -> Tuple:
+        # reads the next batch of the queue, sampling the number of batches
+        # waiting in it and storing the counters sent by the worker
+        if self.profiler is not None:
+            try:
+                self.profiler.sample("queue_size", self.queue_out.qsize())
+            except NotImplementedError:
+                # qsize relies on sem_getvalue(), which is missing on macOS
+                pass
+        with self._phase("queue_wait"):
+            new_data, j, worker_stats = self.queue_out.get(timeout=timeout)
+        if worker_stats is not None:
+            idx = new_data if j else new_data[1]
+            self._worker_stats[idx] = worker_stats
+        return new_data, j
+
+    def _run_inference_server(self) -> Sequence[_PolicyClient]:
+        policy = self._policy_dict[self.devices[0]]
+        server_conns, clients = [], []
+        for _ in range(self.num_workers):
+            server_conn, client_conn = mp.Pipe()
+            server_conns.append(server_conn)
+            clients.append(_PolicyClient(client_conn, getattr(policy, "in_keys", None)))
+        self._server_proc = mp.Process(
+            target=_main_inference_server,
+            kwargs={
+                "policy": policy,
+                "device": self.devices[0],
+                "conns": server_conns,
+                "exploration_mode": self.exploration_mode,
+                "shared_weights": self._shared_weights,
+            },
+        )
+        self._server_proc.start()
+        for server_conn in server_conns:
+            server_conn.close()
+        return clients
+
     def _run_processes(self) -> None:
         queue_out = mp.Queue(self._queue_len)  # sends data from proc to main
         self.procs = []
         self.pipes = []
+        clients = self._run_inference_server() if self.inference_server else None
         for i, (env_fun, env_fun_kwargs) in enumerate(
             zip(self.create_env_fn, self.create_env_kwargs)
         ):
@@ -773,7 +960,7 @@ class _MultiDataCollector(_DataCollector):
                 "queue_out": queue_out,
                 "create_env_fn": env_fun,
                 "create_env_kwargs": env_fun_kwargs,
-                "policy": self._policy_dict[_device],
+                "policy": clients[i] if clients else self._policy_dict[_device],
                 "frames_per_worker": self.frames_per_worker,
                 "max_frames_per_traj": self.max_frames_per_traj,
                 "frames_per_batch": self.frames_per_batch_worker,
@@ -785,11 +972,15 @@ class _MultiDataCollector(_DataCollector):
                 "init_with_lag": self.init_with_lag,
                 "exploration_mode": self.exploration_mode,
                 "idx": i,
+                "shared_weights": None if clients else self._shared_weights,
+                "profile": self.profiler is not None,
             }
             proc = mp.Process(target=_main_async_collector, kwargs=kwargs)
             # proc.daemon can't be set as daemonic processes may be launched by the process itself
             proc.start()
             pipe_child.close()
+            if clients:
+                clients[i].conn.close()
             self.procs.append(proc)
             self.pipes.append(pipe_parent)
         self.queue_out = queue_out
@@ -817,6 +1008,9 @@ class _MultiDataCollector(_DataCollector):
 
         for proc in self.procs:
             proc.join()
+        if self.inference_server:
+            # the server stops once all the workers have closed their pipe
+            self._server_proc.join()
 
         self.queue_out.close()
         for pipe in self.pipes:
@@ -949,7 +1143,7 @@ class MultiSyncDataCollector(_MultiDataCollector):
             i += 1
             max_traj_idx = None
             for k in range(self.num_workers):
-                new_data, j = self.queue_out.get()
+                new_data, j = self._get_batch()
                 if j == 0:
                     data, idx = new_data
                     out_tensordicts_shared[idx] = data
@@ -985,14 +1179,18 @@ class MultiSyncDataCollector(_MultiDataCollector):
                     [item.cpu() for item in out_tensordicts_shared.values()], 0
                 )
 
+            if self.profiler is not None:
+                self.profiler.add_frames(out.numel())
             if self.split_trajs:
-                out = split_trajectories(out)
+                with self._phase("split_trajs"):
+                    out = split_trajectories(out)
                 frames += out.get("mask").sum()
             else:
                 frames += prod(out.shape)
             if self.postprocs:
                 self.postprocs = self.postprocs.to(out.device)
-                out = self.postprocs(out)
+                with self._phase("postproc"):
+                    out = self.postprocs(out)
             if self._exclude_private_keys:
                 excluded_keys = [key for key in out.keys() if key.startswith("_")]
                 out = out.exclude(*excluded_keys)
@@ -1031,7 +1229,7 @@ class MultiaSyncDataCollector(_MultiDataCollector):
         return self.frames_per_batch
 
     def _get_from_queue(self, timeout=None) -> Tuple[int, int, TensorDictBase]:
-        new_data, j = self.queue_out.get(timeout=timeout)
+        new_data, j = self._get_batch(timeout=timeout)
         if j == 0:
             data, idx = new_data
             self.out_tensordicts[idx] = data
@@ -1066,12 +1264,16 @@ class MultiaSyncDataCollector(_MultiDataCollector):
             idx, j, out = self._get_from_queue()
 
             worker_frames = out.numel()
+            if self.profiler is not None:
+                self.profiler.add_frames(worker_frames)
             if self.split_trajs:
-                out = split_trajectories(out)
+                with self._phase("split_trajs"):
+                    out = split_trajectories(out)
             self._frames += worker_frames
             workers_frames[idx] = workers_frames[idx] + worker_frames
             if self.postprocs:
-                out = self.postprocs[out.device](out)
+                with self._phase("postproc"):
+                    out = self.postprocs[out.device](out)
 
             # the function blocks here until the next item is asked, hence we send the message to the
             # worker to keep on working in the meantime before the yield statement
@@ -1171,6 +1373,11 @@ class aSyncDataCollector(MultiaSyncDataCollector):
         init_with_lag (bool, optional): if True, the first trajectory will be truncated earlier at a random step.
             This is helpful to desynchronize the environments, such that steps do no match in all collected rollouts.
             default = True
+        shared_weights (bool, optional): if True, the policy weights are published in shared memory by
+            update_policy_weights_() and picked up by the worker between two steps (see MultiaSyncDataCollector).
+            default = False
+        profile (bool, optional): if True, the collection is profiled (see MultiaSyncDataCollector).
+            default = False
 
     """
 
@@ -1195,6 +1402,8 @@ class aSyncDataCollector(MultiaSyncDataCollector):
         passing_device: Union[int, str, torch.device] = "cpu",
         seed: Optional[int] = None,
         pin_memory: bool = False,
+        shared_weights: bool = False,
+        profile: bool = False,
     ):
         super().__init__(
             create_env_fn=[create_env_fn],
@@ -1211,6 +1420,8 @@ class aSyncDataCollector(MultiaSyncDataCollector):
             passing_devices=[passing_device],
             seed=seed,
             pin_memory=pin_memory,
+            shared_weights=shared_weights,
+            profile=profile,
         )
 
 
@@ -1233,6 +1444,8 @@ def _main_async_collector(
     init_with_lag: bool = False,
     exploration_mode: str = "random",
     verbose: bool = False,
+    shared_weights: Optional[SharedPolicyWeights] = None,
+    profile: bool = False,
 ) -> None:
     pipe_parent.close()
     #  init variables that will be cleared when closing
@@ -1256,6 +1469,8 @@ def _main_async_collector(
         init_with_lag=init_with_lag,
         exploration_mode=exploration_mode,
         return_same_td=True,
+        shared_weights=shared_weights,
+        profile=profile,
     )
     if verbose:
         print("Sync data collector created")
@@ -1328,7 +1543,8 @@ def _main_async_collector(
                     )
                 data = idx  # flag the worker that has sent its data
             try:
-                queue_out.put((data, j), timeout=_TIMEOUT)
+                stats = dc.profiling_stats() if profile else None
+                queue_out.put((data, j, stats), timeout=_TIMEOUT)
                 if verbose:
                     print(f"worker {idx} successfully sent data")
                 j += 1
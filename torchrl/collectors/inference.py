@@ -0,0 +1,233 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from copy import deepcopy
+from multiprocessing.connection import Connection, wait
+from typing import Callable, Dict, List, Optional, Sequence
+
+import torch
+
+from torchrl.data.tensordict.tensordict import TensorDictBase
+from torchrl.data.utils import DEVICE_TYPING
+from torchrl.envs.utils import set_exploration_mode
+
+from .weights import SharedPolicyWeights
+
+__all__ = []
+
+# time spent waiting for the requests of other workers once a first request
+# has been received, such that they can be batched together
+_BATCH_TIMEOUT = 1e-3
+
+
+class _PolicyClient:
+    """Stands for the policy in an env worker of a collector running in
+    inference-server mode.
+
+    On its first call, the client copies the input keys of its tensordict in
+    a shared-memory tensordict and sends it to the server, which replies with
+    the shared-memory tensordict where the outputs of the policy will be
+    written and with the keys of those outputs that make the state of the
+    policy (e.g. the previous noise of an Ornstein-Uhlenbeck exploration
+    wrapper). Every subsequent call copies the inputs and the current state
+    in the shared slots, sends an empty request through the pipe and waits
+    for the server to signal that the outputs have been written.
+
+    Args:
+        conn (Connection): end of the pipe connected to the server.
+        in_keys (sequence of str, optional): the input keys of the policy.
+            If none is provided, the whole tensordict is sent to the server.
+
+    """
+
+    def __init__(self, conn: Connection, in_keys: Optional[Sequence[str]] = None):
+        self.conn = conn
+        self._in_keys = None
+        if in_keys is not None:
+            self.in_keys = self._in_keys = list(in_keys)
+        self._inputs = None
+        self._outputs = None
+        self._state_keys = None
+
+    def __call__(self, tensordict: TensorDictBase) -> TensorDictBase:
+        if self._inputs is None:
+            inputs = tensordict
+            if self._in_keys is not None:
+                inputs = tensordict.select(*self._in_keys)
+            self._inputs = inputs.to("cpu").clone().share_memory_()
+            self.conn.send(self._inputs)
+            reply = self.conn.recv()
+            if isinstance(reply, Exception):
+                raise RuntimeError(
+                    "The inference server failed to run the policy."
+                ) from reply
+            self._outputs, self._state_keys = reply
+        else:
+            for key, value in self._inputs.items():
+                value.copy_(tensordict.get(key))
+            for key in self._state_keys:
+                if key in tensordict.keys():
+                    self._outputs.get(key).copy_(tensordict.get(key))
+                else:
+                    # the state was dropped, e.g. by a reset
+                    self._outputs.get(key).zero_()
+            self.conn.send(None)
+            self.conn.recv()
+        for key, value in self._outputs.items():
+            if key in tensordict.keys():
+                tensordict.get(key).copy_(value)
+            else:
+                tensordict.set(key, value.to(tensordict.device, copy=True))
+        return tensordict
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}()"
+
+
+class _InferenceServer:
+    """Runs batched forward passes of a policy for a set of :obj:`_PolicyClient`.
+
+    Args:
+        policy (Callable): the policy.
+        device (torch.device): the device of the policy.
+        conns (list of Connection): ends of the pipes connected to the
+            clients.
+        exploration_mode (str): the exploration mode used for the forward
+            passes.
+        shared_weights (SharedPolicyWeights, optional): if provided, the
+            latest weights are loaded in the policy before each forward pass,
+            and their version is written in the "policy_version" entry of the
+            outputs.
+
+    """
+
+    def __init__(
+        self,
+        policy: Callable[[TensorDictBase], TensorDictBase],
+        device: DEVICE_TYPING,
+        conns: List[Connection],
+        exploration_mode: str,
+        shared_weights: Optional[SharedPolicyWeights] = None,
+    ):
+        self.device = torch.device(device)
+        self.conns = list(conns)
+        self.exploration_mode = exploration_mode
+        self.shared_weights = shared_weights
+        self._policy_version = -1
+        if shared_weights is not None:
+            # the weights of the policy are only modified between batches
+            policy = deepcopy(policy)
+        self.policy = policy
+        self._inputs: Dict[Connection, TensorDictBase] = {}
+        self._outputs: Dict[Connection, TensorDictBase] = {}
+        self._state_keys = None
+        self._batch = None
+
+    def _forward(self, tensordict: TensorDictBase) -> TensorDictBase:
+        with set_exploration_mode(self.exploration_mode), torch.no_grad():
+            return self.policy(tensordict)
+
+    def _sync_policy_weights(self) -> None:
+        if self.shared_weights is not None:
+            self._policy_version = self.shared_weights.load_into(
+                self.policy, self._policy_version
+            )
+
+    def _register(self, conn: Connection, inputs: TensorDictBase) -> None:
+        if (
+            self._batch is not None
+            and inputs.batch_size != self._batch.batch_size[1:]
+        ):
+            raise RuntimeError(
+                "The inference server requires all the environments to have "
+                f"the same batch size, got {inputs.batch_size} and "
+                f"{self._batch.batch_size[1:]}."
+            )
+        self._sync_policy_weights()
+        result = self._forward(inputs.to(self.device).clone())
+        outputs = result.exclude(*inputs.keys()).to("cpu")
+        if self._state_keys is None:
+            # the outputs are fed back to the policy at the next step, as
+            # they would be if it was run by the worker: they carry the state
+            # of the policy, if any
+            self._state_keys = list(outputs.keys())
+        if self._batch is None:
+            # one row per client, filled with the requests of each batch
+            row = result.select(*inputs.keys(), *self._state_keys)
+            self._batch = torch.stack([row] * len(self.conns), 0).contiguous()
+        if self.shared_weights is not None:
+            outputs.set(
+                "policy_version",
+                torch.full(
+                    (*inputs.batch_size, 1), self._policy_version, dtype=torch.long
+                ),
+            )
+        outputs = outputs.clone().share_memory_()
+        self._inputs[conn] = inputs
+        self._outputs[conn] = outputs
+        conn.send((outputs, self._state_keys))
+
+    def _step(self, conns: List[Connection]) -> None:
+        self._sync_policy_weights()
+        for i, conn in enumerate(conns):
+            row = self._batch[i]
+            row.update_(self._inputs[conn])
+            outputs = self._outputs[conn]
+            for key in self._state_keys:
+                row.set_(key, outputs.get(key))
+        batch = self._forward(self._batch[: len(conns)])
+        for i, conn in enumerate(conns):
+            outputs = self._outputs[conn]
+            for key, value in outputs.items():
+                if key == "policy_version" and self.shared_weights is not None:
+                    value.fill_(self._policy_version)
+                else:
+                    value.copy_(batch.get(key)[i])
+            conn.send(None)
+
+    def run(self) -> None:
+        """Serves the requests of the clients until all of them are closed."""
+        conns = self.conns
+        while conns:
+            ready = wait(conns)
+            if len(ready) < len(conns):
+                others = [conn for conn in conns if conn not in ready]
+                ready += wait(others, _BATCH_TIMEOUT)
+            requests = []
+            for conn in ready:
+                try:
+                    msg = conn.recv()
+                except EOFError:
+                    conns.remove(conn)
+                    continue
+                if msg is None:
+                    requests.append(conn)
+                else:
+                    try:
+                        self._register(conn, msg)
+                    except Exception as err:
+                        conn.send(err)
+                        raise
+            if requests:
+                self._step(requests)
+
+
+def _main_inference_server(
+    policy: Callable[[TensorDictBase], TensorDictBase],
+    device: DEVICE_TYPING,
+    conns: List[Connection],
+    exploration_mode: str = "random",
+    shared_weights: Optional[SharedPolicyWeights] = None,
+) -> None:
+    server = _InferenceServer(
+        policy,
+        device,
+        conns,
+        exploration_mode=exploration_mode,
+        shared_weights=shared_weights,
+    )
+    server.run()
+    for conn in conns:
+        conn.close()
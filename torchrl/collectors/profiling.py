@@ -0,0 +1,156 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+__all__ = ["CollectorProfiler"]
+
+
+class _PhaseTimer:
+    """Context manager timing the successive executions of a phase."""
+
+    __slots__ = ("count", "total", "durations", "_start")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.durations = deque(maxlen=window)
+        self._start = 0.0
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.record(time.perf_counter() - self._start)
+
+    def record(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.durations.append(duration)
+
+
+class _NullPhase:
+    """No-op stand-in for :obj:`_PhaseTimer` when profiling is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def _null_phase(name: str) -> _NullPhase:
+    return _NULL_PHASE
+
+
+class CollectorProfiler:
+    """Timing counters for the phases of a data collector.
+
+    Each phase (e.g. :obj:`"env_step"` or :obj:`"policy"`) keeps the number
+    and the total duration of its executions, as well as the durations of the
+    last :obj:`window` executions from which the percentiles are computed.
+    Gauges (e.g. the occupancy of a queue) keep their last value and the
+    average of their last :obj:`window` samples.
+
+    Durations are expressed in seconds.
+
+    Args:
+        window (int, optional): number of recent samples kept per phase and
+            per gauge. Default is 1000.
+
+    Examples:
+        >>> profiler = CollectorProfiler()
+        >>> with profiler.phase("env_step"):
+        ...     env.step(tensordict)
+        >>> profiler.add_frames(tensordict.numel())
+        >>> profiler.stats()["env_step/p99"]
+
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.reset()
+
+    def reset(self) -> None:
+        """Clears all the counters."""
+        self._phases: Dict[str, _PhaseTimer] = {}
+        self._gauges: Dict[str, deque] = {}
+        self.frames = 0
+        self._start = time.perf_counter()
+
+    def phase(self, name: str) -> _PhaseTimer:
+        """Returns a context manager timing the phase :obj:`name`.
+
+        Phases with the same name must not be nested.
+        """
+        timer = self._phases.get(name)
+        if timer is None:
+            timer = self._phases[name] = _PhaseTimer(self.window)
+        return timer
+
+    def record(self, name: str, duration: float) -> None:
+        """Records a duration measured outside of :obj:`phase`."""
+        self.phase(name).record(duration)
+
+    def sample(self, name: str, value: float) -> None:
+        """Records a sample of the gauge :obj:`name`."""
+        samples = self._gauges.get(name)
+        if samples is None:
+            samples = self._gauges[name] = deque(maxlen=self.window)
+        samples.append(value)
+
+    def add_frames(self, frames: int) -> None:
+        """Increments the number of frames collected."""
+        self.frames += frames
+
+    def stats(self, prefix: Optional[str] = None) -> Dict[str, float]:
+        """Returns the counters as a flat dictionary of floats.
+
+        For each phase, the dictionary has the entries :obj:`"{phase}/count"`,
+        :obj:`"{phase}/total"`, :obj:`"{phase}/mean"`, :obj:`"{phase}/p50"`
+        and :obj:`"{phase}/p99"`. For each gauge, it has the entries
+        :obj:`"{gauge}/last"` and :obj:`"{gauge}/mean"`. The entries
+        :obj:`"frames"` and :obj:`"fps"` give the number of frames collected
+        and the number of frames per second since the creation (or the last
+        reset) of the profiler.
+
+        Args:
+            prefix (str, optional): if provided, prepended to every key.
+
+        """
+        elapsed = time.perf_counter() - self._start
+        out = {"frames": float(self.frames), "fps": self.frames / elapsed}
+        for name, timer in self._phases.items():
+            if not timer.count:
+                continue
+            p50, p99 = np.percentile(timer.durations, (50, 99))
+            out[f"{name}/count"] = float(timer.count)
+            out[f"{name}/total"] = timer.total
+            out[f"{name}/mean"] = timer.total / timer.count
+            out[f"{name}/p50"] = float(p50)
+            out[f"{name}/p99"] = float(p99)
+        for name, samples in self._gauges.items():
+            if not samples:
+                continue
+            out[f"{name}/last"] = float(samples[-1])
+            out[f"{name}/mean"] = float(np.mean(samples))
+        if prefix is not None:
+            out = {prefix + key: value for key, value in out.items()}
+        return out
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(window={self.window}, "
+            f"phases={list(self._phases)}, frames={self.frames})"
+        )
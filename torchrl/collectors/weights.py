@@ -0,0 +1,153 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union
+
+import torch
+from torch import nn
+
+__all__ = ["SharedPolicyWeights"]
+
+_MAX_READ_ATTEMPTS = 8
+
+
+class SharedPolicyWeights:
+    """A versioned copy of the weights of a policy, placed in shared memory.
+
+    The parameters and buffers of the policy are laid out in one flat
+    shared-memory tensor per dtype (usually a single one), along with a
+    version counter. A learner publishes new weights with
+    :obj:`publish`, which writes each flat buffer with a single
+    :obj:`torch.cat(..., out=...)` call and increments the version. Processes
+    that received the object (e.g. collector workers) pick up the latest
+    version with :obj:`load_into`, which is a no-op if the weights have not
+    changed: no message needs to be exchanged with the learner.
+
+    Writes and reads are coordinated by a sequence counter that is odd while
+    weights are being written: a reader takes a snapshot of the flat buffers
+    and retries if it overlapped with a write, such that weights from
+    different versions are never mixed.
+
+    Args:
+        policy (nn.Module): the policy whose weights are shared. Its
+            parameters and buffers determine the layout of the flat buffers,
+            and their current values are the version 0 of the weights.
+
+    Examples:
+        >>> weights = SharedPolicyWeights(policy)
+        >>> # in the learner
+        >>> weights.publish(policy)
+        >>> # in a worker owning a copy of the policy
+        >>> version = weights.load_into(policy_copy, version)
+
+    """
+
+    def __init__(self, policy: nn.Module):
+        state_dict = _tensor_state_dict(policy)
+        self._layout: List[Tuple[str, torch.dtype, int, int, torch.Size]] = []
+        sizes: Dict[torch.dtype, int] = {}
+        for key, tensor in state_dict.items():
+            start = sizes.get(tensor.dtype, 0)
+            self._layout.append(
+                (key, tensor.dtype, start, start + tensor.numel(), tensor.shape)
+            )
+            sizes[tensor.dtype] = start + tensor.numel()
+        self._flat = {
+            dtype: torch.empty(size, dtype=dtype).share_memory_()
+            for dtype, size in sizes.items()
+        }
+        # sequence counter (odd while writing) and version of the weights
+        self._counter = torch.zeros(2, dtype=torch.long).share_memory_()
+        self._write(state_dict)
+
+    @property
+    def version(self) -> int:
+        """The version of the latest published weights."""
+        return int(self._counter[1])
+
+    def _write(self, state_dict: Dict[str, torch.Tensor]) -> None:
+        for dtype, flat in self._flat.items():
+            torch.cat(
+                [
+                    state_dict[key].detach().reshape(-1).cpu()
+                    for key, _dtype, *_ in self._layout
+                    if _dtype is dtype
+                ],
+                out=flat,
+            )
+
+    def publish(self, policy: Union[nn.Module, Dict[str, torch.Tensor]]) -> int:
+        """Writes new weights and increments the version.
+
+        Args:
+            policy (nn.Module or dict): the module (or state_dict) whose
+                weights are published. It must have the same structure as the
+                policy used to build the object.
+
+        Returns:
+            the new version.
+
+        """
+        if isinstance(policy, nn.Module):
+            policy = _tensor_state_dict(policy)
+        self._counter[0] += 1
+        try:
+            self._write(policy)
+        finally:
+            self._counter[1] += 1
+            self._counter[0] += 1
+        return self.version
+
+    def load_into(self, policy: nn.Module, version: int = -1) -> int:
+        """Copies the latest weights into a policy if they are newer than a
+        given version.
+
+        Args:
+            policy (nn.Module): the module whose parameters and buffers are
+                updated in-place.
+            version (int, optional): the version of the weights currently held
+                by :obj:`policy`. Default is -1, i.e. the weights are always
+                copied.
+
+        Returns:
+            the version of the weights held by :obj:`policy` after the call,
+            which is :obj:`version` if no newer consistent weights could be
+            read.
+
+        """
+        if self.version <= version:
+            return version
+        for _ in range(_MAX_READ_ATTEMPTS):
+            counter = int(self._counter[0])
+            if counter % 2:
+                # the weights are being written
+                continue
+            new_version = int(self._counter[1])
+            snapshot = {dtype: flat.clone() for dtype, flat in self._flat.items()}
+            if int(self._counter[0]) == counter:
+                break
+        else:
+            return version
+        state_dict = _tensor_state_dict(policy)
+        with torch.no_grad():
+            for key, dtype, start, end, shape in self._layout:
+                state_dict[key].copy_(snapshot[dtype][start:end].view(shape))
+        return new_version
+
+    def __repr__(self) -> str:
+        numel = sum(flat.numel() for flat in self._flat.values())
+        return (
+            f"{self.__class__.__name__}(numel={numel}, "
+            f"dtypes={list(self._flat)}, version={self.version})"
+        )
+
+
+def _tensor_state_dict(policy: nn.Module) -> Dict[str, torch.Tensor]:
+    return OrderedDict(
+        (key, value)
+        for key, value in policy.state_dict(keep_vars=True).items()
+        if isinstance(value, torch.Tensor)
+    )
@@ -22,5 +22,8 @@ PYBIND11_MODULE(_torchrl, m) {
   torchrl::DefineMinSegmentTree<float>("Fp32", m);
   torchrl::DefineMinSegmentTree<double>("Fp64", m);
 
+  torchrl::DefineUpdatePriority<float>(m);
+  torchrl::DefineUpdatePriority<double>(m);
+
   m.def("safetanh", &safetanh, "Safe Tanh");
 }
@@ -13,7 +13,12 @@
 #include <cassert>
 #include <cstdint>
 #include <functional>
+#include <algorithm>
+#include <cmath>
 #include <limits>
+#include <memory>
+#include <mutex>
+#include <shared_mutex>
 #include <vector>
 
 #include "torchrl/csrc/numpy_utils.h"
@@ -23,11 +28,30 @@ namespace py = pybind11;
 
 namespace torchrl {
 
+// Minimum number of items processed by a thread of the intra-op thread pool
+// in batched operations. Smaller batches are processed sequentially.
+constexpr int64_t kSegmentTreeGrainSize = 1024;
+
+template <typename T>
+class SumSegmentTree;
+
+template <typename T>
+class MinSegmentTree;
+
+template <typename T>
+T UpdatePriority(SumSegmentTree<T>& sum_tree, MinSegmentTree<T>& min_tree,
+                 const torch::Tensor& index, const torch::Tensor& priority,
+                 const T& alpha, const T& eps);
+
 // SegmentTree is a tree data structure to maintain statistics of intervals.
 // https://en.wikipedia.org/wiki/Segment_tree
 // Here is the implementaion of non-recursive SegmentTree for single point
 // update and interval query. The time complexities of both Update and Query are
 // O(logN).
+// Batched entry points are guarded by a reader/writer lock such that the tree
+// can be queried from several threads while it is being updated. The torch
+// entry points release the GIL. Large batches are split across the intra-op
+// thread pool (see at::parallel_for).
 // One example of a SegmentTree is shown below.
 //
 //                          1: [0, 8)
@@ -59,12 +83,14 @@ class SegmentTree {
   std::vector<T> At(const std::vector<int64_t>& index) const {
     const int64_t n = index.size();
     std::vector<T> value(n);
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchAtImpl(n, index.data(), value.data());
     return value;
   }
 
   py::array_t<T> At(const py::array_t<int64_t>& index) const {
     py::array_t<T> value = utils::NumpyEmptyLike<int64_t, T>(index);
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchAtImpl(index.size(), index.data(), value.mutable_data());
     return value;
   }
@@ -75,6 +101,7 @@ class SegmentTree {
     const int64_t n = index_contiguous.numel();
     torch::Tensor value =
         torch::empty_like(index_contiguous, utils::TorchDataType<T>::value);
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchAtImpl(n, index_contiguous.data_ptr<int64_t>(), value.data_ptr<T>());
     return value;
   }
@@ -82,19 +109,19 @@ class SegmentTree {
   // Update the item at index to value.
   // Time complexity: O(logN).
   void Update(int64_t index, const T& value) {
-    index |= capacity_;
-    for (values_[index] = value; index > 1; index >>= 1) {
-      values_[index >> 1] = op_(values_[index], values_[index ^ 1]);
-    }
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
+    UpdateImpl(index, value);
   }
 
   void Update(const std::vector<int64_t>& index, const T& value) {
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     BatchUpdateImpl(index.size(), index.data(), value);
   }
 
   void Update(const std::vector<int64_t>& index, const std::vector<T>& value) {
     assert(value.size() == 1 || index.size() == value.size());
     const int64_t n = index.size();
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     if (value.size() == 1) {
       BatchUpdateImpl(n, index.data(), value[0]);
     } else {
@@ -103,12 +130,14 @@ class SegmentTree {
   }
 
   void Update(const py::array_t<int64_t>& index, const T& value) {
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     BatchUpdateImpl(index.size(), index.data(), value);
   }
 
   void Update(const py::array_t<int64_t>& index, const py::array_t<T>& value) {
     assert(value.size() == 1 || index.size() == value.size());
     const int64_t n = index.size();
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     if (value.size() == 1) {
       BatchUpdateImpl(n, index.data(), *(value.data()));
     } else {
@@ -120,6 +149,7 @@ class SegmentTree {
     assert(index.dtype() == torch::kInt64);
     const torch::Tensor index_contiguous = index.contiguous();
     const int64_t n = index_contiguous.numel();
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     BatchUpdateImpl(n, index_contiguous.data_ptr<int64_t>(), value);
   }
 
@@ -130,6 +160,7 @@ class SegmentTree {
     const torch::Tensor index_contiguous = index.contiguous();
     const torch::Tensor value_contiguous = value.contiguous();
     const int64_t n = index_contiguous.numel();
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     if (value_contiguous.numel() == 1) {
       BatchUpdateImpl(n, index_contiguous.data_ptr<int64_t>(),
                       *(value_contiguous.data_ptr<T>()));
@@ -142,24 +173,8 @@ class SegmentTree {
   // Reduce the range of [l, r) by Operator.
   // Time complexity: O(logN)
   T Query(int64_t l, int64_t r) const {
-    assert(l < r);
-    if (l <= 0 && r >= size_) {
-      return values_[1];
-    }
-    T ret = identity_element_;
-    l |= capacity_;
-    r |= capacity_;
-    while (l < r) {
-      if (l & 1) {
-        ret = op_(ret, values_[l++]);
-      }
-      if (r & 1) {
-        ret = op_(ret, values_[--r]);
-      }
-      l >>= 1;
-      r >>= 1;
-    }
-    return ret;
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
+    return QueryImpl(l, r);
   }
 
   std::vector<T> Query(const std::vector<int64_t>& l,
@@ -167,6 +182,7 @@ class SegmentTree {
     assert(l.size() == r.size());
     std::vector<T> ret(l.size());
     const int64_t n = l.size();
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchQueryImpl(n, l.data(), r.data(), ret.data());
     return ret;
   }
@@ -174,6 +190,7 @@ class SegmentTree {
   py::array_t<T> Query(const py::array_t<int64_t>& l,
                        const py::array_t<int64_t>& r) const {
     py::array_t<T> ret = utils::NumpyEmptyLike<int64_t, T>(l);
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchQueryImpl(l.size(), l.data(), r.data(), ret.mutable_data());
     return ret;
   }
@@ -187,6 +204,7 @@ class SegmentTree {
     torch::Tensor ret =
         torch::empty_like(l_contiguous, utils::TorchDataType<T>::value);
     const int64_t n = l_contiguous.numel();
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     BatchQueryImpl(n, l_contiguous.data_ptr<int64_t>(),
                    r_contiguous.data_ptr<int64_t>(), ret.data_ptr<T>());
     return ret;
@@ -194,6 +212,7 @@ class SegmentTree {
 
   py::array_t<T> DumpValues() const {
     py::array_t<T> ret(size_);
+    std::shared_lock<std::shared_timed_mutex> lock(mutex_);
     std::memcpy(ret.mutable_data(), values_.data() + capacity_,
                 size_ * sizeof(T));
     return ret;
@@ -201,6 +220,7 @@ class SegmentTree {
 
   void LoadValues(const py::array_t<T>& values) {
     assert(values.size() == size_);
+    std::unique_lock<std::shared_timed_mutex> lock(mutex_);
     std::memcpy(values_.data() + capacity_, values.data(), size_ * sizeof(T));
     for (int64_t i = capacity_ - 1; i > 0; --i) {
       values_[i] = op_(values_[(i << 1)], values_[(i << 1) | 1]);
@@ -208,36 +228,131 @@ class SegmentTree {
   }
 
  protected:
-  void BatchAtImpl(int64_t n, const int64_t* index, T* value) const {
-    for (int64_t i = 0; i < n; ++i) {
-      value[i] = values_[index[i] | capacity_];
+  void UpdateImpl(int64_t index, const T& value) {
+    index |= capacity_;
+    for (values_[index] = value; index > 1; index >>= 1) {
+      values_[index >> 1] = op_(values_[index], values_[index ^ 1]);
+    }
+  }
+
+  T QueryImpl(int64_t l, int64_t r) const {
+    assert(l < r);
+    if (l <= 0 && r >= size_) {
+      return values_[1];
+    }
+    T ret = identity_element_;
+    l |= capacity_;
+    r |= capacity_;
+    while (l < r) {
+      if (l & 1) {
+        ret = op_(ret, values_[l++]);
+      }
+      if (r & 1) {
+        ret = op_(ret, values_[--r]);
+      }
+      l >>= 1;
+      r >>= 1;
     }
+    return ret;
   }
 
+  void BatchAtImpl(int64_t n, const int64_t* index, T* value) const {
+    at::parallel_for(0, n, kSegmentTreeGrainSize,
+                     [&](int64_t begin, int64_t end) {
+                       for (int64_t i = begin; i < end; ++i) {
+                         value[i] = values_[index[i] | capacity_];
+                       }
+                     });
+  }
+
+  // Large batches are written in two passes: the leaves are first written
+  // sequentially (such that the last value wins for duplicated indices), then
+  // the internal nodes that were affected are recomputed level by level, each
+  // level being processed in parallel.
+  // Time complexity: O(n(logn + logN)) with n the batch size.
   void BatchUpdateImpl(int64_t n, const int64_t* index, const T& value) {
+    if (n < kSegmentTreeGrainSize) {
+      for (int64_t i = 0; i < n; ++i) {
+        UpdateImpl(index[i], value);
+      }
+      return;
+    }
+    std::vector<int64_t> nodes(n);
     for (int64_t i = 0; i < n; ++i) {
-      Update(index[i], value);
+      const int64_t leaf = index[i] | capacity_;
+      values_[leaf] = value;
+      nodes[i] = leaf >> 1;
     }
+    RebuildImpl(nodes);
   }
 
   void BatchUpdateImpl(int64_t n, const int64_t* index, const T* value) {
+    if (n < kSegmentTreeGrainSize) {
+      for (int64_t i = 0; i < n; ++i) {
+        UpdateImpl(index[i], value[i]);
+      }
+      return;
+    }
+    std::vector<int64_t> nodes(n);
     for (int64_t i = 0; i < n; ++i) {
-      Update(index[i], value[i]);
+      const int64_t leaf = index[i] | capacity_;
+      values_[leaf] = value[i];
+      nodes[i] = leaf >> 1;
+    }
+    RebuildImpl(nodes);
+  }
+
+  // Recomputes the values of the given internal nodes and of all their
+  // ancestors. All the nodes must belong to the same level of the tree.
+  void RebuildImpl(std::vector<int64_t>& nodes) {
+    std::sort(nodes.begin(), nodes.end());
+    nodes.erase(std::unique(nodes.begin(), nodes.end()), nodes.end());
+    while (!nodes.empty()) {
+      const int64_t m = nodes.size();
+      at::parallel_for(0, m, kSegmentTreeGrainSize,
+                       [&](int64_t begin, int64_t end) {
+                         for (int64_t i = begin; i < end; ++i) {
+                           const int64_t node = nodes[i];
+                           values_[node] = op_(values_[node << 1],
+                                               values_[(node << 1) | 1]);
+                         }
+                       });
+      if (nodes[0] == 1) {
+        break;
+      }
+      // shifting preserves the ordering, hence nodes only needs to be
+      // deduplicated
+      for (int64_t& node : nodes) {
+        node >>= 1;
+      }
+      nodes.erase(std::unique(nodes.begin(), nodes.end()), nodes.end());
     }
   }
 
   void BatchQueryImpl(int64_t n, const int64_t* l, const int64_t* r,
                       T* result) const {
-    for (int64_t i = 0; i < n; ++i) {
-      result[i] = Query(l[i], r[i]);
-    }
+    at::parallel_for(0, n, kSegmentTreeGrainSize,
+                     [&](int64_t begin, int64_t end) {
+                       for (int64_t i = begin; i < end; ++i) {
+                         result[i] = QueryImpl(l[i], r[i]);
+                       }
+                     });
   }
 
+  // UpdatePriority writes a sum tree and a min tree under both write locks.
+  template <typename U>
+  friend U UpdatePriority(SumSegmentTree<U>& sum_tree,
+                          MinSegmentTree<U>& min_tree,
+                          const torch::Tensor& index,
+                          const torch::Tensor& priority, const U& alpha,
+                          const U& eps);
+
   const Operator op_{};
   const int64_t size_;
   int64_t capacity_;
   const T identity_element_;
   std::vector<T> values_;
+  mutable std::shared_timed_mutex mutex_;
 };
 
 template <typename T>
@@ -248,30 +363,20 @@ class SumSegmentTree final : public SegmentTree<T, std::plus<T>> {
   // Get the 1st index where the scan (prefix sum) is not less than value.
   // Time complexity: O(logN)
   int64_t ScanLowerBound(const T& value) const {
-    if (value > this->values_[1]) {
-      return this->size_;
-    }
-    int64_t index = 1;
-    T current_value = value;
-    while (index < this->capacity_) {
-      index <<= 1;
-      const T& lvalue = this->values_[index];
-      if (current_value > lvalue) {
-        current_value -= lvalue;
-        index |= 1;
-      }
-    }
-    return index ^ this->capacity_;
+    std::shared_lock<std::shared_timed_mutex> lock(this->mutex_);
+    return ScanLowerBoundImpl(value);
   }
 
   std::vector<int64_t> ScanLowerBound(const std::vector<T>& value) const {
     std::vector<int64_t> index(value.size());
+    std::shared_lock<std::shared_timed_mutex> lock(this->mutex_);
     BatchScanLowerBoundImpl(value.size(), value.data(), index.data());
     return index;
   }
 
   py::array_t<int64_t> ScanLowerBound(const py::array_t<T>& value) const {
     py::array_t<int64_t> index = utils::NumpyEmptyLike<T, int64_t>(value);
+    std::shared_lock<std::shared_timed_mutex> lock(this->mutex_);
     BatchScanLowerBoundImpl(value.size(), value.data(), index.mutable_data());
     return index;
   }
@@ -281,17 +386,60 @@ class SumSegmentTree final : public SegmentTree<T, std::plus<T>> {
     const torch::Tensor value_contiguous = value.contiguous();
     torch::Tensor index = torch::empty_like(value_contiguous, torch::kInt64);
     const int64_t n = value_contiguous.numel();
+    std::shared_lock<std::shared_timed_mutex> lock(this->mutex_);
     BatchScanLowerBoundImpl(n, value_contiguous.data_ptr<T>(),
                             index.data_ptr<int64_t>());
     return index;
   }
 
+  // Stratified sampling: the total mass is split in n segments of equal mass
+  // and one index is drawn uniformly (w.r.t. the mass) within each segment.
+  // The uniform samples are drawn with the default torch generator.
+  // Time complexity: O(nlogN)
+  torch::Tensor StratifiedSample(int64_t n) const {
+    const torch::Tensor uniform =
+        torch::rand({n}, torch::dtype(utils::TorchDataType<T>::value));
+    torch::Tensor index = torch::empty({n}, torch::kInt64);
+    const T* uniform_data = uniform.data_ptr<T>();
+    int64_t* index_data = index.data_ptr<int64_t>();
+    std::shared_lock<std::shared_timed_mutex> lock(this->mutex_);
+    const T segment = this->values_[1] / static_cast<T>(n);
+    at::parallel_for(
+        0, n, kSegmentTreeGrainSize, [&](int64_t begin, int64_t end) {
+          for (int64_t i = begin; i < end; ++i) {
+            index_data[i] = ScanLowerBoundImpl(
+                (static_cast<T>(i) + uniform_data[i]) * segment);
+          }
+        });
+    return index;
+  }
+
  protected:
+  int64_t ScanLowerBoundImpl(const T& value) const {
+    if (value > this->values_[1]) {
+      return this->size_;
+    }
+    int64_t index = 1;
+    T current_value = value;
+    while (index < this->capacity_) {
+      index <<= 1;
+      const T& lvalue = this->values_[index];
+      if (current_value > lvalue) {
+        current_value -= lvalue;
+        index |= 1;
+      }
+    }
+    return index ^ this->capacity_;
+  }
+
   void BatchScanLowerBoundImpl(int64_t n, const T* value,
                                int64_t* index) const {
-    for (int64_t i = 0; i < n; ++i) {
-      index[i] = ScanLowerBound(value[i]);
-    }
+    at::parallel_for(0, n, kSegmentTreeGrainSize,
+                     [&](int64_t begin, int64_t end) {
+                       for (int64_t i = begin; i < end; ++i) {
+                         index[i] = ScanLowerBoundImpl(value[i]);
+                       }
+                     });
   }
 };
 
@@ -307,6 +455,53 @@ class MinSegmentTree final : public SegmentTree<T, MinOp<T>> {
       : SegmentTree<T, MinOp<T>>(size, std::numeric_limits<T>::max()) {}
 };
 
+// Updates the items at index of a sum tree and a min tree with the same
+// priorities in a single call. The stored values are (priority + eps) ^ alpha.
+// Returns the largest raw priority such that the caller can keep track of the
+// maximum priority.
+// Both write locks are held for the whole call, such that a concurrent reader
+// never sees the two trees out of step.
+template <typename T>
+T UpdatePriority(SumSegmentTree<T>& sum_tree, MinSegmentTree<T>& min_tree,
+                 const torch::Tensor& index, const torch::Tensor& priority,
+                 const T& alpha, const T& eps) {
+  assert(index.dtype() == torch::kInt64);
+  assert(priority.dtype() == utils::TorchDataType<T>::value);
+  assert(priority.numel() == 1 || index.numel() == priority.numel());
+  const torch::Tensor priority_contiguous = priority.contiguous();
+  const int64_t n = priority_contiguous.numel();
+  const T* priority_data = priority_contiguous.data_ptr<T>();
+  torch::Tensor value = torch::empty_like(priority_contiguous);
+  T* value_data = value.data_ptr<T>();
+  T max_priority = std::numeric_limits<T>::lowest();
+  for (int64_t i = 0; i < n; ++i) {
+    max_priority = std::max(max_priority, priority_data[i]);
+    value_data[i] = std::pow(priority_data[i] + eps, alpha);
+  }
+  const torch::Tensor index_contiguous = index.contiguous();
+  const int64_t* index_data = index_contiguous.data_ptr<int64_t>();
+  const int64_t m = index_contiguous.numel();
+  std::unique_lock<std::shared_timed_mutex> sum_lock(sum_tree.mutex_,
+                                                      std::defer_lock);
+  std::unique_lock<std::shared_timed_mutex> min_lock(min_tree.mutex_,
+                                                      std::defer_lock);
+  std::lock(sum_lock, min_lock);
+  if (n == 1) {
+    sum_tree.BatchUpdateImpl(m, index_data, value_data[0]);
+    min_tree.BatchUpdateImpl(m, index_data, value_data[0]);
+  } else {
+    sum_tree.BatchUpdateImpl(m, index_data, value_data);
+    min_tree.BatchUpdateImpl(m, index_data, value_data);
+  }
+  return max_priority;
+}
+
+template <typename T>
+void DefineUpdatePriority(py::module& m) {
+  m.def("update_priority", &UpdatePriority<T>,
+        py::call_guard<py::gil_scoped_release>());
+}
+
 template <typename T>
 void DefineSumSegmentTree(const std::string& type, py::module& m) {
   const std::string pyclass = "SumSegmentTree" + type;
@@ -323,12 +518,14 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
       .def("__getitem__", py::overload_cast<const py::array_t<int64_t>&>(
                               &SumSegmentTree<T>::At, py::const_))
       .def("__getitem__", py::overload_cast<const torch::Tensor&>(
-                              &SumSegmentTree<T>::At, py::const_))
+                              &SumSegmentTree<T>::At, py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def("at", py::overload_cast<int64_t>(&SumSegmentTree<T>::At, py::const_))
       .def("at", py::overload_cast<const py::array_t<int64_t>&>(
                      &SumSegmentTree<T>::At, py::const_))
       .def("at", py::overload_cast<const torch::Tensor&>(&SumSegmentTree<T>::At,
-                                                         py::const_))
+                                                         py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def("__setitem__",
            py::overload_cast<int64_t, const T&>(&SumSegmentTree<T>::Update))
       .def("__setitem__",
@@ -339,10 +536,12 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
           py::overload_cast<const py::array_t<int64_t>&, const py::array_t<T>&>(
               &SumSegmentTree<T>::Update))
       .def("__setitem__", py::overload_cast<const torch::Tensor&, const T&>(
-                              &SumSegmentTree<T>::Update))
+                              &SumSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("__setitem__",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &SumSegmentTree<T>::Update))
+               &SumSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("update",
            py::overload_cast<int64_t, const T&>(&SumSegmentTree<T>::Update))
       .def("update", py::overload_cast<const py::array_t<int64_t>&, const T&>(
@@ -352,10 +551,12 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
           py::overload_cast<const py::array_t<int64_t>&, const py::array_t<T>&>(
               &SumSegmentTree<T>::Update))
       .def("update", py::overload_cast<const torch::Tensor&, const T&>(
-                         &SumSegmentTree<T>::Update))
+                         &SumSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("update",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &SumSegmentTree<T>::Update))
+               &SumSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("query", py::overload_cast<int64_t, int64_t>(
                         &SumSegmentTree<T>::Query, py::const_))
       .def("query", py::overload_cast<const py::array_t<int64_t>&,
@@ -363,7 +564,8 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
                         &SumSegmentTree<T>::Query, py::const_))
       .def("query",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &SumSegmentTree<T>::Query, py::const_))
+               &SumSegmentTree<T>::Query, py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def("scan_lower_bound",
            py::overload_cast<const T&>(&SumSegmentTree<T>::ScanLowerBound,
                                        py::const_))
@@ -372,7 +574,10 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
                &SumSegmentTree<T>::ScanLowerBound, py::const_))
       .def("scan_lower_bound",
            py::overload_cast<const torch::Tensor&>(
-               &SumSegmentTree<T>::ScanLowerBound, py::const_))
+               &SumSegmentTree<T>::ScanLowerBound, py::const_),
+           py::call_guard<py::gil_scoped_release>())
+      .def("stratified_sample", &SumSegmentTree<T>::StratifiedSample,
+           py::call_guard<py::gil_scoped_release>())
       .def(py::pickle(
           [](const SumSegmentTree<T>& s) {
             return py::make_tuple(s.DumpValues());
@@ -380,8 +585,8 @@ void DefineSumSegmentTree(const std::string& type, py::module& m) {
           [](const py::tuple& t) {
             assert(t.size() == 1);
             const py::array_t<T>& arr = t[0].cast<py::array_t<T>>();
-            SumSegmentTree<T> s(arr.size());
-            s.LoadValues(arr);
+            auto s = std::make_shared<SumSegmentTree<T>>(arr.size());
+            s->LoadValues(arr);
             return s;
           }));
 }
@@ -402,12 +607,14 @@ void DefineMinSegmentTree(const std::string& type, py::module& m) {
       .def("__getitem__", py::overload_cast<const py::array_t<int64_t>&>(
                               &MinSegmentTree<T>::At, py::const_))
       .def("__getitem__", py::overload_cast<const torch::Tensor&>(
-                              &MinSegmentTree<T>::At, py::const_))
+                              &MinSegmentTree<T>::At, py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def("at", py::overload_cast<int64_t>(&MinSegmentTree<T>::At, py::const_))
       .def("at", py::overload_cast<const py::array_t<int64_t>&>(
                      &MinSegmentTree<T>::At, py::const_))
       .def("at", py::overload_cast<const torch::Tensor&>(&MinSegmentTree<T>::At,
-                                                         py::const_))
+                                                         py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def("__setitem__",
            py::overload_cast<int64_t, const T&>(&MinSegmentTree<T>::Update))
       .def("__setitem__",
@@ -418,10 +625,12 @@ void DefineMinSegmentTree(const std::string& type, py::module& m) {
           py::overload_cast<const py::array_t<int64_t>&, const py::array_t<T>&>(
               &MinSegmentTree<T>::Update))
       .def("__setitem__", py::overload_cast<const torch::Tensor&, const T&>(
-                              &MinSegmentTree<T>::Update))
+                              &MinSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("__setitem__",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &MinSegmentTree<T>::Update))
+               &MinSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("update",
            py::overload_cast<int64_t, const T&>(&MinSegmentTree<T>::Update))
       .def("update", py::overload_cast<const py::array_t<int64_t>&, const T&>(
@@ -431,10 +640,12 @@ void DefineMinSegmentTree(const std::string& type, py::module& m) {
           py::overload_cast<const py::array_t<int64_t>&, const py::array_t<T>&>(
               &MinSegmentTree<T>::Update))
       .def("update", py::overload_cast<const torch::Tensor&, const T&>(
-                         &MinSegmentTree<T>::Update))
+                         &MinSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("update",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &MinSegmentTree<T>::Update))
+               &MinSegmentTree<T>::Update),
+           py::call_guard<py::gil_scoped_release>())
       .def("query", py::overload_cast<int64_t, int64_t>(
                         &MinSegmentTree<T>::Query, py::const_))
       .def("query", py::overload_cast<const py::array_t<int64_t>&,
@@ -442,7 +653,8 @@ void DefineMinSegmentTree(const std::string& type, py::module& m) {
                         &MinSegmentTree<T>::Query, py::const_))
       .def("query",
            py::overload_cast<const torch::Tensor&, const torch::Tensor&>(
-               &MinSegmentTree<T>::Query, py::const_))
+               &MinSegmentTree<T>::Query, py::const_),
+           py::call_guard<py::gil_scoped_release>())
       .def(py::pickle(
           [](const MinSegmentTree<T>& s) {
             return py::make_tuple(s.DumpValues());
@@ -450,8 +662,8 @@ void DefineMinSegmentTree(const std::string& type, py::module& m) {
           [](const py::tuple& t) {
             assert(t.size() == 1);
             const py::array_t<T>& arr = t[0].cast<py::array_t<T>>();
-            MinSegmentTree<T> s(arr.size());
-            s.LoadValues(arr);
+            auto s = std::make_shared<MinSegmentTree<T>>(arr.size());
+            s->LoadValues(arr);
             return s;
           }));
 }
@@ -3,5 +3,6 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+from .prefetch import *
 from .replay_buffers import *
 from .storages import *
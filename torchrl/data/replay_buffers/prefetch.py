@@ -0,0 +1,277 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import queue
+import threading
+from typing import Optional, Union
+
+import torch
+
+from torchrl.data.replay_buffers.replay_buffers import (
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+)
+from torchrl.data.replay_buffers.storages import LazyTensorStorage
+from torchrl.data.tensordict.memmap import MemmapTensor
+from torchrl.data.tensordict.tensordict import TensorDictBase, TensorDict
+from torchrl.data.utils import DEVICE_TYPING
+
+__all__ = ["PinnedPrefetcher", "PrefetchedBatch"]
+
+
+class PinnedPrefetcher:
+    """Samples batches of a replay buffer ahead of time and moves them to a device.
+
+    The prefetcher owns :obj:`num_slots` pre-allocated batches. A background
+    thread fills each free slot by gathering a uniformly sampled batch from
+    the storage with :obj:`torch.index_select(..., out=...)`, directly into
+    the (pinned) host memory of the slot. When the destination device is a
+    CUDA device, the batch is then copied to the pre-allocated device memory
+    of the slot on a dedicated stream. Sampling, pinning and host-to-device
+    transfers therefore run concurrently with the consumer's computations.
+
+    Slots are handed out in a round-robin fashion as :obj:`PrefetchedBatch`
+    handles, which must be released once the batch has been consumed so that
+    the slot can be filled again. The data of a slot is overwritten after
+    its release: it should be cloned if it needs to be kept.
+
+    On CPU, the host memory is not pinned and no transfer takes place, the
+    batches being read directly from the host slots.
+
+    Args:
+        replay_buffer (ReplayBuffer): the buffer to sample from. Its storage
+            must be a non-empty :obj:`LazyTensorStorage` or
+            :obj:`LazyMemmapStorage`, and its samples are drawn uniformly.
+        batch_size (int): size of the sampled batches.
+        device (torch.device, optional): device where the batches are
+            delivered. Default is `torch.device("cpu")`.
+        num_slots (int, optional): number of pre-allocated batches, i.e.
+            maximum number of batches sampled ahead of time (including the
+            ones held by the consumer). Default is `2`.
+
+    Examples:
+        >>> prefetcher = PinnedPrefetcher(rb, 256, device="cuda:0", num_slots=3)
+        >>> for batch in prefetcher:
+        ...     loss = loss_module(batch)  # the previous batch is released
+        >>> with prefetcher.get() as batch:  # or explicitly
+        ...     loss = loss_module(batch)
+        >>> prefetcher.close()
+
+    """
+
+    def __init__(
+        self,
+        replay_buffer: ReplayBuffer,
+        batch_size: int,
+        device: Optional[DEVICE_TYPING] = None,
+        num_slots: int = 2,
+    ):
+        storage = replay_buffer._storage
+        if not isinstance(storage, LazyTensorStorage) or isinstance(
+            replay_buffer, PrioritizedReplayBuffer
+        ):
+            raise TypeError(
+                f"{self.__class__.__name__} only supports uniform replay buffers "
+                f"built on a LazyTensorStorage or a LazyMemmapStorage."
+            )
+        if not storage.initialized or not len(storage):
+            raise RuntimeError(
+                f"Cannot build a {self.__class__.__name__} on an empty replay "
+                f"buffer."
+            )
+        if num_slots < 1:
+            raise ValueError(f"num_slots must be positive, got {num_slots}.")
+        self.replay_buffer = replay_buffer
+        self.batch_size = batch_size
+        self.device = (
+            torch.device(device) if device is not None else torch.device("cpu")
+        )
+        self.num_slots = num_slots
+
+        cuda = self.device.type == "cuda"
+        self._stream = torch.cuda.Stream(self.device) if cuda else None
+        self._slots = []
+        for _ in range(num_slots):
+            host = _empty_batch(storage._storage, batch_size, "cpu", pin_memory=cuda)
+            self._slots.append(
+                _Slot(
+                    host=host,
+                    data=_empty_batch(storage._storage, batch_size, self.device)
+                    if cuda
+                    else host,
+                    copied=torch.cuda.Event() if cuda else None,
+                    released=torch.cuda.Event() if cuda else None,
+                )
+            )
+        self._free = queue.Queue()
+        self._ready = queue.Queue()
+        for i in range(num_slots):
+            self._free.put(i)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _fill(self, slot: "_Slot") -> None:
+        if slot.copied is not None:
+            # the host memory may still be read by the previous transfer
+            slot.copied.synchronize()
+        storage = self.replay_buffer._storage
+        with self.replay_buffer._replay_lock:
+            index = storage.sample_index(self.batch_size)
+            _index_select(storage._storage, index, slot.host)
+        if self._stream is not None:
+            with torch.cuda.stream(self._stream):
+                # the device memory may still be read by the consumer
+                self._stream.wait_event(slot.released)
+                _copy(slot.host, slot.data)
+                slot.copied.record(self._stream)
+
+    def _run(self) -> None:
+        while True:
+            i = self._free.get()
+            if i is None:
+                return
+            try:
+                self._fill(self._slots[i])
+            except Exception as err:
+                self._ready.put(err)
+                return
+            self._ready.put(i)
+
+    def get(self) -> "PrefetchedBatch":
+        """Returns the next prefetched batch.
+
+        Blocks until a batch is ready. The returned handle must be released
+        (explicitly or by using it as a context manager) for its slot to be
+        filled again.
+        """
+        if self._closed:
+            raise RuntimeError(f"The {self.__class__.__name__} has been closed.")
+        i = self._ready.get()
+        if isinstance(i, Exception):
+            raise RuntimeError("The prefetching thread failed.") from i
+        return PrefetchedBatch(self, i)
+
+    def _release(self, i: int) -> None:
+        slot = self._slots[i]
+        if slot.released is not None:
+            slot.released.record(torch.cuda.current_stream(self.device))
+        self._free.put(i)
+
+    def __iter__(self):
+        while True:
+            with self.get() as batch:
+                yield batch
+
+    def close(self) -> None:
+        """Stops the prefetching thread."""
+        if not self._closed:
+            self._closed = True
+            self._free.put(None)
+            self._thread.join()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(batch_size={self.batch_size}, "
+            f"device={self.device}, num_slots={self.num_slots})"
+        )
+
+
+class PrefetchedBatch:
+    """A handle on a batch delivered by a :obj:`PinnedPrefetcher`.
+
+    Args:
+        prefetcher (PinnedPrefetcher): the prefetcher owning the batch.
+        slot (int): the slot of the batch.
+
+    """
+
+    def __init__(self, prefetcher: PinnedPrefetcher, slot: int):
+        self.prefetcher = prefetcher
+        self.slot = slot
+        self._released = False
+
+    def ready(self) -> bool:
+        """Returns :obj:`True` if the batch has been copied to its device."""
+        copied = self.prefetcher._slots[self.slot].copied
+        return copied is None or copied.query()
+
+    def wait(self) -> Union[TensorDictBase, torch.Tensor]:
+        """Makes the current stream wait for the batch to be on its device,
+        and returns it."""
+        if self._released:
+            raise RuntimeError("The batch has already been released.")
+        slot = self.prefetcher._slots[self.slot]
+        if slot.copied is not None:
+            torch.cuda.current_stream(self.prefetcher.device).wait_event(slot.copied)
+        return slot.data
+
+    def release(self) -> None:
+        """Gives the slot back to the prefetcher, which will overwrite it."""
+        if not self._released:
+            self._released = True
+            self.prefetcher._release(self.slot)
+
+    def __enter__(self) -> Union[TensorDictBase, torch.Tensor]:
+        return self.wait()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+
+class _Slot:
+    def __init__(self, host, data, copied, released):
+        self.host = host
+        self.data = data
+        self.copied = copied
+        self.released = released
+
+
+def _empty_batch(
+    source: Union[TensorDictBase, torch.Tensor, MemmapTensor],
+    batch_size: int,
+    device: DEVICE_TYPING,
+    pin_memory: bool = False,
+) -> Union[TensorDictBase, torch.Tensor]:
+    if isinstance(source, TensorDictBase):
+        return TensorDict(
+            {
+                key: _empty_batch(value, batch_size, device, pin_memory)
+                for key, value in source.items()
+            },
+            batch_size=[batch_size, *source.batch_size[1:]],
+            device=device,
+            _run_checks=False,
+        )
+    return torch.empty(
+        batch_size,
+        *source.shape[1:],
+        dtype=source.dtype,
+        device=device,
+        pin_memory=pin_memory,
+    )
+
+
+def _index_select(
+    source: Union[TensorDictBase, torch.Tensor, MemmapTensor],
+    index: torch.Tensor,
+    out: Union[TensorDictBase, torch.Tensor],
+) -> None:
+    if isinstance(source, TensorDictBase):
+        for key, value in source.items():
+            _index_select(value, index, out.get(key))
+        return
+    torch.index_select(source, 0, index, out=out)
+
+
+def _copy(
+    source: Union[TensorDictBase, torch.Tensor],
+    dest: Union[TensorDictBase, torch.Tensor],
+) -> None:
+    if isinstance(source, TensorDictBase):
+        for key, value in source.items():
+            _copy(value, dest.get(key))
+        return
+    dest.copy_(source, non_blocking=True)
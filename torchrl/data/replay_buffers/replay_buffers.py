@@ -6,7 +6,11 @@
 import collections
 import concurrent.futures
 import functools
+import itertools
+import multiprocessing
+import os
 import threading
+import time
 from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
@@ -18,8 +22,16 @@ from torchrl._torchrl import (
     MinSegmentTreeFp64,
     SumSegmentTreeFp32,
     SumSegmentTreeFp64,
+    update_priority,
+)
+from torchrl.data.replay_buffers.storages import (
+    Storage,
+    ListStorage,
+    LazyMemmapStorage,
+    LazyTensorStorage,
+    CompressedStorage,
+    FrameStackStorage,
 )
-from torchrl.data.replay_buffers.storages import Storage, ListStorage
 from torchrl.data.replay_buffers.utils import INT_CLASSES
 from torchrl.data.replay_buffers.utils import (
     cat_fields_to_device,
@@ -38,6 +50,9 @@ __all__ = [
     "PrioritizedReplayBuffer",
     "TensorDictReplayBuffer",
     "TensorDictPrioritizedReplayBuffer",
+    "TensorDictSliceReplayBuffer",
+    "ShardedReplayBuffer",
+    "SharedReplayBuffer",
     "create_replay_buffer",
     "create_prioritized_replay_buffer",
 ]
@@ -74,6 +89,33 @@ def stack_tensors(list_of_tensor_iterators: List) -> Tuple[torch.Tensor]:
     return tuple(torch.stack(tensors, 0) for tensors in zip(*list_of_tensor_iterators))
 
 
+def _collate_list_tensordict(x):
+    return stack_td(x, 0, contiguous=True)
+
+
+def _collate_contiguous(x):
+    return x
+
+
+def _get_default_collate(storage: Storage, _is_tensordict: bool = False) -> Callable:
+    """Returns the collate function to be used by default with a storage.
+
+    Pre-allocated tensor storages, compressed storages and frame-stack storages
+    already return contiguous batches when indexed with a tensor, hence their
+    output does not need to be stacked.
+    """
+    if isinstance(storage, (LazyTensorStorage, CompressedStorage, FrameStackStorage)):
+        return _collate_contiguous
+    elif _is_tensordict:
+        return _collate_list_tensordict
+    else:
+        return stack_tensors
+
+
+def _is_persistent(storage: Storage) -> bool:
+    return isinstance(storage, LazyMemmapStorage) and storage.persistent
+
+
 def _pin_memory(output: Any) -> Any:
     if hasattr(output, "pin_memory") and output.device == torch.device("cpu"):
         return output.pin_memory()
@@ -109,7 +151,10 @@ class ReplayBuffer:
         size (int): integer indicating the maximum size of the replay buffer.
         collate_fn (callable, optional): merges a list of samples to form a
             mini-batch of Tensor(s)/outputs.  Used when using batched
-            loading from a map-style dataset.
+            loading from a map-style dataset. With pre-allocated storages
+            (:obj:`LazyTensorStorage` and :obj:`LazyMemmapStorage`), the
+            sampled batch is gathered in a single indexing operation and
+            is returned as is by default.
         pin_memory (bool): whether pin_memory() should be called on the rb
             samples.
         prefetch (int, optional): number of next batches to be prefetched
@@ -131,8 +176,11 @@ class ReplayBuffer:
         self._storage = storage
         self._capacity = size
         self._cursor = 0
+        if _is_persistent(storage):
+            # resume from a re-opened storage
+            self._cursor = storage.metadata.get("cursor", 0)
         if collate_fn is None:
-            collate_fn = stack_tensors
+            collate_fn = _get_default_collate(storage)
         self._collate_fn = collate_fn
         self._pin_memory = pin_memory
 
@@ -237,9 +285,28 @@ class ReplayBuffer:
             self._storage[index] = data
             return index
 
+    def checkpoint(self) -> None:
+        """Saves the state of the buffer (cursor and length) with the data of
+        a persistent :obj:`LazyMemmapStorage`, such that the buffer can be
+        resumed from the storage directory with `LazyMemmapStorage.load`.
+
+        """
+        if not _is_persistent(self._storage):
+            raise RuntimeError(
+                "checkpoint requires the replay buffer to be built on a "
+                "persistent LazyMemmapStorage."
+            )
+        with self._replay_lock:
+            self._storage.save_metadata(
+                cursor=int(self._cursor), **self._state_metadata()
+            )
+
+    def _state_metadata(self) -> dict:
+        return {}
+
     @pin_memory_output
     def _sample(self, batch_size: int) -> Any:
-        index = np.random.randint(0, len(self._storage), size=batch_size)
+        index = self._storage.sample_index(batch_size)
 
         with self._replay_lock:
             data = self._storage[index]
@@ -337,14 +404,31 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         if dtype in (torch.float, torch.FloatType, torch.float32):
             self._sum_tree = SumSegmentTreeFp32(size)
             self._min_tree = MinSegmentTreeFp32(size)
+            self._dtype = torch.float
         elif dtype in (torch.double, torch.DoubleTensor, torch.float64):
             self._sum_tree = SumSegmentTreeFp64(size)
             self._min_tree = MinSegmentTreeFp64(size)
+            self._dtype = torch.double
         else:
             raise NotImplementedError(
                 f"dtype {dtype} not supported by PrioritizedReplayBuffer"
             )
         self._max_priority = 1.0
+        # The segment trees have their own reader/writer lock and release the
+        # GIL when used with tensors, hence priorities can be updated while
+        # other threads are sampling. This lock only guards the max priority.
+        self._priority_lock = threading.Lock()
+        if _is_persistent(self._storage) and "priorities" in self._storage.metadata:
+            # resume from a re-opened storage
+            priority = torch.load(
+                os.path.join(
+                    self._storage.scratch_dir, self._storage.metadata["priorities"]
+                )
+            ).to(self._dtype)
+            index = torch.arange(priority.numel())
+            self._sum_tree[index] = priority
+            self._min_tree[index] = priority
+            self._max_priority = self._storage.metadata["max_priority"]
 
     @pin_memory_output
     def __getitem__(self, index: Union[int, Tensor]) -> Any:
@@ -370,6 +454,14 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         weight = to_torch(weight, device, self._pin_memory)
         return data, weight
 
+    def _state_metadata(self) -> dict:
+        # priorities are saved next to the data of the storage
+        priority = self._sum_tree[torch.arange(len(self._storage))]
+        torch.save(priority, os.path.join(self._storage.scratch_dir, "priorities.pt"))
+        with self._priority_lock:
+            max_priority = self._max_priority
+        return {"priorities": "priorities.pt", "max_priority": float(max_priority)}
+
     @property
     def alpha(self) -> float:
         return self._alpha
@@ -384,7 +476,7 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
     @property
     def max_priority(self) -> float:
-        with self._replay_lock:
+        with self._priority_lock:
             return self._max_priority
 
     @property
@@ -397,37 +489,46 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         priority: Optional[torch.Tensor] = None,
         do_add: bool = True,
     ) -> torch.Tensor:
-        if priority is not None:
-            priority = to_numpy(priority)
-            max_priority = np.max(priority)
-            with self._replay_lock:
-                self._max_priority = max(self._max_priority, max_priority)
-            priority = np.power(priority + self._eps, self._alpha)
-        else:
-            with self._replay_lock:
-                priority = self._default_priority
-
         if do_add:
             index = super(PrioritizedReplayBuffer, self).add(data)
         else:
             index = super(PrioritizedReplayBuffer, self).extend(data)
 
-        if not (
-            isinstance(priority, float)
-            or len(priority) == 1
-            or len(priority) == len(index)
-        ):
-            raise RuntimeError(
-                "priority should be a scalar or an iterable of the same "
-                "length as index"
-            )
-
-        with self._replay_lock:
+        if priority is not None:
+            self._update_priority(index, priority)
+        else:
+            with self._priority_lock:
+                priority = self._default_priority
             self._sum_tree[index] = priority
             self._min_tree[index] = priority
 
         return index
 
+    def _update_priority(
+        self, index: Union[int, Tensor], priority: Union[float, Tensor]
+    ) -> None:
+        # the priorities are raised to the power alpha and written in both
+        # segment trees by a single call that does not hold the GIL
+        index = torch.as_tensor(index, dtype=torch.long, device="cpu").reshape(-1)
+        priority = torch.as_tensor(
+            priority, dtype=self._dtype, device="cpu"
+        ).reshape(-1)
+        if not (priority.numel() == 1 or priority.numel() == index.numel()):
+            raise RuntimeError(
+                "priority should be a scalar or an iterable of the same "
+                "length as index"
+            )
+        max_priority = update_priority(
+            self._sum_tree,
+            self._min_tree,
+            index,
+            priority,
+            self._alpha,
+            self._eps,
+        )
+        with self._priority_lock:
+            self._max_priority = max(self._max_priority, max_priority)
+
     def add(self, data: Any, priority: Optional[torch.Tensor] = None) -> torch.Tensor:
         return self._add_or_extend(data, priority, True)
 
@@ -438,21 +539,18 @@ class PrioritizedReplayBuffer(ReplayBuffer):
 
     @pin_memory_output
     def _sample(self, batch_size: int) -> Tuple[Any, torch.Tensor, torch.Tensor]:
+        p_sum = self._sum_tree.query(0, self._capacity)
+        p_min = self._min_tree.query(0, self._capacity)
+        if p_sum <= 0:
+            raise RuntimeError("negative p_sum")
+        if p_min <= 0:
+            raise RuntimeError("negative p_min")
+        mass = torch.rand(batch_size, dtype=self._dtype) * p_sum
+        index = self._sum_tree.scan_lower_bound(mass)
         with self._replay_lock:
-            p_sum = self._sum_tree.query(0, self._capacity)
-            p_min = self._min_tree.query(0, self._capacity)
-            if p_sum <= 0:
-                raise RuntimeError("negative p_sum")
-            if p_min <= 0:
-                raise RuntimeError("negative p_min")
-            mass = np.random.uniform(0.0, p_sum, size=batch_size)
-            index = self._sum_tree.scan_lower_bound(mass)
-            if isinstance(index, torch.Tensor):
-                index.clamp_max_(len(self._storage) - 1)
-            else:
-                index = np.clip(index, None, len(self._storage) - 1)
+            index.clamp_max_(len(self._storage) - 1)
             data = self._storage[index]
-            weight = self._sum_tree[index]
+        weight = self._sum_tree[index]
 
         data = self._collate_fn(data)
 
@@ -464,7 +562,7 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         #   weight_i = ((p_i / sum(p) * N) / (min(p) / sum(p) * N)) ^ (-beta)
         #   weight_i = (p_i / min(p)) ^ (-beta)
         # weight = np.power(weight / (p_min + self._eps), -self._beta)
-        weight = np.power(weight / p_min, -self._beta)
+        weight = torch.pow(weight / p_min, -self._beta)
 
         # x = first_field(data)  # avoid calling tree.flatten
         # if isinstance(x, torch.Tensor):
@@ -472,7 +570,7 @@ class PrioritizedReplayBuffer(ReplayBuffer):
         weight = to_torch(weight, device, self._pin_memory)
         return data, weight, index
 
-    def sample(self, batch_size: int) -> Tuple[Any, np.ndarray, torch.Tensor]:
+    def sample(self, batch_size: int) -> Tuple[Any, torch.Tensor, torch.Tensor]:
         """Gather a batch of data according to the non-uniform multinomial
         distribution with weights computed with the provided priorities of
         each input.
@@ -528,14 +626,7 @@ class PrioritizedReplayBuffer(ReplayBuffer):
                     "priority should be a number or an iterable of the same "
                     "length as index"
                 )
-            index = to_numpy(index)
-            priority = to_numpy(priority)
-
-        with self._replay_lock:
-            self._max_priority = max(self._max_priority, np.max(priority))
-            priority = np.power(priority + self._eps, self._alpha)
-            self._sum_tree[index] = priority
-            self._min_tree[index] = priority
+        self._update_priority(index, priority)
 
 
 class TensorDictReplayBuffer(ReplayBuffer):
@@ -552,11 +643,174 @@ class TensorDictReplayBuffer(ReplayBuffer):
         storage: Optional[Storage] = None,
     ):
         if collate_fn is None:
+            collate_fn = _get_default_collate(storage, _is_tensordict=True)
+
+        super().__init__(size, collate_fn, pin_memory, prefetch, storage=storage)
+
+
+class TensorDictSliceReplayBuffer(TensorDictReplayBuffer):
+    """A TensorDict replay buffer that samples contiguous slices of trajectories.
 
-            def collate_fn(x):
-                return stack_td(x, 0, contiguous=True)
+    The buffer keeps track, for each stored step, of the number of steps of
+    the same trajectory that were written right before it. This is updated
+    incrementally when data is added, such that sampling a batch of slices
+    that do not cross trajectory boundaries only requires drawing the last
+    step of each slice and gathering the whole batch at once.
+
+    Steps belong to the same trajectory if they are written consecutively,
+    have the same :obj:`traj_key` entry (if present) and are not separated by
+    a :obj:`done_key` entry set to :obj:`True`. Batches of transitions coming
+    from a collector should thus be flattened trajectory-wise (e.g. with
+    :obj:`tensordict.view(-1)` on a :obj:`[n_envs, T]` batch) before being
+    written.
+
+    The sampled tensordicts have a shape :obj:`[batch_size, burn_in +
+    slice_len]` and contain a :obj:`"mask"` entry that indicates which steps
+    are valid.
+
+    Args:
+        size (int): integer indicating the maximum size of the replay buffer.
+        slice_len (int): number of steps of the sampled slices, burn-in
+            excluded.
+        burn_in (int, optional): number of steps preceding each slice that
+            are returned with it, for instance to warm up a recurrent
+            network. Default is `0`.
+        pad (bool, optional): if :obj:`True`, slices can start before the
+            beginning of their trajectory: the missing steps are filled with
+            the first step of the trajectory and marked as invalid in the
+            :obj:`"mask"` entry. Otherwise, only slices entirely contained in
+            a trajectory are sampled. Default is `False`.
+        traj_key (str, optional): key identifying the trajectory of each
+            step. Default is `"traj_ids"`.
+        done_key (str, optional): key indicating the last step of each
+            trajectory. Default is `"done"`.
+        collate_fn (callable, optional): merges a list of samples to form a
+            mini-batch of Tensor(s)/outputs.  Used when using batched loading
+            from a map-style dataset.
+        pin_memory (bool, optional): whether pin_memory() should be called on the
+            rb samples. Default is `False`.
+        prefetch (int, optional): number of next batches to be prefetched
+            using multithreading.
+        storage (Storage, optional): the storage to be used. If none is provided,
+            a ListStorage will be instantiated.
 
+    Examples:
+        >>> rb = TensorDictSliceReplayBuffer(
+        ...     10_000, slice_len=8, burn_in=4, storage=LazyTensorStorage(10_000)
+        ... )
+        >>> rb.extend(collector_output.view(-1))
+        >>> sample = rb.sample(32)
+        >>> sample.shape
+        torch.Size([32, 12])
+        >>> sample.get("mask").all()
+        tensor(True)
+
+    """
+
+    def __init__(
+        self,
+        size: int,
+        slice_len: int,
+        burn_in: int = 0,
+        pad: bool = False,
+        traj_key: str = "traj_ids",
+        done_key: str = "done",
+        collate_fn: Optional[Callable] = None,
+        pin_memory: bool = False,
+        prefetch: Optional[int] = None,
+        storage: Optional[Storage] = None,
+    ):
+        if slice_len < 1:
+            raise ValueError(f"slice_len must be positive, got {slice_len}.")
+        if burn_in < 0:
+            raise ValueError(f"burn_in must be non-negative, got {burn_in}.")
         super().__init__(size, collate_fn, pin_memory, prefetch, storage=storage)
+        self.slice_len = slice_len
+        self.burn_in = burn_in
+        self.pad = pad
+        self.traj_key = traj_key
+        self.done_key = done_key
+        # number of consecutive steps of the same trajectory ending at each
+        # index of the buffer
+        self._traj_len = torch.zeros(size, dtype=torch.long)
+        self._last_traj = None
+        self._last_done = True
+
+    def _update_traj_len(self, index: torch.Tensor, data: TensorDictBase) -> None:
+        n = index.numel()
+        if self.traj_key in data.keys():
+            traj = data.get(self.traj_key).reshape(n).cpu()
+        else:
+            traj = torch.zeros(n, dtype=torch.long)
+        if self.done_key in data.keys():
+            done = data.get(self.done_key).reshape(n).cpu().bool()
+        else:
+            done = torch.zeros(n, dtype=torch.bool)
+        continued = torch.empty(n, dtype=torch.bool)
+        continued[1:] = (traj[1:] == traj[:-1]) & ~done[:-1]
+        continued[0] = not self._last_done and self._last_traj == traj[0].item()
+        # length of the trajectory chunk of each step within the batch
+        position = torch.arange(n)
+        chunk_start = torch.cummax(position.masked_fill(continued, 0), 0).values
+        traj_len = position - chunk_start + 1
+        if continued[0]:
+            previous = self._traj_len[(index[0] - 1) % self._capacity]
+            traj_len[chunk_start == 0] += previous
+        self._traj_len[index] = traj_len
+        self._last_traj = traj[-1].item()
+        self._last_done = bool(done[-1])
+
+    def add(self, data: TensorDictBase) -> int:
+        with self._replay_lock:
+            index = super().add(data)
+            self._update_traj_len(torch.tensor([index]), data.unsqueeze(0))
+        return index
+
+    def extend(self, data: TensorDictBase) -> np.ndarray:
+        with self._replay_lock:
+            index = super().extend(data)
+            self._update_traj_len(torch.as_tensor(index, dtype=torch.long), data)
+        return index
+
+    def _valid_traj_len(self) -> torch.Tensor:
+        # steps written before the oldest stored step may have been
+        # overwritten, hence they are not counted
+        n = len(self._storage)
+        oldest = self._cursor if n == self._capacity else 0
+        age = (torch.arange(n) - oldest) % self._capacity + 1
+        return torch.minimum(self._traj_len[:n], age)
+
+    @pin_memory_output
+    def _sample(self, batch_size: int) -> TensorDictBase:
+        length = self.burn_in + self.slice_len
+        with self._replay_lock:
+            traj_len = self._valid_traj_len()
+            if self.pad:
+                last = torch.randint(traj_len.numel(), (batch_size,))
+            else:
+                candidates = (traj_len >= length).nonzero().squeeze(-1)
+                if not candidates.numel():
+                    raise RuntimeError(
+                        f"The buffer does not contain any trajectory of at least "
+                        f"{length} steps."
+                    )
+                last = candidates[torch.randint(candidates.numel(), (batch_size,))]
+            traj_len = traj_len[last].unsqueeze(-1)
+            offset = torch.arange(length - 1, -1, -1).expand(batch_size, length)
+            mask = offset < traj_len
+            index = (last.unsqueeze(-1) - torch.minimum(offset, traj_len - 1)) % (
+                self._capacity
+            )
+            data = self._storage[index.reshape(-1)]
+        data = self._collate_fn(data).reshape(batch_size, length)
+        data.set("mask", mask)
+        return data
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(size={len(self)}, "
+            f"slice_len={self.slice_len}, burn_in={self.burn_in}, pad={self.pad})"
+        )
 
 
 class TensorDictPrioritizedReplayBuffer(PrioritizedReplayBuffer):
@@ -600,9 +854,7 @@ class TensorDictPrioritizedReplayBuffer(PrioritizedReplayBuffer):
         storage: Optional[Storage] = None,
     ) -> None:
         if collate_fn is None:
-
-            def collate_fn(x):
-                return stack_td(x, 0, contiguous=True)
+            collate_fn = _get_default_collate(storage, _is_tensordict=True)
 
         super(TensorDictPrioritizedReplayBuffer, self).__init__(
             size=size,
@@ -713,6 +965,530 @@ class TensorDictPrioritizedReplayBuffer(PrioritizedReplayBuffer):
         return td
 
 
+class SharedReplayBuffer(TensorDictReplayBuffer):
+    """A TensorDict replay buffer that can be shared by several processes.
+
+    The content of the buffer is pre-allocated in shared memory (with a
+    :obj:`LazyTensorStorage`) or in memory-mapped files (with a
+    :obj:`LazyMemmapStorage`), and so are its cursor, length and priorities.
+    Hence, once the buffer has been passed to other processes (e.g. as an
+    argument of :obj:`multiprocessing.Process`), collector processes can
+    extend it and learner processes can sample from it concurrently: data is
+    written to and read from the storage directly, without being sent through
+    pipes.
+
+    Writers (:obj:`extend` and :obj:`update_priority`) are serialized by a
+    multiprocessing lock, which samplers never take. Instead, samplers read
+    the length and priorities of the buffer under a sequence counter, and
+    draw again when a writer modified them in the meantime. They then gather
+    the data without any lock, and draw again if one of the sampled slots was
+    overwritten during the gather. Concurrent learners therefore never wait
+    for each other, and only wait for writers in the unlikely event of a
+    conflict.
+
+    If :obj:`alpha` is provided, the buffer is prioritized: the sampled
+    tensordicts contain an :obj:`"index"` entry that can be used to update
+    their priority with :obj:`update_priority`. Priorities are sampled with a
+    cumulative sum over the priorities of the buffer, which is cheaper to
+    share across processes than the segment trees of the
+    :obj:`TensorDictPrioritizedReplayBuffer`, but scales linearly with the
+    buffer length.
+
+    Args:
+        size (int): integer indicating the maximum size of the replay buffer.
+        example (TensorDictBase): an element with the structure, shapes and
+            dtypes of the stored data, used to allocate the storage.
+        storage (LazyTensorStorage, optional): the storage to be used, which
+            must not be initialized. Default is a :obj:`LazyTensorStorage`.
+        alpha (float, optional): exponent α determines how much prioritization
+            is used. If none is provided, the samples are drawn uniformly.
+        beta (float, optional): importance sampling negative exponent.
+            Default is `1.0`.
+        eps (float, optional): delta added to the priorities to ensure that
+            the buffer does not contain null priorities. Default is `1e-8`.
+        priority_key (str, optional): key where the priority value can be
+            found in the stored tensordicts. Default is `"td_error"`.
+        pin_memory (bool, optional): whether pin_memory() should be called on
+            the rb samples. Default is `False`.
+
+    Examples:
+        >>> rb = SharedReplayBuffer(1_000_000, example=env.rollout(1)[0])
+        >>> collectors = [mp.Process(target=collect, args=(rb,)) for _ in range(4)]
+        >>> learners = [mp.Process(target=learn, args=(rb,)) for _ in range(2)]
+
+    """
+
+    def __init__(
+        self,
+        size: int,
+        example: TensorDictBase,
+        storage: Optional[LazyTensorStorage] = None,
+        alpha: Optional[float] = None,
+        beta: float = 1.0,
+        eps: float = 1e-8,
+        priority_key: str = "td_error",
+        pin_memory: bool = False,
+    ):
+        if storage is None:
+            storage = LazyTensorStorage(size)
+        if not isinstance(storage, LazyTensorStorage):
+            raise TypeError(
+                f"{self.__class__.__name__} requires a LazyTensorStorage or a "
+                f"LazyMemmapStorage, got {type(storage)}."
+            )
+        if storage.initialized:
+            raise RuntimeError(
+                f"The storage of a {self.__class__.__name__} must not be "
+                f"initialized."
+            )
+        if alpha is not None and alpha <= 0:
+            raise ValueError(
+                f"alpha must be strictly greater than 0, got alpha={alpha}"
+            )
+        # cursor and length of the buffer
+        self._state = torch.zeros(2, dtype=torch.long).share_memory_()
+        # sequence counter, odd while a writer modifies the cursor, length
+        # or priorities
+        self._seq = torch.zeros(1, dtype=torch.long).share_memory_()
+        # number of items whose writing has started and completed since the
+        # creation of the buffer, used to detect the slots overwritten while
+        # a sample is being gathered
+        self._written = torch.zeros(2, dtype=torch.long).share_memory_()
+        super().__init__(size, pin_memory=pin_memory, storage=storage)
+        if alpha is not None:
+            example = example.exclude(priority_key)
+        storage._init(example)
+        if not isinstance(storage, LazyMemmapStorage):
+            storage._storage.share_memory_()
+        self._replay_lock = multiprocessing.RLock()
+
+        self._alpha = alpha
+        self._beta = beta
+        self._eps = eps
+        self.priority_key = priority_key
+        if alpha is not None:
+            # priorities to the power alpha, and max priority
+            self._priority = torch.zeros(size, dtype=torch.double).share_memory_()
+            self._max_priority = torch.ones(1, dtype=torch.double).share_memory_()
+
+    @property
+    def prioritized(self) -> bool:
+        return self._alpha is not None
+
+    @property
+    def _cursor(self) -> int:
+        return int(self._state[0])
+
+    @_cursor.setter
+    def _cursor(self, value: int) -> None:
+        self._state[0] = value
+
+    def __len__(self) -> int:
+        return int(self._state[1])
+
+    def add(self, tensordict: TensorDictBase) -> int:
+        return int(self.extend(tensordict.unsqueeze(0))[0])
+
+    def extend(self, tensordicts: TensorDictBase) -> torch.Tensor:
+        """Writes a batch of tensordicts to the buffer.
+
+        Args:
+            tensordicts (TensorDictBase): the data to be written, with a single
+                batch dimension.
+
+        Returns:
+            the indices of the data in the buffer.
+
+        """
+        n = len(tensordicts)
+        if not n:
+            raise Exception("extending with empty data is not supported")
+        if self.prioritized:
+            if self.priority_key in tensordicts.keys():
+                priority = tensordicts.get(self.priority_key).reshape(n).double()
+            else:
+                priority = None
+            tensordicts = tensordicts.exclude(self.priority_key)
+        with self._replay_lock:
+            cursor = self._cursor
+            index = (torch.arange(n) + cursor) % self._capacity
+            self._written[0] += n
+            self._storage.set(index, tensordicts)
+            self._seq += 1
+            self._state[0] = (cursor + n) % self._capacity
+            self._state[1] = min(len(self) + n, self._capacity)
+            if self.prioritized:
+                if priority is None:
+                    priority = self._max_priority.expand(n)
+                self._set_priority(index, priority)
+            self._seq += 1
+            self._written[1] = self._written[0]
+        return index
+
+    def _set_priority(self, index: torch.Tensor, priority: torch.Tensor) -> None:
+        self._max_priority.copy_(
+            torch.maximum(self._max_priority, priority.max().view(1))
+        )
+        self._priority[index] = (priority + self._eps) ** self._alpha
+
+    def update_priority(self, tensordict: TensorDictBase) -> None:
+        """Updates the priorities of tensordicts sampled from the buffer.
+
+        Args:
+            tensordict: tensordict with key-value pairs 'self.priority_key'
+                and 'index'.
+
+        """
+        if not self.prioritized:
+            raise RuntimeError(
+                f"Cannot update the priorities of a uniform {self.__class__.__name__}."
+            )
+        index = tensordict.get("index").reshape(-1).long()
+        priority = tensordict.get(self.priority_key).reshape(-1).double()
+        if (priority < 0).any():
+            raise RuntimeError(
+                f"Priority must be a positive value, got "
+                f"{(priority < 0).sum()} negative priority values."
+            )
+        with self._replay_lock:
+            self._seq += 1
+            self._set_priority(index, priority.expand_as(index))
+            self._seq += 1
+
+    def _sample_index(
+        self, batch_size: int
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], int]:
+        # draws the indices (and weights) from a consistent state of the
+        # priorities, and returns the number of completed writes it reflects
+        while True:
+            seq = int(self._seq)
+            if seq % 2:
+                # a writer is modifying the state
+                time.sleep(0)
+                continue
+            written = int(self._written[1])
+            n = len(self)
+            if not n:
+                raise RuntimeError("Cannot sample from an empty replay buffer.")
+            weight = None
+            if self.prioritized:
+                priority = self._priority[:n]
+                cdf = priority.cumsum(0)
+                mass = torch.rand(batch_size, dtype=torch.double) * cdf[-1]
+                index = torch.searchsorted(cdf, mass, right=True).clamp_max_(n - 1)
+                weight = (priority[index] / priority.min()) ** (-self._beta)
+            else:
+                index = torch.randint(n, (batch_size,))
+            if int(self._seq) == seq:
+                return index, weight, written
+
+    def _overwritten(self, index: torch.Tensor, written: int) -> bool:
+        # whether a write started after the written-th one may have modified
+        # the slots of index
+        claimed = int(self._written[0])
+        if claimed - written >= self._capacity:
+            return True
+        if claimed == written:
+            return False
+        return bool(((index - written) % self._capacity < claimed - written).any())
+
+    @pin_memory_output
+    def _sample(self, batch_size: int) -> TensorDictBase:
+        while True:
+            index, weight, written = self._sample_index(batch_size)
+            data = self._storage.get(index)
+            if not self._overwritten(index, written):
+                break
+        data = self._collate_fn(data)
+        if self.prioritized:
+            data.set("index", index)
+            data.set("_weight", weight.to(torch.float))
+        return data
+
+    def sample(self, batch_size: int) -> TensorDictBase:
+        """Samples a batch of data from the replay buffer.
+
+        Args:
+            batch_size (int): size of the batch.
+
+        Returns:
+            A batch of data randomly selected in the replay buffer. If the
+            buffer is prioritized, the batch contains its indices in an
+            :obj:`"index"` entry and its importance sampling weights in a
+            :obj:`"_weight"` entry.
+
+        """
+        return self._sample(batch_size)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # process-local members
+        del state["_future_lock"]
+        state["_prefetch_fut"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._future_lock = threading.RLock()
+        self._prefetch_fut = collections.deque()
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(size={len(self)}, "
+            f"prioritized={self.prioritized}, pin_memory={self._pin_memory})"
+        )
+
+
+def _cat_samples(samples: List[Any]) -> Any:
+    if len(samples) == 1:
+        return samples[0]
+    if isinstance(samples[0], tuple):
+        return tuple(_cat_samples(list(_samples)) for _samples in zip(*samples))
+    return torch.cat(samples, 0)
+
+
+def _reorder(data: Any, order: torch.Tensor) -> Any:
+    if isinstance(data, tuple):
+        return tuple(_reorder(_data, order) for _data in data)
+    if isinstance(data, TensorDictBase):
+        return data[order].to_tensordict()
+    return data[order]
+
+
+class ShardedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer split in independent shards.
+
+    Each shard is a replay buffer with its own storage, cursor and lock (and
+    segment trees if prioritized), such that several threads can write in the
+    buffer concurrently. Writes are dispatched to the shards in a round-robin
+    fashion. At sampling time, the number of items drawn from each shard is
+    proportional to its length, or to its total priority if the shards are
+    prioritized replay buffers.
+
+    Indices returned by :obj:`add`, :obj:`extend` and :obj:`sample` are global,
+    i.e. the index of an item stored at position `i` of the shard `k` is
+    `i + sum(shard.capacity for shard in shards[:k])`.
+
+    Args:
+        shards (sequence of ReplayBuffer): the shards of the buffer. They must
+            all be of the same type and must not pin memory or prefetch
+            themselves.
+        pin_memory (bool): whether pin_memory() should be called on the rb
+            samples.
+        prefetch (int, optional): number of next batches to be prefetched
+            using multithreading.
+
+    Examples:
+        >>> rb = ShardedReplayBuffer(
+        ...     [TensorDictReplayBuffer(1000, storage=LazyTensorStorage(1000))
+        ...         for _ in range(4)])
+        >>> rb.extend(TensorDict({"a": torch.randn(10, 3)}, [10]))
+        >>> print(rb.sample(5).shape)
+        torch.Size([5])
+
+    """
+
+    def __init__(
+        self,
+        shards: Sequence[ReplayBuffer],
+        pin_memory: bool = False,
+        prefetch: Optional[int] = None,
+    ) -> None:
+        if not len(shards):
+            raise ValueError("ShardedReplayBuffer requires at least one shard.")
+        if len({type(shard) for shard in shards}) != 1:
+            raise ValueError("All the shards must be of the same type.")
+        if any(shard._pin_memory or shard._prefetch for shard in shards):
+            raise ValueError(
+                "The shards of a ShardedReplayBuffer must not pin memory or "
+                "prefetch. Pass these arguments to the ShardedReplayBuffer "
+                "instead."
+            )
+        self._shards = list(shards)
+        self._prioritized = isinstance(shards[0], PrioritizedReplayBuffer)
+        if self._prioritized and (
+            len({(shard.alpha, shard.beta) for shard in shards}) != 1
+        ):
+            raise ValueError("All the shards must have the same alpha and beta.")
+        self._offsets = [0] + list(
+            itertools.accumulate(shard.capacity for shard in shards)
+        )
+        super().__init__(
+            self._offsets[-1],
+            collate_fn=_cat_samples,
+            pin_memory=pin_memory,
+            prefetch=prefetch,
+        )
+        self._storage = None
+        self._shard_counter = itertools.count()
+
+    @property
+    def shards(self) -> List[ReplayBuffer]:
+        return self._shards
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._shards)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    @property
+    def cursor(self) -> int:
+        raise RuntimeError("ShardedReplayBuffer has one cursor per shard.")
+
+    def _split_index(
+        self, index: Union[int, Tensor]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        index = torch.as_tensor(index, dtype=torch.long, device="cpu").reshape(-1)
+        offsets = torch.tensor(self._offsets[1:-1], dtype=torch.long)
+        shard_index = torch.bucketize(index, offsets, right=True)
+        return shard_index, index - torch.tensor(self._offsets)[shard_index]
+
+    @pin_memory_output
+    def __getitem__(self, index: Union[int, Tensor]) -> Any:
+        if isinstance(index, INT_CLASSES):
+            shard_index, local_index = self._split_index(index)
+            return self._shards[shard_index.item()][local_index.item()]
+        shard_index, local_index = self._split_index(index)
+        shards = shard_index.unique().tolist()
+        data = self._collate_fn(
+            [self._shards[k][local_index[shard_index == k]] for k in shards]
+        )
+        # items are grouped by shard, we put them back in the order of the index
+        order = torch.cat([(shard_index == k).nonzero().squeeze(-1) for k in shards])
+        return _reorder(data, torch.argsort(order))
+
+    def _next_shard(self) -> int:
+        # itertools.count is thread-safe, hence concurrent writers are
+        # dispatched to different shards without taking any lock
+        return next(self._shard_counter) % len(self._shards)
+
+    def add(self, data: Any, *args, **kwargs) -> int:
+        """Adds a single element to one of the shards.
+
+        Args:
+            data (Any): data to be added to the replay buffer
+            *args, **kwargs: other arguments passed to the shard
+                (e.g. the priority for prioritized shards).
+
+        Returns:
+            global index where the data lives in the replay buffer.
+        """
+        k = self._next_shard()
+        index = self._shards[k].add(data, *args, **kwargs)
+        return index + self._offsets[k]
+
+    def extend(self, data: Sequence[Any], *args, **kwargs) -> Any:
+        """Extends one of the shards with the elements contained in an
+        iterable.
+
+        Args:
+            data (iterable): collection of data to be added to the replay
+                buffer.
+            *args, **kwargs: other arguments passed to the shard
+                (e.g. the priorities for prioritized shards).
+
+        Returns:
+            global indices of the data added to the replay buffer.
+        """
+        k = self._next_shard()
+        index = self._shards[k].extend(data, *args, **kwargs)
+        return index + self._offsets[k]
+
+    def _shard_mass(self) -> torch.Tensor:
+        if self._prioritized:
+            return torch.tensor(
+                [
+                    shard._sum_tree.query(0, shard.capacity) if len(shard) else 0.0
+                    for shard in self._shards
+                ],
+                dtype=torch.double,
+            )
+        return torch.tensor(
+            [len(shard) for shard in self._shards], dtype=torch.double
+        )
+
+    @pin_memory_output
+    def _sample(self, batch_size: int) -> Any:
+        mass = self._shard_mass()
+        if not (mass > 0).any():
+            raise RuntimeError("Cannot sample from an empty ShardedReplayBuffer.")
+        counts = torch.bincount(
+            torch.multinomial(mass, batch_size, replacement=True),
+            minlength=len(self._shards),
+        ).tolist()
+        samples = []
+        indices = []
+        for k, (shard, count) in enumerate(zip(self._shards, counts)):
+            if not count:
+                continue
+            sample = shard._sample(count)
+            if self._prioritized:
+                sample, _, index = sample
+                indices.append((k, index))
+            samples.append(sample)
+        data = self._collate_fn(samples)
+        if not self._prioritized:
+            return data
+
+        # importance sampling weights are normalized by the global min priority
+        p_min = min(
+            shard._min_tree.query(0, shard.capacity)
+            for shard in self._shards
+            if len(shard)
+        )
+        weight = torch.cat(
+            [self._shards[k]._sum_tree[index] for k, index in indices], 0
+        )
+        weight = torch.pow(weight / p_min, -self._shards[0].beta)
+        index = torch.cat([index + self._offsets[k] for k, index in indices], 0)
+        if isinstance(data, TensorDictBase):
+            data.set("index", index)
+        device = data.device if hasattr(data, "device") else torch.device("cpu")
+        weight = to_torch(weight, device, self._pin_memory)
+        return data, weight, index
+
+    def update_priority(
+        self, index: Union[int, Tensor], priority: Union[float, Tensor]
+    ) -> None:
+        """Updates the priority of the data pointed by the global index.
+
+        Args:
+            index (int or torch.Tensor): global indexes of the priorities to
+                be updated.
+            priority (Number or torch.Tensor): new priorities of the
+                indexed elements.
+
+        """
+        if not self._prioritized:
+            raise RuntimeError(
+                "update_priority can only be called on ShardedReplayBuffer "
+                "instances with prioritized shards."
+            )
+        shard_index, local_index = self._split_index(index)
+        priority = torch.as_tensor(priority).reshape(-1)
+        if priority.numel() == 1:
+            priority = priority.expand(local_index.numel())
+        elif priority.numel() != local_index.numel():
+            raise RuntimeError(
+                "priority should be a number or an iterable of the same "
+                "length as index"
+            )
+        for k in shard_index.unique().tolist():
+            mask = shard_index == k
+            self._shards[k]._update_priority(local_index[mask], priority[mask])
+
+    def __repr__(self) -> str:
+        string = (
+            f"{type(self).__name__}(size={len(self)}, "
+            f"num_shards={self.num_shards}, "
+            f"pin_memory={self._pin_memory})"
+        )
+        return string
+
+
 def create_replay_buffer(
     size: int,
     device: Optional[DEVICE_TYPING] = None,
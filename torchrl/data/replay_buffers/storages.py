@@ -1,14 +1,31 @@
+from __future__ import annotations
+
 import abc
+import functools
+import json
 import os
-from typing import Any, Sequence, Union
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import torch
 
 from torchrl.data.replay_buffers.utils import INT_CLASSES
-from torchrl.data.tensordict.memmap import MemmapTensor
+from torchrl.data.utils import torch_to_numpy_dtype_dict
+from torchrl.data.tensordict.memmap import MemmapArena, MemmapTensor
 from torchrl.data.tensordict.tensordict import TensorDictBase, TensorDict
 
-__all__ = ["Storage", "ListStorage", "LazyMemmapStorage", "LazyTensorStorage"]
+__all__ = [
+    "Storage",
+    "ListStorage",
+    "LazyMemmapStorage",
+    "LazyTensorStorage",
+    "CompressedStorage",
+    "FrameStackStorage",
+]
 
 
 class Storage:
@@ -30,6 +47,14 @@ class Storage:
     def get(self, index: int) -> Any:
         raise NotImplementedError
 
+    def sample_index(self, batch_size: int) -> Union[np.ndarray, torch.Tensor]:
+        """Draws a random index of size `batch_size` uniformly in the storage.
+
+        Storages that can be indexed with tensors should override this method
+        to avoid numpy round-trips.
+        """
+        return np.random.randint(0, len(self), size=batch_size)
+
     def __getitem__(self, item):
         return self.get(item)
 
@@ -144,13 +169,46 @@ class LazyTensorStorage(Storage):
             raise RuntimeError(
                 "Cannot get an item from an unitialized LazyMemmapStorage"
             )
+        if not isinstance(index, (INT_CLASSES, slice)):
+            # tensor and sequence indices are gathered key by key, which
+            # results in a contiguous batch that does not need to be collated
+            index = torch.as_tensor(index, dtype=torch.long, device=self.device)
+            return _gather(self._storage, index)
         out = self._storage[index]
         return out
 
+    def sample_index(self, batch_size: int) -> torch.Tensor:
+        """Draws a random index of size `batch_size` on the storage device.
+
+        Args:
+            batch_size (int): number of indices to draw.
+
+        Returns:
+            a `torch.long` tensor of indices in `[0, len(self))`.
+
+        """
+        return torch.randint(len(self), (batch_size,), device=self.device)
+
     def __len__(self):
         return self._len
 
 
+def _gather(
+    data: Union[TensorDictBase, torch.Tensor, MemmapTensor], index: torch.Tensor
+) -> Union[TensorDictBase, torch.Tensor]:
+    """Indexes a pre-allocated storage along its first dimension with a
+    single gather per leaf tensor, and returns the result as a regular
+    TensorDict (or tensor)."""
+    if isinstance(data, TensorDictBase):
+        return TensorDict(
+            {key: _gather(value, index) for key, value in data.items()},
+            batch_size=torch.Size([*index.shape, *data.batch_size[1:]]),
+            device=data._device_safe(),
+            _run_checks=False,
+        )
+    return data[index]
+
+
 class LazyMemmapStorage(LazyTensorStorage):
     """A memory-mapped storage for tensors and tensordicts.
 
@@ -160,9 +218,35 @@ class LazyMemmapStorage(LazyTensorStorage):
         scratch_dir (str or path): directory where memmap-tensors will be written.
         device (torch.device, optional): device where the sampled tensors will be
             stored and sent. Default is `torch.device("cpu")`.
+        persistent (bool, optional): if True, the memmap-tensors are written
+            in `scratch_dir` under names derived from their keys and are not
+            deleted when the storage is. A manifest (`meta.json`) describing
+            the keys, shapes and dtypes of the stored data is written
+            alongside and can be updated with :obj:`save_metadata`, such that
+            the storage can be re-opened with :obj:`LazyMemmapStorage.load`.
+            Requires `scratch_dir` to be set. Default is `False`.
+        layout (str, optional): layout of the memmap-tensors of a tensordict
+            storage: `"files"` (one file per key), `"packed"` (a single file
+            in which the keys are stored one after the other) or
+            `"interleaved"` (a single file in which the entries of all the
+            keys at a given index of the storage are contiguous, such that
+            sampling an index reads contiguous pages). See
+            :obj:`MemmapArena`. Persistent storages only support `"files"`.
+            Default is `"files"`.
+
+    Examples:
+        >>> storage = LazyMemmapStorage(1000, scratch_dir="/tmp/rb", persistent=True)
+        >>> rb = TensorDictReplayBuffer(1000, storage=storage)
+        >>> rb.extend(TensorDict({"obs": torch.randn(10, 3)}, [10]))
+        >>> rb.checkpoint()
+        >>> # after a restart
+        >>> rb = TensorDictReplayBuffer(1000, storage=LazyMemmapStorage.load("/tmp/rb"))
+        >>> assert len(rb) == 10
     """
 
-    def __init__(self, size, scratch_dir=None, device=None):
+    def __init__(
+        self, size, scratch_dir=None, device=None, persistent=False, layout="files"
+    ):
         self.size = int(size)
         self.initialized = False
         self.scratch_dir = None
@@ -170,10 +254,33 @@ class LazyMemmapStorage(LazyTensorStorage):
             self.scratch_dir = str(scratch_dir)
             if self.scratch_dir[-1] != "/":
                 self.scratch_dir += "/"
+        elif persistent:
+            raise ValueError("A persistent LazyMemmapStorage requires a scratch_dir.")
+        if layout not in ("files", "packed", "interleaved"):
+            raise ValueError(
+                "layout must be one of 'files', 'packed' or 'interleaved', "
+                f"got {layout}."
+            )
+        if persistent and layout != "files":
+            raise ValueError(
+                "Persistent LazyMemmapStorage instances only support the "
+                "'files' layout."
+            )
+        self.layout = layout
         self.device = device if device else torch.device("cpu")
+        self.persistent = persistent
+        self.metadata = {}
         self._len = 0
 
     def _init(self, data: Union[TensorDictBase, torch.Tensor]) -> None:
+        if self.persistent:
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            self._storage = _make_persistent_memmap(
+                data, self.size, self.device, self.scratch_dir
+            )
+            self.initialized = True
+            self.save_metadata()
+            return
         print("Creating a MemmapStorage...")
         if isinstance(data, torch.Tensor):
             # if Tensor, we just create a MemmapTensor of the desired shape, device and dtype
@@ -184,6 +291,20 @@ class LazyMemmapStorage(LazyTensorStorage):
             print(
                 f"The storage was created in {out.filename} and occupies {filesize} Mb of storage."
             )
+        elif self.layout != "files":
+            out = _make_arena_memmap(
+                data,
+                self.size,
+                self.device,
+                self.scratch_dir,
+                interleaved=self.layout == "interleaved",
+            )
+            filename = next(iter(_memmap_leaves(out))).filename
+            filesize = os.path.getsize(filename) / 1024 / 1024
+            print(
+                f"The storage was created in {filename} and occupies "
+                f"{filesize} Mb of storage."
+            )
         else:
             out = TensorDict({}, [self.size, *data.shape])
             print("The storage is being created: ")
@@ -209,3 +330,674 @@ class LazyMemmapStorage(LazyTensorStorage):
                 )
         self._storage = out
         self.initialized = True
+
+    def save_metadata(self, **metadata) -> None:
+        """Flushes the memmap-tensors on disk and writes the manifest of a
+        persistent storage.
+
+        Args:
+            **metadata: additional json-serializable entries to be saved with
+                the manifest (e.g. the cursor of the replay buffer). They can
+                be retrieved with `storage.metadata` once the storage is
+                re-opened.
+
+        """
+        if not self.persistent:
+            raise RuntimeError(
+                "save_metadata can only be called on persistent storages."
+            )
+        self.metadata.update(metadata)
+        manifest = {
+            "size": self.size,
+            "len": int(self._len),
+            "metadata": self.metadata,
+        }
+        if self.initialized:
+            manifest["data"] = _memmap_manifest(self._storage, self.scratch_dir)
+            for memmap in _memmap_leaves(self._storage):
+                memmap.memmap_array.flush()
+        # the manifest is written in a temporary file first such that a crash
+        # cannot leave a corrupted manifest behind
+        filename = os.path.join(self.scratch_dir, MEMMAP_STORAGE_MANIFEST)
+        with open(filename + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(filename + ".tmp", filename)
+
+    @classmethod
+    def load(cls, scratch_dir: str, device=None) -> LazyMemmapStorage:
+        """Re-opens a persistent storage from its directory.
+
+        The memmap-tensors are mapped in memory without being read or copied.
+
+        Args:
+            scratch_dir (str or path): directory of the persistent storage.
+            device (torch.device, optional): device where the sampled tensors
+                will be sent. Default is `torch.device("cpu")`.
+
+        """
+        with open(os.path.join(str(scratch_dir), MEMMAP_STORAGE_MANIFEST)) as f:
+            manifest = json.load(f)
+        storage = cls(
+            manifest["size"], scratch_dir=scratch_dir, device=device, persistent=True
+        )
+        storage.metadata = manifest["metadata"]
+        if "data" in manifest:
+            storage._storage = _load_memmap_manifest(
+                manifest["data"], storage.size, storage.device, storage.scratch_dir
+            )
+            storage._len = manifest["len"]
+            storage.initialized = True
+        return storage
+
+
+class CompressedStorage(Storage):
+    """A storage that keeps its elements zlib-compressed in memory.
+
+    Each leaf tensor of an element is compressed independently when it is
+    written, and the elements of a batch are decompressed by a pool of
+    threads when they are read (zlib releases the GIL). Pixel observations,
+    stacked frames in particular, usually compress well, which allows the
+    buffer to hold several times more transitions than a
+    :obj:`LazyTensorStorage` for the same amount of RAM.
+
+    Reading a list or tensor of indices returns a contiguous batch (a tensor
+    or a :obj:`TensorDict` whose first dimension matches the index), which
+    does not need to be collated.
+
+    Args:
+        size (int): size of the storage, i.e. maximum number of elements stored
+            in the buffer.
+        compression_level (int, optional): zlib compression level, from 0
+            (no compression) to 9 (best compression). Default is 1, which
+            favours speed.
+        num_threads (int, optional): number of threads used to compress and
+            decompress batches of elements. Default is 4.
+
+    Examples:
+        >>> storage = CompressedStorage(1000)
+        >>> rb = ReplayBuffer(1000, storage=storage)
+        >>> rb.extend(torch.zeros(100, 4, 84, 84, dtype=torch.uint8))
+        >>> rb.sample(32).shape
+        torch.Size([32, 4, 84, 84])
+        >>> storage.stats()["compression_ratio"] > 1
+        True
+
+    """
+
+    def __init__(self, size: int, compression_level: int = 1, num_threads: int = 4):
+        if not 0 <= compression_level <= 9:
+            raise ValueError(
+                f"compression_level must be in [0, 9], got {compression_level}."
+            )
+        self.size = int(size)
+        self.compression_level = compression_level
+        self.num_threads = num_threads
+        self._storage = [None] * self.size
+        self._spec = None
+        self._len = 0
+        self._executor = None
+        self._stats_lock = threading.Lock()
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        self._encode_time = 0.0
+        self._decode_time = 0.0
+
+    @property
+    def initialized(self) -> bool:
+        return self._spec is not None
+
+    def _map(self, fun, iterable) -> List[Any]:
+        iterable = list(iterable)
+        if self.num_threads <= 1 or len(iterable) <= 1:
+            return [fun(item) for item in iterable]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        return list(self._executor.map(fun, iterable))
+
+    def _encode(
+        self, data: Union[TensorDictBase, torch.Tensor]
+    ) -> Union[Dict[str, Any], bytes]:
+        if isinstance(data, TensorDictBase):
+            return {key: self._encode(value) for key, value in data.items()}
+        array = data.detach().cpu().contiguous().numpy()
+        return zlib.compress(array.tobytes(), self.compression_level)
+
+    def _encode_item(self, item: Tuple[int, Any]) -> Tuple[int, Any, int, float]:
+        cursor, data = item
+        t0 = time.perf_counter()
+        encoded = self._encode(data)
+        return cursor, encoded, _compressed_nbytes(encoded), time.perf_counter() - t0
+
+    def _decode_item(
+        self, out: Union[TensorDictBase, torch.Tensor], item: Tuple[int, int]
+    ) -> float:
+        i, index = item
+        t0 = time.perf_counter()
+        encoded = self._storage[index]
+        if encoded is None:
+            raise RuntimeError(f"The element at index {index} has not been written.")
+        _decompress_into(encoded, self._spec, out, i)
+        return time.perf_counter() - t0
+
+    def set(
+        self,
+        cursor: Union[int, Sequence[int], slice],
+        data: Union[TensorDictBase, torch.Tensor, Sequence[Any]],
+    ):
+        if isinstance(cursor, INT_CLASSES):
+            items = [(cursor, data)]
+        else:
+            if isinstance(cursor, slice):
+                cursor = range(*cursor.indices(self.size))
+            items = list(zip(cursor, data))
+        if not items:
+            return
+        if not self.initialized:
+            self._spec = _compressed_spec(items[0][1])
+        for _cursor, _ in items:
+            if not 0 <= _cursor < self.size:
+                raise IndexError(
+                    f"Index {_cursor} is out of bounds for a storage of size "
+                    f"{self.size}."
+                )
+        encoded_items = self._map(self._encode_item, items)
+        with self._stats_lock:
+            for _cursor, encoded, nbytes, elapsed in encoded_items:
+                previous = self._storage[_cursor]
+                if previous is None:
+                    self._raw_bytes += _spec_nbytes(self._spec)
+                else:
+                    self._compressed_bytes -= _compressed_nbytes(previous)
+                self._storage[_cursor] = encoded
+                self._compressed_bytes += nbytes
+                self._encode_time += elapsed
+                self._len = max(self._len, _cursor + 1)
+
+    def get(self, index: Union[int, Sequence[int], slice]) -> Any:
+        if not self.initialized:
+            raise RuntimeError(
+                "Cannot get an item from an unitialized CompressedStorage"
+            )
+        if isinstance(index, INT_CLASSES):
+            return self.get([index])[0]
+        if isinstance(index, slice):
+            index = range(*index.indices(len(self)))
+        elif isinstance(index, torch.Tensor):
+            index = index.tolist()
+        elif isinstance(index, np.ndarray):
+            index = index.tolist()
+        index = list(index)
+        out = _empty_from_spec(self._spec, len(index))
+        # each decoding thread writes a distinct row of the output
+        elapsed = self._map(functools.partial(self._decode_item, out), enumerate(index))
+        with self._stats_lock:
+            self._decode_time += sum(elapsed)
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the compression statistics of the storage.
+
+        The dictionary contains the total size of the stored elements before
+        (:obj:`"raw_bytes"`) and after (:obj:`"compressed_bytes"`)
+        compression, their ratio (:obj:`"compression_ratio"`), and the total
+        time in seconds spent compressing (:obj:`"encode_time"`) and
+        decompressing (:obj:`"decode_time"`) elements, summed over threads.
+        """
+        with self._stats_lock:
+            return {
+                "raw_bytes": self._raw_bytes,
+                "compressed_bytes": self._compressed_bytes,
+                "compression_ratio": self._raw_bytes / max(self._compressed_bytes, 1),
+                "encode_time": self._encode_time,
+                "decode_time": self._decode_time,
+            }
+
+    def __len__(self):
+        return self._len
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        del state["_stats_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def __del__(self):
+        if getattr(self, "_executor", None) is not None:
+            self._executor.shutdown(wait=False)
+
+
+def _first_match(
+    frames: torch.Tensor, candidates: torch.Tensor, strict: bool = False
+) -> List[List[int]]:
+    """For each frame :obj:`frames[i, j]`, returns the smallest :obj:`k` such
+    that :obj:`candidates[i, k]` is equal to it (with :obj:`k < j` if
+    :obj:`strict`), or -1 if there is none.
+
+    All the :obj:`N * N` pairs of frames of each transition are compared, one
+    candidate slice at a time across the whole batch, which takes
+    :obj:`O(n * N^2 * frame_size)` operations and :obj:`O(n * N * frame_size)`
+    temporary memory.
+    """
+    n, N = frames.shape[:2]
+    out = torch.full((n, N), -1, dtype=torch.long, device=frames.device)
+    j = torch.arange(N, device=frames.device)
+    for k in reversed(range(N)):
+        match = (frames == candidates[:, k : k + 1]).all(-1)
+        if strict:
+            match &= j > k
+        out.masked_fill_(match, k)
+    return out.tolist()
+
+
+def _compressed_spec(data: Union[TensorDictBase, torch.Tensor]) -> Dict[str, Any]:
+    if isinstance(data, TensorDictBase):
+        return {
+            "batch_size": data.batch_size,
+            "keys": {key: _compressed_spec(value) for key, value in data.items()},
+        }
+    return {"shape": data.shape, "dtype": data.dtype}
+
+
+def _spec_nbytes(spec: Dict[str, Any]) -> int:
+    if "keys" in spec:
+        return sum(_spec_nbytes(value) for value in spec["keys"].values())
+    return spec["shape"].numel() * torch.tensor([], dtype=spec["dtype"]).element_size()
+
+
+def _compressed_nbytes(encoded: Union[Dict[str, Any], bytes]) -> int:
+    if isinstance(encoded, dict):
+        return sum(_compressed_nbytes(value) for value in encoded.values())
+    return len(encoded)
+
+
+def _empty_from_spec(
+    spec: Dict[str, Any], n: int
+) -> Union[TensorDictBase, torch.Tensor]:
+    if "keys" in spec:
+        return TensorDict(
+            {key: _empty_from_spec(value, n) for key, value in spec["keys"].items()},
+            batch_size=[n, *spec["batch_size"]],
+            _run_checks=False,
+        )
+    return torch.empty(n, *spec["shape"], dtype=spec["dtype"])
+
+
+def _decompress_into(
+    encoded: Union[Dict[str, Any], bytes],
+    spec: Dict[str, Any],
+    out: Union[TensorDictBase, torch.Tensor],
+    i: int,
+) -> None:
+    if "keys" in spec:
+        for key, value in spec["keys"].items():
+            _decompress_into(encoded[key], value, out.get(key), i)
+        return
+    array = np.frombuffer(
+        zlib.decompress(encoded), dtype=torch_to_numpy_dtype_dict[spec["dtype"]]
+    )
+    out[i].numpy()[...] = array.reshape(spec["shape"])
+
+
+class FrameStackStorage(Storage):
+    """A tensordict storage that stores each frame of stacked pixel observations once.
+
+    When observations are stacked with :obj:`CatFrames`, every transition
+    holds an observation and a next observation that are each :obj:`N` frames
+    deep, and a given frame is repeated up to :obj:`2 * N` times across
+    consecutive transitions. This storage keeps the frames in a ring buffer
+    and, for each transition, the indices of the frames composing its two
+    stacks. The stacks are rebuilt with a single gather when the storage is
+    read. The other entries of the transitions are kept in a
+    :obj:`LazyTensorStorage`.
+
+    A frame is reused only if it is equal to the one it replaces, hence the
+    stacks are always restored exactly. Frames are reused across the slices of
+    a stack (:obj:`CatFrames` pads the stacks with copies of a frame at the
+    beginning of an episode), between the next observation of a transition
+    and the observation of the following step of the same trajectory, and
+    between the observation and the next observation of a transition. Steps of
+    a trajectory are identified by their :obj:`"traj_ids"` entry if it is
+    present (as in the collectors' outputs), and must be written in
+    chronological order. Trajectories are not continued after a step whose
+    :obj:`"done"` entry is :obj:`True`.
+
+    Writes are more expensive than reads: the frames of each transition are
+    compared pairwise (:obj:`4 * N^2` frame comparisons per transition,
+    batched across the transitions) and the frame indices are then assigned
+    by a Python loop over the transitions, as they depend on the previous
+    steps of the same trajectory.
+
+    Args:
+        size (int): size of the storage, i.e. maximum number of transitions
+            stored in the buffer.
+        N (int, optional): number of frames in a stack. Default is `4`.
+        cat_dim (int, optional): negative dimension along which the frames
+            are stacked. Default is `-3`.
+        key (str, optional): key of the stacked observation. Default is
+            `"pixels"`.
+        next_key (str, optional): key of the stacked next observation.
+            Default is `"next_pixels"`.
+        frame_capacity (int, optional): number of frames that can be stored.
+            It must exceed the number of frames written while :obj:`size`
+            transitions are collected, which is slightly more than
+            :obj:`size` (one new frame per transition, plus a few per new
+            trajectory). Default is :obj:`size + size // 2`.
+        device (torch.device, optional): device where the frames and sampled
+            tensordicts will be stored. Default is `torch.device("cpu")`.
+
+    Examples:
+        >>> storage = FrameStackStorage(100_000, N=4)
+        >>> rb = TensorDictReplayBuffer(100_000, storage=storage)
+        >>> rb.extend(collector_output.view(-1))
+        >>> rb.sample(32).get("pixels").shape
+        torch.Size([32, 4, 84, 84])
+
+    """
+
+    def __init__(
+        self,
+        size: int,
+        N: int = 4,
+        cat_dim: int = -3,
+        key: str = "pixels",
+        next_key: str = "next_pixels",
+        frame_capacity: Optional[int] = None,
+        device: Optional[torch.device] = None,
+    ):
+        if cat_dim >= 0:
+            raise ValueError(f"cat_dim must be negative, got {cat_dim}.")
+        self.size = int(size)
+        self.N = N
+        self.cat_dim = cat_dim
+        self.key = key
+        self.next_key = next_key
+        self.frame_capacity = (
+            int(frame_capacity) if frame_capacity is not None else size + size // 2
+        )
+        self.device = device if device else torch.device("cpu")
+        self._storage = LazyTensorStorage(size, device=self.device)
+        # indices of the frames of the stacks of each transition: the first
+        # row holds the observation, the second the next observation
+        self._frame_index = torch.zeros(
+            size, 2, N, dtype=torch.long, device=self.device
+        )
+        self._frames = None
+        self._frame_count = 0
+        self._last_stacks = {}
+
+    @property
+    def initialized(self) -> bool:
+        return self._frames is not None
+
+    def _split(self, stacks: torch.Tensor) -> torch.Tensor:
+        # [B, ..., N * C, ...] -> [B, N, ..., C, ...]
+        stacks = stacks.unflatten(self.cat_dim, (self.N, -1))
+        return stacks.movedim(self.cat_dim - 1, 1)
+
+    def _merge(self, frames: torch.Tensor) -> torch.Tensor:
+        frames = frames.movedim(1, self.cat_dim - 1)
+        return frames.flatten(self.cat_dim - 1, self.cat_dim)
+
+    def _alive(self, frame_index: torch.Tensor, frame_count: int) -> bool:
+        return frame_index.min().item() >= frame_count - self.frame_capacity
+
+    def set(self, cursor: Union[int, Sequence[int], slice], data: TensorDictBase):
+        if not isinstance(data, TensorDictBase):
+            raise TypeError(
+                f"{self.__class__.__name__} only supports tensordicts, got "
+                f"{type(data)}."
+            )
+        if isinstance(cursor, INT_CLASSES):
+            cursor = [cursor]
+            data = data.unsqueeze(0)
+        elif isinstance(cursor, slice):
+            cursor = range(*cursor.indices(self.size))
+        cursor = torch.as_tensor(cursor, dtype=torch.long, device=self.device)
+        if data.batch_dims != 1:
+            raise RuntimeError(
+                f"{self.__class__.__name__} expects a batch of transitions with a "
+                f"single batch dimension, got batch_size={data.batch_size}."
+            )
+        obs = self._split(data.get(self.key).to(self.device))
+        next_obs = self._split(data.get(self.next_key).to(self.device))
+        n = obs.shape[0]
+        if "traj_ids" in data.keys():
+            traj_ids = data.get("traj_ids").reshape(n).tolist()
+        else:
+            traj_ids = [0] * n
+        if "done" in data.keys():
+            done = data.get("done").reshape(n).tolist()
+        else:
+            done = [False] * n
+
+        # frame-level equalities within each transition, computed at once
+        flat_obs = obs.flatten(2)
+        flat_next_obs = next_obs.flatten(2)
+        obs_in_obs = _first_match(flat_obs, flat_obs, strict=True)
+        next_in_obs = _first_match(flat_next_obs, flat_obs)
+        next_in_next = _first_match(flat_next_obs, flat_next_obs, strict=True)
+
+        # the frame indices are computed before anything is written, such that
+        # a write that would overwrite live frames leaves the storage untouched
+        frame_count = self._frame_count
+        frame_index = []
+        new_frames = []  # (frame index, position in the flattened [n, 2, N] frames)
+        last_step = {}  # position in the batch of the last step of each trajectory
+        last_stacks = self._last_stacks
+        for i in range(n):
+            traj = traj_ids[i]
+            obs_index = None
+            if traj in last_step:
+                if torch.equal(obs[i], next_obs[last_step[traj]]):
+                    obs_index = frame_index[last_step[traj]][1]
+            elif traj in last_stacks:
+                candidate = torch.as_tensor(last_stacks[traj], device=self.device)
+                if self._alive(candidate, frame_count) and torch.equal(
+                    self._frames[candidate % self.frame_capacity], obs[i]
+                ):
+                    obs_index = last_stacks[traj]
+            if obs_index is None:
+                obs_index = []
+                for j in range(self.N):
+                    if obs_in_obs[i][j] >= 0:
+                        obs_index.append(obs_index[obs_in_obs[i][j]])
+                    else:
+                        obs_index.append(frame_count)
+                        new_frames.append((frame_count, 2 * i * self.N + j))
+                        frame_count += 1
+            next_obs_index = []
+            for j in range(self.N):
+                if next_in_obs[i][j] >= 0:
+                    next_obs_index.append(obs_index[next_in_obs[i][j]])
+                elif next_in_next[i][j] >= 0:
+                    next_obs_index.append(next_obs_index[next_in_next[i][j]])
+                else:
+                    next_obs_index.append(frame_count)
+                    new_frames.append((frame_count, (2 * i + 1) * self.N + j))
+                    frame_count += 1
+            frame_index.append((obs_index, next_obs_index))
+            if done[i]:
+                last_step.pop(traj, None)
+            else:
+                last_step[traj] = i
+        frame_index = torch.tensor(frame_index, dtype=torch.long, device=self.device)
+
+        # the transitions kept after this write must not reference frames that
+        # the new ones overwrite
+        kept = torch.ones(
+            max(len(self), cursor.max().item() + 1),
+            dtype=torch.bool,
+            device=self.device,
+        )
+        kept[cursor] = False
+        oldest_frame = torch.cat(
+            [frame_index.view(-1), self._frame_index[: kept.numel()][kept].view(-1)]
+        ).min()
+        if oldest_frame < frame_count - self.frame_capacity:
+            raise RuntimeError(
+                f"The frames of some transitions of the {self.__class__.__name__} "
+                f"would be overwritten: the frame capacity "
+                f"({self.frame_capacity}) is too small for this storage size."
+            )
+
+        if not self.initialized:
+            self._frames = torch.zeros(
+                self.frame_capacity,
+                *obs.shape[2:],
+                dtype=obs.dtype,
+                device=self.device,
+            )
+        if new_frames:
+            dest, source = zip(*new_frames)
+            dest = torch.tensor(dest, dtype=torch.long, device=self.device)
+            source = torch.tensor(source, dtype=torch.long, device=self.device)
+            all_frames = torch.stack([obs, next_obs], 1).flatten(0, 2)
+            self._frames[dest % self.frame_capacity] = all_frames[source]
+        self._frame_index[cursor] = frame_index
+        self._frame_count = frame_count
+        # the last stack of each unfinished trajectory can be continued by the
+        # next call
+        self._last_stacks = {
+            traj: frame_index[i, 1].tolist() for traj, i in last_step.items()
+        }
+        self._storage.set(cursor, data.exclude(self.key, self.next_key))
+
+    def get(self, index: Union[int, Sequence[int], slice]) -> TensorDictBase:
+        if not self.initialized:
+            raise RuntimeError(
+                f"Cannot get an item from an unitialized {self.__class__.__name__}"
+            )
+        if isinstance(index, INT_CLASSES):
+            return self.get([index])[0]
+        if isinstance(index, slice):
+            index = range(*index.indices(len(self)))
+        index = torch.as_tensor(index, dtype=torch.long, device=self.device)
+        out = self._storage.get(index)
+        frames = self._frames[self._frame_index[index] % self.frame_capacity]
+        out.set(self.key, self._merge(frames[:, 0]))
+        out.set(self.next_key, self._merge(frames[:, 1]))
+        return out
+
+    def sample_index(self, batch_size: int) -> torch.Tensor:
+        return self._storage.sample_index(batch_size)
+
+    def __len__(self):
+        return len(self._storage)
+
+
+MEMMAP_STORAGE_MANIFEST = "meta.json"
+
+
+def _make_persistent_memmap(
+    data: Union[TensorDictBase, torch.Tensor],
+    size: int,
+    device: torch.device,
+    dirname: str,
+    key: str = "storage",
+) -> Union[TensorDictBase, MemmapTensor]:
+    if isinstance(data, torch.Tensor):
+        return MemmapTensor(
+            size,
+            *data.shape,
+            device=device,
+            dtype=data.dtype,
+            filename=os.path.join(dirname, f"{key}.memmap"),
+        )
+    return TensorDict(
+        {
+            _key: _make_persistent_memmap(
+                value,
+                size,
+                device,
+                dirname,
+                _key if key == "storage" else f"{key}.{_key}",
+            )
+            for _key, value in data.items()
+        },
+        [size, *data.shape],
+    )
+
+
+def _make_arena_memmap(
+    data: TensorDictBase,
+    size: int,
+    device: torch.device,
+    prefix: Optional[str],
+    interleaved: bool,
+) -> TensorDictBase:
+    # all the leaves of the (nested) tensordict are views on a single file
+    leaves = _memmap_specs(data)
+    arena = MemmapArena(
+        [(torch.Size([size, *shape]), dtype) for shape, dtype in leaves],
+        prefix=prefix,
+        interleaved=interleaved,
+    )
+    memmaps = iter([arena.tensor(i, device=device) for i in range(len(leaves))])
+
+    def fill(data):
+        return TensorDict(
+            {
+                key: fill(value)
+                if isinstance(value, TensorDictBase)
+                else next(memmaps)
+                for key, value in data.items()
+            },
+            [size, *data.shape],
+        )
+
+    return fill(data)
+
+
+def _memmap_specs(data: TensorDictBase) -> List[Tuple[torch.Size, torch.dtype]]:
+    specs = []
+    for value in data.values():
+        if isinstance(value, TensorDictBase):
+            specs.extend(_memmap_specs(value))
+        else:
+            specs.append((value.shape, value.dtype))
+    return specs
+
+
+def _memmap_manifest(
+    data: Union[TensorDictBase, MemmapTensor], dirname: str
+) -> Dict[str, Any]:
+    if isinstance(data, MemmapTensor):
+        return {
+            "shape": list(data.shape[1:]),
+            "dtype": str(data.dtype).replace("torch.", ""),
+            "filename": os.path.relpath(data.filename, dirname),
+        }
+    return {
+        "batch_size": list(data.batch_size[1:]),
+        "keys": {key: _memmap_manifest(value, dirname) for key, value in data.items()},
+    }
+
+
+def _load_memmap_manifest(
+    manifest: Dict[str, Any], size: int, device: torch.device, dirname: str
+) -> Union[TensorDictBase, MemmapTensor]:
+    if "keys" not in manifest:
+        return MemmapTensor(
+            size,
+            *manifest["shape"],
+            device=device,
+            dtype=getattr(torch, manifest["dtype"]),
+            filename=os.path.join(dirname, manifest["filename"]),
+        )
+    return TensorDict(
+        {
+            key: _load_memmap_manifest(value, size, device, dirname)
+            for key, value in manifest["keys"].items()
+        },
+        [size, *manifest["batch_size"]],
+    )
+
+
+def _memmap_leaves(data: Union[TensorDictBase, MemmapTensor]) -> List[MemmapTensor]:
+    if isinstance(data, MemmapTensor):
+        return [data]
+    return [leaf for value in data.values() for leaf in _memmap_leaves(value)]
@@ -8,7 +8,8 @@ from __future__ import annotations
 import functools
 import os
 import tempfile
-from typing import Any, Callable, List, Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
@@ -23,7 +24,13 @@ from torchrl.data.utils import (
 
 MEMMAP_HANDLED_FN = {}
 
-__all__ = ["MemmapTensor", "set_transfer_ownership"]
+__all__ = ["MemmapTensor", "MemmapArena", "set_transfer_ownership"]
+
+# alignment (in bytes) of the slabs of a MemmapArena
+_ARENA_ALIGNMENT = 64
+
+# thread pools used by MemmapTensor.index_select, indexed by number of threads
+_EXECUTORS = {}
 
 
 def implements_for_memmap(torch_function) -> Callable:
@@ -37,6 +44,23 @@ def implements_for_memmap(torch_function) -> Callable:
     return decorator
 
 
+@functools.lru_cache(maxsize=None)
+def _get_tensor_dir() -> List[str]:
+    # the attributes of a tensor do not depend on its shape, dtype or device
+    return torch.zeros(1).__dir__()
+
+
+def _align(nbytes: int, alignment: int) -> int:
+    return -(-nbytes // alignment) * alignment
+
+
+def _get_executor(num_threads: int) -> ThreadPoolExecutor:
+    executor = _EXECUTORS.get(num_threads)
+    if executor is None:
+        executor = _EXECUTORS[num_threads] = ThreadPoolExecutor(num_threads)
+    return executor
+
+
 def to_numpy(tensor: Union[torch.Tensor, np.ndarray]) -> np.ndarray:
     if isinstance(tensor, torch.Tensor):
         return tensor.detach().cpu().numpy()
@@ -79,6 +103,12 @@ class MemmapTensor(object):
             of the temporary file.
             Default: False.
         prefix (str or path, optional): prefix of the file location.
+        filename (str or path, optional): if provided, the data is stored in
+            this file rather than in a temporary file. If the file already
+            exists, its content is mapped without being copied or
+            overwritten (unless a tensor is passed). A MemmapTensor created
+            with a filename never has the ownership of its file, which
+            is not deleted once the object is out of scope.
 
     Examples:
         >>> x = torch.ones(3,4)
@@ -116,14 +146,23 @@ class MemmapTensor(object):
         dtype: torch.dtype = None,
         transfer_ownership: bool = False,
         prefix: Optional[str] = None,
+        filename: Optional[str] = None,
     ):
         self.idx = None
         self._memmap_array = None
+        self._arena = None
         self.prefix = prefix
         self.is_meta = False
-        self.file = tempfile.NamedTemporaryFile(prefix=prefix, delete=False)
-        self.filename = self.file.name
-        self.file.close()  # we close the file for now, but don't delete it
+        if filename is None:
+            self.file = tempfile.NamedTemporaryFile(prefix=prefix, delete=False)
+            self.filename = self.file.name
+            self.file.close()  # we close the file for now, but don't delete it
+        else:
+            self.filename = str(filename)
+            # create the file if needed, the memmap array will be extended to
+            # the appropriate size
+            open(self.filename, "ab").close()
+            self.file = None
 
         if isinstance(elem, (torch.Tensor, MemmapTensor, np.ndarray)):
             if device is not None:
@@ -151,6 +190,9 @@ class MemmapTensor(object):
             device = device if device is not None else torch.device("cpu")
             dtype = dtype if dtype is not None else torch.get_default_dtype()
             self._init_shape(shape, device, dtype, transfer_ownership)
+        if filename is not None:
+            self._has_ownership = False
+            self._had_ownership = False
 
     def _init_shape(
         self,
@@ -169,7 +211,7 @@ class MemmapTensor(object):
         self.mode = "r+"
         self._has_ownership = True
 
-        self._tensor_dir = torch.zeros(1, device=device, dtype=dtype).__dir__()
+        self._tensor_dir = _get_tensor_dir()
         self._save_item(shape)
 
     def _init_tensor(
@@ -191,15 +233,14 @@ class MemmapTensor(object):
         self.transfer_ownership = transfer_ownership
         self.np_shape = tuple(self._shape)
         self._dtype = elem.dtype
-        self._tensor_dir = elem.__dir__()
+        self._tensor_dir = _get_tensor_dir()
         self._ndim = elem.ndimension()
         self._numel = elem.numel()
         self.mode = "r+"
         self._has_ownership = True
         self._had_ownership = True
         if isinstance(elem, MemmapTensor):
-            prev_filename = elem.filename
-            self._copy_item(prev_filename)
+            self._copy_item(elem)
             if self.memmap_array is elem.memmap_array:
                 raise RuntimeError
         else:
@@ -209,8 +250,40 @@ class MemmapTensor(object):
                 )
             self._save_item(elem)
 
+    @classmethod
+    def _from_arena(
+        cls, arena: MemmapArena, offset: int, shape: torch.Size, dtype: torch.dtype
+    ) -> MemmapTensor:
+        # the tensor is a view on the file of the arena, which keeps the
+        # ownership of the file: no file is created
+        self = cls.__new__(cls)
+        self.idx = None
+        self._memmap_array = None
+        self._arena = arena
+        self._offset = offset
+        self.prefix = arena.prefix
+        self.is_meta = False
+        self.file = None
+        self.filename = arena.filename
+        self._device = torch.device("cpu")
+        self._shape = shape
+        self.transfer_ownership = False
+        self.np_shape = tuple(shape)
+        self._dtype = dtype
+        self._tensor_dir = _get_tensor_dir()
+        self._ndim = len(shape)
+        self._numel = prod(shape)
+        self.mode = "r+"
+        self._has_ownership = False
+        self._had_ownership = False
+        return self
+
     def _get_memmap_array(self) -> np.memmap:
-        if self._memmap_array is None:
+        if self._memmap_array is None and self._arena is not None:
+            self._memmap_array = self._arena._view(
+                self._offset, self.np_shape, self.dtype
+            )
+        elif self._memmap_array is None:
             self._memmap_array = np.memmap(
                 self.filename,
                 dtype=torch_to_numpy_dtype_dict[self.dtype],
@@ -243,13 +316,8 @@ class MemmapTensor(object):
         else:
             memmap_array[idx] = np_array
 
-    def _copy_item(self, filename: Union[bytes, str]) -> None:
-        self.memmap_array[:] = np.memmap(
-            filename,
-            dtype=torch_to_numpy_dtype_dict[self.dtype],
-            mode="r",
-            shape=self.np_shape,
-        )
+    def _copy_item(self, other: MemmapTensor) -> None:
+        self.memmap_array[:] = other.memmap_array
 
     def _load_item(
         self,
@@ -468,8 +536,99 @@ class MemmapTensor(object):
     def __getitem__(self, item: INDEX_TYPING) -> torch.Tensor:
         # return self._load_item(memmap_array=self.memmap_array[item])#[item]
         # return self._load_item()[item]
+        if (
+            isinstance(item, torch.Tensor)
+            and item.ndimension() == 1
+            and item.dtype is torch.long
+            and self._ndim
+        ):
+            return self.index_select(0, item)
         return self._load_item(idx=item)
 
+    def index_select(
+        self,
+        dim: int,
+        index: torch.Tensor,
+        out: Optional[torch.Tensor] = None,
+        num_threads: int = 1,
+        sorted_reads: bool = False,
+    ) -> torch.Tensor:
+        """Gathers the entries of the MemmapTensor at the given indices along
+        a dimension, without intermediate numpy copy.
+
+        The entries are copied with a single :obj:`torch.index_select` from a
+        zero-copy view on the memory-map into :obj:`out`. Along the first
+        dimension, the rows can also be read in the order of the file (see
+        :obj:`sorted_reads`) and by several threads.
+
+        Args:
+            dim (int): the dimension to index.
+            index (torch.Tensor): a 1-dimensional tensor of indices.
+            out (torch.Tensor, optional): a CPU tensor (possibly pinned) where
+                the entries are written. Default is `None`, i.e. a new tensor
+                is allocated.
+            num_threads (int, optional): if greater than 1, the rows are read
+                by that number of threads. This is mostly useful for large
+                rows (e.g. images). Default is 1.
+            sorted_reads (bool, optional): if True, the indices along the
+                first dimension are sorted and deduplicated such that each
+                requested row is read once and in the order of the file,
+                which favours sequential page accesses when the data is not
+                in the page cache. This costs an additional in-memory copy of
+                the rows. Default is `False`.
+
+        Returns:
+            the gathered entries on the device of the MemmapTensor. If the
+            device is "cpu", this is :obj:`out` when provided.
+
+        """
+        index = torch.as_tensor(index, dtype=torch.long).cpu()
+        if index.ndimension() != 1:
+            raise RuntimeError(
+                f"index_select expects a 1-dimensional index, got shape {index.shape}."
+            )
+        dim = dim if dim >= 0 else dim + self._ndim
+        index = index.where(index >= 0, index + self.shape[dim])
+        shape = list(self.shape)
+        shape[dim] = index.numel()
+        if out is None:
+            out = torch.empty(shape, dtype=self.dtype)
+        elif out.device != torch.device("cpu") or out.shape != torch.Size(shape):
+            raise RuntimeError(
+                f"out must be a CPU tensor of shape {torch.Size(shape)}, got a tensor "
+                f"of shape {out.shape} on device {out.device}."
+            )
+        source = self._tensor_from_numpy
+        if dim != 0:
+            torch.index_select(source, dim, index, out=out)
+        elif sorted_reads and index.numel() > 1:
+            rows, inverse = torch.unique(index, sorted=True, return_inverse=True)
+            buffer = torch.empty(rows.numel(), *shape[1:], dtype=self.dtype)
+            self._index_select_rows(source, rows, buffer, num_threads)
+            torch.index_select(buffer, 0, inverse, out=out)
+        else:
+            self._index_select_rows(source, index, out, num_threads)
+        if self.device != torch.device("cpu"):
+            return out.to(self.device, non_blocking=out.is_pinned())
+        return out
+
+    @staticmethod
+    def _index_select_rows(
+        source: torch.Tensor, index: torch.Tensor, out: torch.Tensor, num_threads: int
+    ) -> None:
+        if num_threads <= 1 or index.numel() < num_threads:
+            torch.index_select(source, 0, index, out=out)
+            return
+        # contiguous chunks of the sorted index are read by each thread
+        chunks = zip(index.chunk(num_threads), out.chunk(num_threads))
+        executor = _get_executor(num_threads)
+        futures = [
+            executor.submit(torch.index_select, source, 0, _index, out=_out)
+            for _index, _out in chunks
+        ]
+        for future in futures:
+            future.result()
+
     def __setitem__(self, idx: INDEX_TYPING, value: torch.Tensor):
         if self.device == torch.device("cpu"):
             self._load_item()[idx] = value
@@ -561,6 +720,148 @@ class MemmapTensor(object):
         return tuple(self[_idx] for _idx in idx)
 
 
+class MemmapArena:
+    """A single file backing the data of several MemmapTensors.
+
+    Rather than creating one temporary file (and one memory-map) per tensor,
+    the arena lays the tensors out in one file that is mapped once, and
+    :obj:`tensor` returns MemmapTensors that are views on their own region
+    of that file. The tensors are laid out either one after the other in
+    aligned slabs, or with their rows interleaved: in the latter case, the
+    data of all the tensors at a given index of their first dimension is
+    contiguous on disk, such that reading a row of every tensor (e.g. when
+    sampling from a replay buffer) touches contiguous pages.
+
+    The temporary file is deleted once the arena and all of its tensors are
+    out of scope in the process that created it. Unlike :obj:`MemmapTensor`,
+    the ownership of an arena is never transferred upon serialization.
+
+    Args:
+        specs (sequence of (shape, dtype) tuples): the shapes and dtypes of
+            the tensors stored in the arena.
+        prefix (str or path, optional): prefix of the file location.
+        interleaved (bool, optional): if True, the rows of the tensors are
+            interleaved. All the tensors must then have the same first
+            dimension. Default is `False`.
+        alignment (int, optional): alignment (in bytes) of the slabs when
+            the tensors are not interleaved. Default is 64.
+
+    Examples:
+        >>> arena = MemmapArena([((10, 3), torch.float), ((10,), torch.long)])
+        >>> obs, action = arena.tensor(0), arena.tensor(1)
+        >>> assert obs.filename == action.filename
+
+    """
+
+    def __init__(
+        self,
+        specs: Sequence[Tuple[Sequence[int], torch.dtype]],
+        prefix: Optional[str] = None,
+        interleaved: bool = False,
+        alignment: int = _ARENA_ALIGNMENT,
+    ):
+        self.specs = [(torch.Size(shape), dtype) for shape, dtype in specs]
+        self.prefix = prefix
+        self.interleaved = interleaved
+        self.offsets = []
+        itemsizes = [
+            np.dtype(torch_to_numpy_dtype_dict[dtype]).itemsize
+            for _, dtype in self.specs
+        ]
+        if interleaved:
+            rows = {shape[0] if len(shape) else None for shape, _ in self.specs}
+            if len(rows) != 1 or None in rows:
+                raise ValueError(
+                    "The tensors of an interleaved MemmapArena must have the same "
+                    f"first dimension, got shapes {[shape for shape, _ in specs]}."
+                )
+            self.rows = rows.pop()
+            # the fields of a row are aligned on their itemsize, and the rows
+            # on the largest itemsize, such that all the strides are valid
+            row_stride = 0
+            for (shape, _), itemsize in zip(self.specs, itemsizes):
+                row_stride = _align(row_stride, itemsize)
+                self.offsets.append(row_stride)
+                row_stride += prod(shape[1:]) * itemsize
+            self.row_stride = _align(row_stride, max(itemsizes))
+            nbytes = self.rows * self.row_stride
+        else:
+            self.rows = None
+            self.row_stride = None
+            nbytes = 0
+            for (shape, _), itemsize in zip(self.specs, itemsizes):
+                nbytes = _align(nbytes, alignment)
+                self.offsets.append(nbytes)
+                nbytes += prod(shape) * itemsize
+        # empty files cannot be mapped
+        self.nbytes = max(nbytes, 1)
+
+        file = tempfile.NamedTemporaryFile(prefix=prefix, delete=False)
+        self.filename = file.name
+        file.truncate(self.nbytes)
+        file.close()
+        self._has_ownership = True
+        self._buffer = None
+
+    @property
+    def buffer(self) -> np.memmap:
+        """The bytes of the file, mapped in memory."""
+        if self._buffer is None:
+            self._buffer = np.memmap(
+                self.filename, dtype=np.uint8, mode="r+", shape=(self.nbytes,)
+            )
+        return self._buffer
+
+    def _view(
+        self, offset: int, shape: Tuple[int, ...], dtype: torch.dtype
+    ) -> np.ndarray:
+        np_dtype = np.dtype(torch_to_numpy_dtype_dict[dtype])
+        if not self.interleaved:
+            nbytes = prod(shape) * np_dtype.itemsize
+            return self.buffer[offset : offset + nbytes].view(np_dtype).reshape(shape)
+        rows = self.buffer[: self.rows * self.row_stride].reshape(
+            self.rows, self.row_stride
+        )
+        row_nbytes = prod(shape[1:]) * np_dtype.itemsize
+        rows = rows[:, offset : offset + row_nbytes].view(np_dtype)
+        return rows.reshape(shape)
+
+    def tensor(self, index: int, device: DEVICE_TYPING = None) -> MemmapTensor:
+        """Returns a MemmapTensor mapping the :obj:`index`-th tensor of the
+        arena.
+
+        Args:
+            index (int): index of the tensor in :obj:`specs`.
+            device (torch.device or equivalent, optional): device where the
+                loaded tensor will be sent. Default is "cpu".
+
+        """
+        shape, dtype = self.specs[index]
+        out = MemmapTensor._from_arena(self, self.offsets[index], shape, dtype)
+        if device is not None:
+            out.device = device
+        return out
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_buffer"] = None
+        state["_has_ownership"] = False
+        return state
+
+    def __del__(self) -> None:
+        if getattr(self, "_has_ownership", False):
+            os.unlink(self.filename)
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(num_tensors={len(self)}, "
+            f"nbytes={self.nbytes}, interleaved={self.interleaved})"
+        )
+
+
 @implements_for_memmap(torch.stack)
 def stack(
     list_of_memmap: List[MemmapTensor],
@@ -577,6 +878,16 @@ def stack(
         return torch.stack(list_of_tensors, dim, out=out)
 
 
+@implements_for_memmap(torch.index_select)
+def index_select(
+    memmap: MemmapTensor,
+    dim: int,
+    index: torch.Tensor,
+    out: Optional[torch.Tensor] = None,
+) -> torch.Tensor:
+    return memmap.index_select(dim, index, out=out)
+
+
 @implements_for_memmap(torch.unbind)
 def unbind(memmap: MemmapTensor, dim: int) -> Tuple[torch.Tensor, ...]:
     return memmap.unbind(dim)
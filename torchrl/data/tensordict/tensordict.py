@@ -35,7 +35,7 @@ import numpy as np
 import torch
 
 from torchrl import KeyDependentDefaultDict, prod
-from torchrl.data.tensordict.memmap import MemmapTensor
+from torchrl.data.tensordict.memmap import MemmapArena, MemmapTensor
 from torchrl.data.tensordict.metatensor import MetaTensor
 from torchrl.data.tensordict.utils import (
     _getitem_batch_size,
@@ -815,12 +815,20 @@ dtype=torch.float32)},
         raise NotImplementedError(f"{self.__class__.__name__}")
 
     @abc.abstractmethod
-    def memmap_(self, prefix=None) -> TensorDictBase:
+    def memmap_(self, prefix=None, layout="files") -> TensorDictBase:
         """Writes all tensors onto a MemmapTensor.
 
         Args:
             prefix (str): directory prefix where the memmap tensors will have to
                 be stored.
+            layout (str, optional): one of `"files"` (one file per tensor),
+                `"packed"` (a single file, see :obj:`MemmapArena`, in which
+                the tensors are stored one after the other) or
+                `"interleaved"` (a single file in which the rows of the
+                tensors along the first batch dimension are interleaved,
+                such that a given index of all the tensors is contiguous on
+                disk). The tensors of the nested tensordicts are stored in
+                the same file. Default is `"files"`.
 
         Returns:
             self.
@@ -924,12 +932,9 @@ dtype=torch.float32)},
             recursive (bool, optional): if True, each tensor contained in the
                 TensorDict will be copied too. Default is `True`.
         """
-        return TensorDict(
-            source={
-                key: value.clone() if recursive else value
-                for key, value in self.items()
-            },
-            batch_size=self.batch_size,
+        return TensorDict.from_trusted(
+            {key: value.clone() if recursive else value for key, value in self.items()},
+            self.batch_size,
             device=self._device_safe(),
         )
 
@@ -1756,6 +1761,8 @@ class TensorDict(TensorDictBase):
         cls._lazy = False
         cls._is_shared = None
         cls._is_memmap = None
+        cls._schema = None
+        cls._flat_storage = None
         return TensorDictBase.__new__(cls)
 
     def __init__(
@@ -1830,6 +1837,177 @@ class TensorDict(TensorDictBase):
             self._check_batch_size()
             self._check_device()
 
+    @classmethod
+    def from_trusted(
+        cls,
+        source: Dict[str, COMPATIBLE_TYPES],
+        batch_size: torch.Size,
+        device: Optional[torch.device] = None,
+        _meta_source: Optional[dict] = None,
+        _is_shared: Optional[bool] = None,
+        _is_memmap: Optional[bool] = None,
+    ) -> TensorDict:
+        """Creates a TensorDict from a dictionary without checking its content.
+
+        Unlike the regular constructor, no value is converted, moved to
+        :obj:`device`, unsqueezed or checked against the batch size: the
+        dictionary is stored as-is. It is the responsibility of the caller to
+        provide tensors (or tensordicts) that live on the same device and
+        whose leading dimensions match :obj:`batch_size`, such as values
+        read from another tensordict.
+
+        Args:
+            source (dict): a dictionary of tensors or tensordicts. The
+                dictionary is shallow-copied.
+            batch_size (torch.Size): the batch size of the tensordict.
+            device (torch.device, optional): the device of the tensordict. If
+                not provided, it is read from the first value of
+                :obj:`source`.
+
+        Examples:
+            >>> td = TensorDict.from_trusted(
+            ...     {"obs": torch.zeros(3, 4)}, torch.Size([3]))
+            >>> td.device
+            device(type='cpu')
+
+        """
+        out = cls.__new__(cls)
+        TensorDictBase.__init__(out)
+        out._tensordict = dict(source)
+        out._batch_size = batch_size
+        if device is None:
+            for value in out._tensordict.values():
+                device = (
+                    value._device_safe()
+                    if isinstance(value, TensorDictBase)
+                    else value.device
+                )
+                break
+        out._device = device
+        out._is_shared = _is_shared
+        out._is_memmap = _is_memmap
+        if _meta_source is not None:
+            out._dict_meta.update(_meta_source)
+        return out
+
+    @property
+    def is_schema_locked(self) -> bool:
+        return self._schema is not None
+
+    def lock_schema_(self) -> TensorDict:
+        """Locks the keys, shapes, dtypes and devices of the tensordict.
+
+        Once the schema is locked, :obj:`set` and :obj:`set_` only check
+        that the key exists and that the value has the recorded shape, dtype
+        and device, before assigning the value to (or copying it in) the
+        entry. All other conversions and checks are skipped, which reduces
+        the overhead of writing in a tensordict within a hot loop. Adding,
+        deleting or renaming a key raises an exception until
+        :obj:`unlock_schema_` is called.
+
+        Examples:
+            >>> td = TensorDict({"obs": torch.zeros(3, 4)}, [3]).lock_schema_()
+            >>> td.set("obs", torch.ones(3, 4))  # plain assignment
+            >>> td.set("reward", torch.ones(3, 1))  # raises a KeyError
+
+        """
+        self._schema = {
+            key: _schema_entry(value) for key, value in self._tensordict.items()
+        }
+        return self
+
+    def unlock_schema_(self) -> TensorDict:
+        """Unlocks the schema of the tensordict, see :obj:`lock_schema_`."""
+        self._schema = None
+        return self
+
+    def _check_schema(self, key: str, value: COMPATIBLE_TYPES) -> None:
+        schema = self._schema.get(key, None)
+        if schema is None:
+            raise KeyError(
+                f'key "{key}" is not part of the locked schema of the '
+                f"tensordict. Call td.unlock_schema_() before adding keys."
+            )
+        if _schema_entry(value) != schema:
+            shape, dtype, device = schema
+            raise RuntimeError(
+                f'The value set for the key "{key}" does not match the locked '
+                f"schema of the tensordict: expected shape={shape}, "
+                f"dtype={dtype} and device={device}, got "
+                f"{_schema_entry(value)}."
+            )
+
+    def flat_buffer_(self) -> TensorDict:
+        """Moves the tensors of the tensordict in one contiguous buffer per dtype.
+
+        Each tensor is replaced by a tensor of the same shape that shares the
+        storage of the buffer of its dtype. Elementwise and copy operations
+        on the whole tensordict (:obj:`zero_`, :obj:`masked_fill_`,
+        :obj:`clone`, :obj:`to`, :obj:`pin_memory` and :obj:`update_` from a
+        tensordict with the same layout) are then executed once per buffer
+        rather than once per key. Nested tensordicts are left untouched and
+        handled key by key.
+
+        Replacing a tensor with :obj:`set` (rather than writing in it
+        in-place) takes it out of the buffer: the tensordict then falls back
+        on the key by key operations.
+
+        Examples:
+            >>> td = TensorDict({"a": torch.zeros(3, 4), "b": torch.ones(3, 1)}, [3])
+            >>> td.flat_buffer_()
+            >>> td.zero_()  # a single kernel for "a" and "b"
+
+        """
+        if self.is_memmap():
+            raise RuntimeError(
+                "memmap and flat buffers are mutually exclusive features."
+            )
+        tensors = {}
+        for key, value in self._tensordict.items():
+            if isinstance(value, torch.Tensor):
+                if value.requires_grad:
+                    raise RuntimeError(
+                        "flat buffers are not compatible with gradients, the "
+                        f'tensor "{key}" requires grad.'
+                    )
+                tensors[key] = value
+        storage = _FlatStorage.from_tensors(tensors, self._device_safe())
+        if self.is_shared() and self._device_safe() == torch.device("cpu"):
+            storage.share_memory_()
+        self._tensordict.update(storage.leaves)
+        self._flat_storage = storage
+        return self
+
+    def is_flat_buffer(self) -> bool:
+        """Checks whether the tensors of the tensordict are stored in flat
+        buffers, see :obj:`flat_buffer_`."""
+        return self._valid_flat_storage() is not None
+
+    def _valid_flat_storage(self) -> Optional[_FlatStorage]:
+        storage = self._flat_storage
+        if storage is not None and not storage.is_valid(self._tensordict):
+            storage = self._flat_storage = None
+        return storage
+
+    def _from_flat_storage(
+        self,
+        storage: _FlatStorage,
+        fn: Callable,
+        device: Optional[torch.device],
+    ) -> TensorDictBase:
+        """Builds a tensordict from a storage resulting from a fused operation
+        on the storage of self, and from the other values transformed by fn."""
+        out = TensorDict.from_trusted(
+            {
+                key: storage.leaves[key] if key in storage.leaves else fn(value)
+                for key, value in self._tensordict.items()
+            },
+            self.batch_size,
+            device=device,
+        )
+        out._flat_storage = storage
+        return out
+
     def _make_meta(self, key: str) -> MetaTensor:
         proc_value = self._tensordict[key]
         is_memmap = (
@@ -1933,7 +2111,18 @@ class TensorDict(TensorDictBase):
 
     def pin_memory(self) -> TensorDictBase:
         if self.device == torch.device("cpu"):
+            storage = self._valid_flat_storage()
+            if storage is not None:
+                storage = storage.apply(
+                    lambda buffer: buffer.pin_memory()
+                    if buffer.dtype in (torch.half, torch.float, torch.double)
+                    else buffer
+                )
+                self._tensordict.update(storage.leaves)
+                self._flat_storage = storage
             for key, value in self.items():
+                if storage is not None and key in storage.leaves:
+                    continue
                 if isinstance(value, TensorDictBase) or (
                     value.dtype in (torch.half, torch.float, torch.double)
                 ):
@@ -1966,6 +2155,8 @@ class TensorDict(TensorDictBase):
         """
         if self.is_locked:
             raise RuntimeError("Cannot modify immutable TensorDict")
+        if self._schema is not None:
+            return self._set_schema_locked(key, value, inplace)
         if not isinstance(key, str):
             raise TypeError(f"Expected key to be a string but found {type(key)}")
 
@@ -1997,7 +2188,29 @@ class TensorDict(TensorDictBase):
             del self._dict_meta[key]
         return self
 
+    def _set_schema_locked(
+        self, key: str, value: COMPATIBLE_TYPES, inplace: bool
+    ) -> TensorDictBase:
+        if not isinstance(value, _accepted_classes):
+            value = self._convert_to_tensor(value)
+        self._check_schema(key, value)
+        target = self._tensordict[key]
+        if value is target:
+            return self
+        if inplace:
+            target.copy_(value)
+            if key in self._dict_meta:
+                self._dict_meta[key].requires_grad = value.requires_grad
+        else:
+            self._tensordict[key] = value
+            self._dict_meta.pop(key, None)
+        return self
+
     def del_(self, key: str) -> TensorDictBase:
+        if self._schema is not None:
+            raise RuntimeError(
+                "Cannot delete a key of a tensordict whose schema is locked."
+            )
         del self._tensordict[key]
         if key in self._dict_meta:
             del self._dict_meta[key]
@@ -2032,6 +2245,8 @@ class TensorDict(TensorDictBase):
         if not no_check:
             if self.is_locked:
                 raise RuntimeError("Cannot modify immutable TensorDict")
+            if self._schema is not None:
+                return self._set_schema_locked(key, value, inplace=True)
             if not isinstance(key, str):
                 raise TypeError(f"Expected key to be a string but found {type(key)}")
 
@@ -2155,7 +2370,7 @@ class TensorDict(TensorDictBase):
             value.detach_()
         return self
 
-    def memmap_(self, prefix=None) -> TensorDictBase:
+    def memmap_(self, prefix=None, layout="files") -> TensorDictBase:
         if self.is_shared() and self.device == torch.device("cpu"):
             raise RuntimeError(
                 "memmap and shared memory are mutually exclusive features."
@@ -2169,13 +2384,60 @@ class TensorDict(TensorDictBase):
             raise Exception(
                 "memmap is not compatible with gradients, one of Tensors has requires_grad equals True"
             )
+        if layout in ("packed", "interleaved"):
+            return self._memmap_arena_(prefix, interleaved=layout == "interleaved")
+        elif layout != "files":
+            raise ValueError(
+                "layout must be one of 'files', 'packed' or 'interleaved', "
+                f"got {layout}."
+            )
         for key, value in self.items():
-            self._tensordict[key] = MemmapTensor(value, prefix=prefix)
+            if isinstance(value, TensorDictBase):
+                value.memmap_(prefix=prefix)
+            else:
+                self._tensordict[key] = MemmapTensor(value, prefix=prefix)
         for key, value in self.items_meta():
             value.memmap_()
         self._is_memmap = True
         return self
 
+    def _memmap_arena_(self, prefix, interleaved: bool) -> TensorDictBase:
+        if interleaved and not self.batch_dims:
+            raise ValueError(
+                "An interleaved memmap layout requires at least one batch dimension."
+            )
+        tensordicts = []
+        leaves = []
+
+        def collect(tensordict):
+            if type(tensordict) is not TensorDict:
+                raise RuntimeError(
+                    "Packed memmap layouts only support nested tensordicts of type "
+                    f"TensorDict, got {type(tensordict)}."
+                )
+            tensordicts.append(tensordict)
+            for key, value in tensordict.items():
+                if isinstance(value, TensorDictBase):
+                    collect(value)
+                else:
+                    leaves.append((tensordict, key, value))
+
+        collect(self)
+        arena = MemmapArena(
+            [(value.shape, value.dtype) for _, _, value in leaves],
+            prefix=prefix,
+            interleaved=interleaved,
+        )
+        for i, (tensordict, key, value) in enumerate(leaves):
+            memmap = arena.tensor(i, device=value.device)
+            memmap.copy_(value)
+            tensordict._tensordict[key] = memmap
+        for tensordict in tensordicts:
+            for value in tensordict._dict_meta.values():
+                value.memmap_()
+            tensordict._is_memmap = True
+        return self
+
     def to(
         self, dest: Union[DEVICE_TYPING, torch.Size, Type], **kwargs
     ) -> TensorDictBase:
@@ -2193,6 +2455,13 @@ class TensorDict(TensorDictBase):
             if self._device_safe() is not None and dest == self.device:
                 return self
 
+            storage = self._valid_flat_storage()
+            if storage is not None:
+                return self._from_flat_storage(
+                    storage.apply(lambda buffer: buffer.to(dest)),
+                    lambda value: value.to(dest),
+                    dest,
+                )
             self_copy = TensorDict(
                 source={key: value.to(dest) for key, value in self.items()},
                 batch_size=self.batch_size,
@@ -2215,7 +2484,16 @@ class TensorDict(TensorDictBase):
     def masked_fill_(
         self, mask: torch.Tensor, value: Union[float, int, bool]
     ) -> TensorDictBase:
-        for key, item in self.items():
+        storage = self._valid_flat_storage()
+        if storage is not None and storage.masked_fill_(mask, value):
+            items = (
+                (key, item)
+                for key, item in self.items()
+                if key not in storage.leaves
+            )
+        else:
+            items = self.items()
+        for key, item in items:
             mask_expand = expand_as_right(mask, item)
             item.masked_fill_(mask_expand, value)
         return self
@@ -2226,6 +2504,46 @@ class TensorDict(TensorDictBase):
         td_copy = self.clone()
         return td_copy.masked_fill_(mask, value)
 
+    def zero_(self) -> TensorDictBase:
+        storage = self._valid_flat_storage()
+        if storage is None:
+            return super().zero_()
+        for buffer in storage.buffers.values():
+            buffer.zero_()
+        for key in self.keys():
+            if key not in storage.leaves:
+                self.fill_(key, 0)
+        return self
+
+    def clone(self, recursive: bool = True) -> TensorDictBase:
+        storage = self._valid_flat_storage() if recursive else None
+        if storage is None:
+            return super().clone(recursive=recursive)
+        return self._from_flat_storage(
+            storage.apply(torch.clone),
+            lambda value: value.clone(),
+            self._device_safe(),
+        )
+
+    def update_(
+        self,
+        input_dict_or_td: Union[Dict[str, COMPATIBLE_TYPES], TensorDictBase],
+        clone: bool = False,
+    ) -> TensorDictBase:
+        storage = self._valid_flat_storage()
+        if (
+            storage is not None
+            and input_dict_or_td is not self
+            and isinstance(input_dict_or_td, TensorDict)
+        ):
+            other_storage = input_dict_or_td._valid_flat_storage()
+            if other_storage is not None and storage.copy_(other_storage):
+                for key, value in input_dict_or_td.items():
+                    if key not in other_storage.leaves:
+                        self.set_(key, value.clone() if clone else value)
+                return self
+        return super().update_(input_dict_or_td, clone=clone)
+
     def is_contiguous(self) -> bool:
         return all([value.is_contiguous() for _, value in self.items()])
 
@@ -2242,17 +2560,20 @@ class TensorDict(TensorDictBase):
             if key in keys
         }
         if inplace:
+            if self._schema is not None:
+                raise RuntimeError(
+                    "Cannot delete keys of a tensordict whose schema is locked."
+                )
             self._tensordict = d
             for key in list(self._dict_meta.keys()):
                 if key not in keys:
                     del self._dict_meta[key]
             return self
-        return TensorDict(
+        return TensorDict.from_trusted(
+            d,
+            self.batch_size,
             device=self._device_safe(),
-            batch_size=self.batch_size,
-            source=d,
             _meta_source=d_meta,
-            _run_checks=False,
             _is_memmap=self._is_memmap,
             _is_shared=self._is_shared,
         )
@@ -2966,7 +3287,7 @@ torch.Size([3, 2])
         td_copy = self.clone()
         return td_copy.masked_fill_(mask, value)
 
-    def memmap_(self, prefix=None) -> TensorDictBase:
+    def memmap_(self, prefix=None, layout="files") -> TensorDictBase:
         raise RuntimeError(
             "Converting a sub-tensordict values to memmap cannot be done."
         )
@@ -2996,6 +3317,13 @@ class LazyStackedTensorDict(TensorDictBase):
     This allows to seamlessly work with stacks of tensordicts with operations
     that will affect the original tensordicts.
 
+    Reading a key with :obj:`get` stacks the tensors of the tensordicts.
+    If these tensors are evenly spaced views on the same tensor (e.g. when
+    the tensordicts were unbound from a single contiguous tensordict), the
+    stack is a strided view on that tensor and no copy is made: like any
+    view, it reflects and propagates the in-place modifications of the
+    stacked tensors. Otherwise, every call returns a new stacked tensor.
+
     Args:
          *tensordicts (TensorDict instances): a list of tensordict with
             same batch size.
@@ -3241,6 +3569,11 @@ class LazyStackedTensorDict(TensorDictBase):
                 f"of one of the stacked TensorDicts, where a key has been "
                 f"updated/created with an uncompatible shape."
             )
+        if isinstance(tensors[0], torch.Tensor) and not tensors[0].requires_grad:
+            out = _stack_as_strided(tensors, self.stack_dim)
+            if out is not None:
+                # the view reflects any later modification of the tensors
+                return out
         return torch.stack(tensors, self.stack_dim)
 
     def _make_meta(self, key: str) -> MetaTensor:
@@ -3474,9 +3807,9 @@ class LazyStackedTensorDict(TensorDictBase):
             td.detach_()
         return self
 
-    def memmap_(self, prefix=None) -> TensorDictBase:
+    def memmap_(self, prefix=None, layout="files") -> TensorDictBase:
         for td in self.tensordicts:
-            td.memmap_(prefix=prefix)
+            td.memmap_(prefix=prefix, layout=layout)
         self._is_memmap = True
         return self
 
@@ -3744,7 +4077,7 @@ class SavedTensorDict(TensorDictBase):
     def share_memory_(self) -> TensorDictBase:
         raise RuntimeError("SavedTensorDict cannot be put in shared memory.")
 
-    def memmap_(self, prefix=None) -> TensorDictBase:
+    def memmap_(self, prefix=None, layout="files") -> TensorDictBase:
         raise RuntimeError(
             "SavedTensorDict and memmap are mutually exclusive features."
         )
@@ -4189,8 +4522,8 @@ class _CustomOpTensorDict(TensorDictBase):
         td_copy = self.clone()
         return td_copy.masked_fill_(mask, value)
 
-    def memmap_(self, prefix=None):
-        self._source.memmap_(prefix=prefix)
+    def memmap_(self, prefix=None, layout="files"):
+        self._source.memmap_(prefix=prefix, layout=layout)
         self._is_memmap = True
         return self
 
@@ -4395,6 +4728,35 @@ class PermutedTensorDict(_CustomOpTensorDict):
         return self
 
 
+def _stack_as_strided(
+    tensors: List[torch.Tensor], stack_dim: int
+) -> Optional[torch.Tensor]:
+    """Returns the stack of the tensors as a strided view on their common
+    base if they are evenly spaced views on it (e.g. the result of an
+    unbind), and None otherwise."""
+    first = tensors[0]
+    base = first._base
+    if base is None or len(tensors) < 2:
+        return None
+    stride = first.stride()
+    offset = first.storage_offset()
+    step = tensors[1].storage_offset() - offset
+    if step <= 0:
+        return None
+    for i, tensor in enumerate(tensors):
+        if (
+            tensor._base is not base
+            or tensor.storage_offset() != offset + i * step
+            or tensor.stride() != stride
+        ):
+            return None
+    shape = list(first.shape)
+    shape.insert(stack_dim, len(tensors))
+    stride = list(stride)
+    stride.insert(stack_dim, step)
+    return first.as_strided(shape, stride, offset)
+
+
 def _td_fields(td: TensorDictBase) -> str:
     return indent(
         "\n"
@@ -4429,6 +4791,121 @@ def _check_keys(
 _accepted_classes = (torch.Tensor, MemmapTensor, TensorDictBase)
 
 
+def _schema_entry(value: COMPATIBLE_TYPES) -> Tuple:
+    if isinstance(value, TensorDictBase):
+        return value.batch_size, None, value._device_safe()
+    return value.shape, value.dtype, value.device
+
+
+class _FlatStorage:
+    """One contiguous buffer per dtype backing the tensors of a TensorDict.
+
+    The tensors (:obj:`leaves`) are not autograd views of the buffers but
+    tensors built on the storage of the buffers, such that they behave as
+    regular tensors (e.g. they can be detached in-place).
+
+    Args:
+        buffers (dict): a flat tensor per dtype.
+        layout (list): the (key, dtype, offset, shape) of each tensor, where
+            the offset is expressed in number of elements of the buffer.
+
+    """
+
+    def __init__(
+        self,
+        buffers: Dict[torch.dtype, torch.Tensor],
+        layout: List[Tuple[str, torch.dtype, int, torch.Size]],
+    ):
+        self.buffers = buffers
+        self.layout = layout
+        storages = {
+            dtype: (buffer.untyped_storage(), buffer.storage_offset(), buffer.new_empty)
+            for dtype, buffer in buffers.items()
+        }
+        self.leaves = {}
+        for key, dtype, offset, shape in layout:
+            storage, storage_offset, new_empty = storages[dtype]
+            self.leaves[key] = new_empty(0).set_(
+                storage, storage_offset + offset, shape
+            )
+
+    @classmethod
+    def from_tensors(
+        cls, tensors: Dict[str, torch.Tensor], device: Optional[torch.device]
+    ) -> _FlatStorage:
+        numels = defaultdict(int)
+        layout = []
+        for key, value in tensors.items():
+            layout.append((key, value.dtype, numels[value.dtype], value.shape))
+            numels[value.dtype] += value.numel()
+        buffers = {
+            dtype: torch.empty(numel, dtype=dtype, device=device)
+            for dtype, numel in numels.items()
+        }
+        storage = cls(buffers, layout)
+        for key, leaf in storage.leaves.items():
+            leaf.copy_(tensors[key])
+        return storage
+
+    def is_valid(self, tensordict: Dict[str, COMPATIBLE_TYPES]) -> bool:
+        """Checks that the leaves are still the values of the tensordict."""
+        for key, leaf in self.leaves.items():
+            if tensordict.get(key, None) is not leaf or leaf.requires_grad:
+                return False
+        return True
+
+    def apply(self, fn: Callable) -> _FlatStorage:
+        """Returns a storage with the same layout whose buffers are fn(buffer)."""
+        return _FlatStorage(
+            {dtype: fn(buffer) for dtype, buffer in self.buffers.items()},
+            self.layout,
+        )
+
+    def share_memory_(self) -> _FlatStorage:
+        for buffer in self.buffers.values():
+            buffer.share_memory_()
+        return self
+
+    def copy_(self, other: _FlatStorage) -> bool:
+        """Copies the buffers of other, if they have the same layout."""
+        if other.layout is not self.layout and other.layout != self.layout:
+            return False
+        for dtype, buffer in self.buffers.items():
+            buffer.copy_(other.buffers[dtype])
+        return True
+
+    def masked_fill_(self, mask: torch.Tensor, value: Union[float, int, bool]) -> bool:
+        """Fills the elements of the leaves where the mask (expanded to the
+        right) is True, if the mask shape is a prefix of all the leaf shapes.
+
+        If all the leaves of a buffer have as many elements per mask element,
+        the buffer is viewed as :obj:`[n_leaves, mask.numel(), n_elements]`
+        and filled with a single call. Otherwise, each leaf is viewed as
+        :obj:`[mask.numel(), n_elements]` and filled. In both cases the mask
+        is broadcast, without being expanded.
+        """
+        mask_shape = mask.shape
+        mask_numel = mask_shape.numel()
+        if not mask_numel:
+            return False
+        leaves = defaultdict(list)
+        for key, dtype, _, shape in self.layout:
+            if shape[: len(mask_shape)] != mask_shape:
+                return False
+            leaves[dtype].append((key, shape[len(mask_shape) :].numel()))
+        mask = mask.reshape(1, -1, 1)
+        for dtype, buffer in self.buffers.items():
+            numels = {numel for _, numel in leaves[dtype]}
+            if len(numels) == 1:
+                buffer.view(len(leaves[dtype]), mask_numel, numels.pop()).masked_fill_(
+                    mask, value
+                )
+                continue
+            for key, numel in leaves[dtype]:
+                self.leaves[key].view(mask_numel, numel).masked_fill_(mask[0], value)
+        return True
+
+
 def _expand_to_match_shape(parent_batch_size, tensor, self_batch_dims, self_device):
     if hasattr(tensor, "dtype"):
         return torch.zeros(
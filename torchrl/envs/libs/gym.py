@@ -4,12 +4,13 @@
 # LICENSE file in the root directory of this source tree.
 import warnings
 from types import ModuleType
-from typing import List, Optional, Sequence, Dict
+from typing import Any, List, Optional, Sequence, Dict
 
 import torch
 from packaging import version
 
 from torchrl.data import (
+    TensorDict,
     BinaryDiscreteTensorSpec,
     CompositeSpec,
     MultOneHotDiscreteTensorSpec,
@@ -18,6 +19,7 @@ from torchrl.data import (
     TensorSpec,
     UnboundedContinuousTensorSpec,
 )
+from ...data.tensordict.tensordict import TensorDictBase
 from ...data.utils import numpy_to_torch_dtype_dict
 from ..gym_like import GymLikeEnv, default_info_dict_reader
 from ..utils import classproperty
@@ -51,7 +53,7 @@ try:
 except ImportError:
     _has_retro = False
 
-__all__ = ["GymWrapper", "GymEnv", "RetroEnv"]
+__all__ = ["GymWrapper", "GymEnv", "GymVecEnvWrapper", "RetroEnv"]
 
 
 def _gym_to_torchrl_spec_transform(spec, dtype=None, device="cpu") -> TensorSpec:
@@ -100,7 +102,8 @@ def _get_gym():
 
 
 def _is_from_pixels(env):
-    observation_spec = env.observation_space
+    # vectorized envs are checked against the space of a single env
+    observation_spec = getattr(env, "single_observation_space", env.observation_space)
     if isinstance(observation_spec, (Dict, gym.spaces.dict.Dict)):
         if "pixels" in set(observation_spec.keys()):
             return True
@@ -296,6 +299,182 @@ class GymEnv(GymWrapper):
         return f"{self.__class__.__name__}(env={self.env_name}, batch_size={self.batch_size}, device={self.device})"
 
 
+class GymVecEnvWrapper(GymWrapper):
+    """
+    Vectorized OpenAI Gym environment wrapper.
+
+    Wraps a `gym.vector.VectorEnv` (e.g. `gym.vector.SyncVectorEnv` or
+    `gym.vector.AsyncVectorEnv`), or any gym-like environment that steps and resets
+    a batch of environments at once and exposes the `num_envs`,
+    `single_observation_space` and `single_action_space` attributes of vectorized
+    envs. The wrapper has a batch size of `[num_envs]`, and the batched
+    observations, rewards and dones are converted to tensors at once, without
+    looping over the environments.
+
+    Vectorized environments automatically reset the environments that are done.
+    The last observation of an episode is read from the `"final_observation"`
+    entry of the info dict (or from the `"terminal_observation"` entry of the info
+    dict of each env for older versions of gym) and written in the output of the
+    step, whereas the first observation of the new episode is kept until the
+    environment is reset with a `"reset_workers"` entry, as collectors do. Only
+    the environments that are done can be reset individually.
+
+    Examples:
+        >>> env = GymVecEnvWrapper(gym.vector.make("Pendulum-v1", num_envs=4))
+        >>> td = env.rand_step()
+        >>> print(td.get("next_observation").shape)
+        torch.Size([4, 3])
+    """
+
+    def __init__(self, env=None, **kwargs):
+        if env is not None:
+            kwargs["env"] = env
+        if "env" in kwargs and hasattr(kwargs["env"], "num_envs"):
+            kwargs["batch_size"] = torch.Size([kwargs["env"].num_envs])
+        self._last_obs = None
+        # observations of the envs that have been reset automatically
+        self._reset_obs = None
+        super().__init__(**kwargs)
+
+    def _check_kwargs(self, kwargs: Dict):
+        super()._check_kwargs(kwargs)
+        env = kwargs["env"]
+        if not all(
+            hasattr(env, attr)
+            for attr in ("num_envs", "single_observation_space", "single_action_space")
+        ):
+            raise TypeError(
+                "env is not a vectorized env (e.g. 'gym.vector.VectorEnv')."
+            )
+
+    def _build_env(
+        self,
+        env,
+        from_pixels: bool = False,
+        pixels_only: bool = False,
+    ) -> "gym.vector.VectorEnv":
+        if self.frame_skip != 1:
+            raise ValueError(
+                f"{self.__class__.__name__} does not support frame_skip, as the "
+                f"environments are reset automatically at the end of an episode."
+            )
+        if from_pixels and not _is_from_pixels(env):
+            raise ValueError(
+                "from_pixels is not supported by vectorized envs, wrap each "
+                "environment in a PixelObservationWrapper instead."
+            )
+        self.from_pixels = _is_from_pixels(env)
+        self.pixels_only = pixels_only
+        return env
+
+    def _make_specs(self, env: "gym.vector.VectorEnv") -> None:
+        self.action_spec = _gym_to_torchrl_spec_transform(
+            env.single_action_space, device=self.device
+        )
+        self.observation_spec = _gym_to_torchrl_spec_transform(
+            env.single_observation_space, device=self.device
+        )
+        if not isinstance(self.observation_spec, CompositeSpec):
+            if self.from_pixels:
+                self.observation_spec = CompositeSpec(next_pixels=self.observation_spec)
+            else:
+                self.observation_spec = CompositeSpec(
+                    next_observation=self.observation_spec
+                )
+        self.reward_spec = UnboundedContinuousTensorSpec(
+            device=self.device,
+        )
+        # envs that have been reset automatically and not yet by a call to reset
+        self._pending_reset = torch.zeros(self.batch_size, dtype=torch.bool)
+
+    def _step(self, tensordict: TensorDictBase) -> TensorDictBase:
+        action = tensordict.get("action")
+        action_np = self.action_spec.to_numpy(action, safe=False)
+        obs, reward, done, *info = self._output_transform(self._env.step(action_np))
+
+        obs_dict = self._read_obs(obs)
+        reward = torch.as_tensor(
+            reward, dtype=self.reward_spec.dtype, device=self.device
+        ).view(*self.batch_size, 1)
+        done = torch.as_tensor(done, dtype=torch.bool, device=self.device).view(
+            *self.batch_size, 1
+        )
+        if done.any():
+            obs_dict = self._read_final_obs(obs_dict, done.view(-1).cpu(), info)
+
+        tensordict_out = TensorDict(
+            obs_dict, batch_size=self.batch_size, device=self.device
+        )
+        tensordict_out.set("reward", reward)
+        tensordict_out.set("done", done)
+        if self.info_dict_reader is not None:
+            self.info_dict_reader(*info, tensordict_out)
+        self._last_obs = obs_dict
+        return tensordict_out
+
+    def _read_final_obs(
+        self, obs_dict: Dict[str, torch.Tensor], done: torch.Tensor, info: List[Any]
+    ) -> Dict[str, torch.Tensor]:
+        # keeps the first observations of the new episodes until the envs are
+        # reset, and replaces them by the last observations of the episodes
+        if self._reset_obs is None:
+            self._reset_obs = {key: value.clone() for key, value in obs_dict.items()}
+        else:
+            for key, value in obs_dict.items():
+                self._reset_obs[key][done] = value[done]
+        self._pending_reset |= done
+
+        done_ids = done.nonzero().view(-1).tolist()
+        info = info[0] if len(info) else {}
+        if isinstance(info, dict):
+            final_obs = info.get("final_observation")
+            if final_obs is None:
+                return obs_dict
+            final_obs = [final_obs[i] for i in done_ids]
+        else:
+            final_obs = [info[i].get("terminal_observation") for i in done_ids]
+            if any(_obs is None for _obs in final_obs):
+                return obs_dict
+        obs_dict = {key: value.clone() for key, value in obs_dict.items()}
+        for i, _obs in zip(done_ids, final_obs):
+            for key, value in self._read_obs(_obs).items():
+                obs_dict[key][i] = value
+        return obs_dict
+
+    def _reset(
+        self, tensordict: Optional[TensorDictBase] = None, **kwargs
+    ) -> TensorDictBase:
+        reset_workers = None
+        if tensordict is not None and "reset_workers" in tensordict.keys():
+            reset_workers = tensordict.get("reset_workers").view(-1).cpu()
+        if reset_workers is None or (
+            reset_workers.all() and not self._pending_reset.all()
+        ):
+            obs, *_ = self._output_transform((self._env.reset(**kwargs),))
+            obs_dict = self._read_obs(obs)
+            self._pending_reset = torch.zeros(self.batch_size, dtype=torch.bool)
+        else:
+            if not self._pending_reset[reset_workers].all():
+                raise RuntimeError(
+                    f"{self.__class__.__name__} can only reset the environments "
+                    f"that are done individually."
+                )
+            obs_dict = {key: value.clone() for key, value in self._last_obs.items()}
+            for key, value in obs_dict.items():
+                value[reset_workers] = self._reset_obs[key][reset_workers]
+            self._pending_reset &= ~reset_workers
+        self._last_obs = obs_dict
+        tensordict_out = TensorDict(
+            source=obs_dict,
+            batch_size=self.batch_size,
+            device=self.device,
+        )
+        tensordict_out.set(
+            "done", self._pending_reset.to(self.device).unsqueeze(-1).clone()
+        )
+        return tensordict_out
+
+
 def _get_retro_envs() -> Sequence:
     if not _has_retro:
         return tuple()
@@ -10,8 +10,8 @@ from collections import OrderedDict
 from copy import deepcopy
 from logging import warn
 from multiprocessing import connection
-from time import sleep
-from typing import Callable, Optional, Sequence, Union, Any, List
+from time import monotonic, sleep
+from typing import Callable, Optional, Sequence, Tuple, Union, Any, List
 
 import torch
 from torch import multiprocessing as mp
@@ -25,6 +25,12 @@ from torchrl.envs.env_creator import EnvCreator
 
 __all__ = ["SerialEnv", "ParallelEnv"]
 
+# waiting for a step flag busy-waits first (only if there are spare cores),
+# then yields the cpu and finally sleeps
+_SPIN_ITERATIONS = 100 if (os.cpu_count() or 1) > 1 else 0
+_YIELD_ITERATIONS = 10000
+_SLEEP_TIME = 1e-4
+
 
 def _check_start(fun):
     def decorated_fun(self: _BatchedEnv, *args, **kwargs):
@@ -33,7 +39,7 @@ def _check_start(fun):
             self._start_workers()
         else:
             if isinstance(self, ParallelEnv):
-                _check_for_faulty_process(self._workers)
+                self._check_workers()
         return fun(self, *args, **kwargs)
 
     return decorated_fun
@@ -53,7 +59,7 @@ class _dispatch_caller_parallel:
         results = []
         for channel in self.parallel_env.parent_channels:
             msg, result = channel.recv()
-            results.append(result)
+            results.extend(result)
 
         return results
 
@@ -355,40 +361,51 @@ class _BatchedEnv(_EnvClass):
                     f"found 0 action keys in {sorted(list(self.selected_keys))}"
                 )
         shared_tensordict_parent = shared_tensordict_parent.select(*self.selected_keys)
-        self.shared_tensordict_parent = shared_tensordict_parent.to(self.device)
+        (
+            self.shared_tensordict_parent,
+            self.shared_tensordicts,
+        ) = self._share_td(shared_tensordict_parent)
+
+        if raise_no_selected_keys:
+            if self._verbose:
+                print(
+                    f"\n {self.__class__.__name__}.shared_tensordict_parent is \n{self.shared_tensordict_parent}. \n"
+                    f"You can select keys to be synchronised by setting the selected_keys and/or excluded_keys "
+                    f"arguments when creating the batched environment."
+                )
+
+    def _share_td(
+        self, shared_tensordict_parent: TensorDictBase
+    ) -> Tuple[TensorDictBase, Sequence[TensorDictBase]]:
+        """Places a copy of a stacked tensordict on device and in shared memory / memory map, and returns it
+        along with the tensordicts of the individual workers."""
+        shared_tensordict_parent = shared_tensordict_parent.to(self.device)
 
         if self.share_individual_td:
-            self.shared_tensordicts = [
-                td.clone() for td in self.shared_tensordict_parent.unbind(0)
+            shared_tensordicts = [
+                td.clone() for td in shared_tensordict_parent.unbind(0)
             ]
             if self._share_memory:
-                for td in self.shared_tensordicts:
+                for td in shared_tensordicts:
                     td.share_memory_()
             elif self._memmap:
-                for td in self.shared_tensordicts:
+                for td in shared_tensordicts:
                     td.memmap_()
-            self.shared_tensordict_parent = torch.stack(self.shared_tensordicts, 0)
+            shared_tensordict_parent = torch.stack(shared_tensordicts, 0)
         else:
             if self._share_memory:
-                self.shared_tensordict_parent.share_memory_()
-                if not self.shared_tensordict_parent.is_shared():
+                shared_tensordict_parent.share_memory_()
+                if not shared_tensordict_parent.is_shared():
                     raise RuntimeError("share_memory_() failed")
             elif self._memmap:
-                self.shared_tensordict_parent.memmap_()
-                if not self.shared_tensordict_parent.is_memmap():
+                shared_tensordict_parent.memmap_()
+                if not shared_tensordict_parent.is_memmap():
                     raise RuntimeError("memmap_() failed")
 
-            self.shared_tensordicts = self.shared_tensordict_parent.unbind(0)
+            shared_tensordicts = shared_tensordict_parent.unbind(0)
         if self.pin_memory:
-            self.shared_tensordict_parent.pin_memory()
-
-        if raise_no_selected_keys:
-            if self._verbose:
-                print(
-                    f"\n {self.__class__.__name__}.shared_tensordict_parent is \n{self.shared_tensordict_parent}. \n"
-                    f"You can select keys to be synchronised by setting the selected_keys and/or excluded_keys "
-                    f"arguments when creating the batched environment."
-                )
+            shared_tensordict_parent.pin_memory()
+        return shared_tensordict_parent, shared_tensordicts
 
     def _start_workers(self) -> None:
         """Starts the various envs."""
@@ -580,63 +597,304 @@ class ParallelEnv(_BatchedEnv):
     Creates one environment per process.
     TensorDicts are passed via shared memory or memory map.
 
+    Many cheap environments can be grouped in the same process with the `envs_per_process` argument
+    (default = 1): each process then hosts a contiguous slice of the environments, which it steps in a loop
+    upon a single message.
+        >>> env = ParallelEnv(256, env_fn, envs_per_process=16)  # 16 processes
+
+    Besides the synchronous `step()`, the environments can be stepped asynchronously with `step_async()` and
+    `step_wait()`, which return the results of the workers as soon as a minimum number of them are ready:
+        >>> env = ParallelEnv(8, env_fn)
+        >>> td = env.reset()
+        >>> env.step_async(policy(td))
+        >>> td, env_ids = env.step_wait(min_ready=4)  # td contains the results of env_ids
+        >>> env.step_async(policy(step_tensordict(td)), env_ids)  # resend the workers that are ready
+
+    The environments returned by `step_wait()` can be reset (through the `"reset_workers"` entry of the
+    tensordict passed to `reset()`) while the steps of the other processes are pending.
+
+    By default, the step commands and their completion are signalled through the pipes connecting the main
+    process to the workers. With `signal_mode="flags"`, synchronous steps are instead signalled with one flag
+    per process placed in shared memory, which the processes wait for by spinning and then blocking on a
+    semaphore: this avoids pickling messages at every step, at the cost of some busy-waiting. The other commands
+    (e.g. resets) still go through the pipes, and are announced by a command counter in shared memory such that
+    the processes answer them right away.
+
+    The results of `step()` are copied out of the shared tensordict, as its values are overwritten by the next
+    step. With `double_buffer=True`, two shared tensordicts are allocated and the synchronous steps and resets
+    write in each of them in turn: `step()` then returns a view on the shared tensordict that has just been
+    written, which is left untouched by the next step or reset and is overwritten by the one after it.
+        >>> env = ParallelEnv(8, env_fn, double_buffer=True)
+        >>> td = env.reset()
+        >>> td0 = env.step(policy(td))  # the outputs are not copied out of shared memory
+        >>> td1 = env.step(policy(step_tensordict(td0)))  # td0 still holds the results of the first step
+    Resets still return a copy, and the asynchronous steps write in the shared tensordict of the last
+    synchronous step or reset.
+
+    By default, the failure of a process (e.g. a crash of the simulator) makes the environment raise an
+    exception. With `max_restarts > 0`, the processes are supervised: a process that died, or whose step
+    lasted more than `worker_timeout` seconds, is terminated and restarted with new environments built with
+    `create_env_fn`, which are reset in their shared tensordict slots. The step that was interrupted is then
+    replayed from the reset state, and the `"done"` entry of its result is set to `True` for these
+    environments, such that they are reset again by the caller (e.g. a collector) before their trajectory is
+    continued. The number of restarts of each environment is kept in `env.restart_counts`.
+        >>> env = ParallelEnv(8, env_fn, max_restarts=10, worker_timeout=60.0)
+    The restarted environments are not re-seeded.
+
     """
 
     __doc__ += _BatchedEnv.__doc__
 
+    def __init__(
+        self,
+        num_workers: int,
+        create_env_fn: Union[
+            Callable[[], _EnvClass], Sequence[Callable[[], _EnvClass]]
+        ],
+        *args,
+        envs_per_process: int = 1,
+        signal_mode: str = "pipe",
+        double_buffer: bool = False,
+        max_restarts: int = 0,
+        worker_timeout: Optional[float] = None,
+        **kwargs,
+    ):
+        if envs_per_process < 1:
+            raise ValueError(
+                f"envs_per_process must be a positive integer, got {envs_per_process}."
+            )
+        if signal_mode not in ("pipe", "flags"):
+            raise ValueError(
+                f"signal_mode must be one of 'pipe' or 'flags', got {signal_mode}."
+            )
+        if max_restarts < 0:
+            raise ValueError(
+                f"max_restarts must be a non-negative integer, got {max_restarts}."
+            )
+        super().__init__(num_workers, create_env_fn, *args, **kwargs)
+        self.envs_per_process = envs_per_process
+        self.signal_mode = signal_mode
+        self.double_buffer = double_buffer
+        self.max_restarts = max_restarts
+        self.worker_timeout = worker_timeout
+        self.restart_counts = [0 for _ in range(num_workers)]
+
+    def _create_td(self) -> None:
+        super()._create_td()
+        # the shared tensordicts written alternately by the steps and the
+        # resets, and the index of the one holding the latest results
+        self._shared_buffers = [
+            (self.shared_tensordict_parent, self.shared_tensordicts)
+        ]
+        if self.double_buffer:
+            self._shared_buffers.append(
+                self._share_td(self.shared_tensordict_parent.clone())
+            )
+        self._buffer = 0
+
+    def _swap_buffers(self) -> int:
+        # makes the buffer that is not holding the latest results the target of
+        # the next command, and returns its index
+        if self.double_buffer:
+            self._buffer = 1 - self._buffer
+            (
+                self.shared_tensordict_parent,
+                self.shared_tensordicts,
+            ) = self._shared_buffers[self._buffer]
+        return self._buffer
+
     def _start_workers(self) -> None:
 
         _num_workers = self.num_workers
-        ctx = mp.get_context("spawn")
 
         self.parent_channels = []
         self._workers = []
-
-        for idx in range(_num_workers):
+        # each process owns a contiguous slice of the environments
+        self._env_slices = [
+            range(start, min(start + self.envs_per_process, _num_workers))
+            for start in range(0, _num_workers, self.envs_per_process)
+        ]
+        # the flag of a process is raised by the main process to step all
+        # its envs (its value minus one being the index of the shared
+        # tensordict to use), and lowered by the process once the step is
+        # completed
+        self._step_flags = None
+        # number of commands sent through the pipe of each process, and
+        # semaphores released at every flag or command, on which the processes
+        # block once they are done spinning
+        self._command_counts = None
+        self._wakeups = None
+        if self.signal_mode == "flags":
+            self._step_flags = torch.zeros(
+                len(self._env_slices), dtype=torch.int32
+            ).share_memory_()
+            self._command_counts = torch.zeros(
+                len(self._env_slices), dtype=torch.int64
+            ).share_memory_()
+            self._wakeups = [None for _ in self._env_slices]
+        # keys written by a step, known after the first one
+        self._step_keys = None
+
+        for idx in range(len(self._env_slices)):
             if self._verbose:
                 print(f"initiating worker {idx}")
-            # No certainty which module multiprocessing_context is
-            channel1, channel2 = ctx.Pipe()
-            env_fun = self.create_env_fn[idx]
+            channel, w = self._start_worker(idx)
+            self.parent_channels.append(channel)
+            self._workers.append(w)
+        # env indices whose asynchronous step is pending, for each process
+        self._pending = [[] for _ in self._env_slices]
+        # env indices whose process has been restarted since their last step
+        self._restarted_envs = set()
+
+        # send shared tensordicts to workers
+        for idx in range(len(self._env_slices)):
+            self._init_worker(idx)
+        self.is_closed = False
+
+    def _start_worker(self, idx: int) -> Tuple[connection.Connection, mp.Process]:
+        ctx = mp.get_context("spawn")
+        env_slice = self._env_slices[idx]
+        # No certainty which module multiprocessing_context is
+        channel1, channel2 = ctx.Pipe()
+        signal_kwargs = {"step_flag": None}
+        if self._step_flags is not None:
+            self._command_counts[idx] = 0
+            self._wakeups[idx] = ctx.Semaphore(0)
+            signal_kwargs = {
+                "step_flag": self._step_flags[idx],
+                "command_count": self._command_counts[idx],
+                "wakeup": self._wakeups[idx],
+            }
+        env_funs = []
+        for i in env_slice:
+            env_fun = self.create_env_fn[i]
             if env_fun.__class__.__name__ != "EnvCreator":
                 env_fun = CloudpickleWrapper(env_fun)
-
-            w = mp.Process(
-                target=_run_worker_pipe_shared_mem,
-                args=(
-                    idx,
-                    channel1,
-                    channel2,
-                    env_fun,
-                    self.create_env_kwargs[idx],
-                    False,
-                    self.env_input_keys,
-                    self.device,
-                ),
+            env_funs.append(env_fun)
+
+        w = mp.Process(
+            target=_run_worker_pipe_shared_mem,
+            args=(
+                idx,
+                channel1,
+                channel2,
+                env_funs,
+                [self.create_env_kwargs[i] for i in env_slice],
+                False,
+                self.env_input_keys,
+                self.device,
+            ),
+            kwargs=signal_kwargs,
+        )
+        w.daemon = True
+        w.start()
+        channel2.close()
+        if self._step_flags is not None:
+            channel1 = _SignalledConnection(
+                channel1, self._command_counts[idx], self._wakeups[idx]
             )
-            w.daemon = True
-            w.start()
-            channel2.close()
-            self.parent_channels.append(channel1)
-            self._workers.append(w)
+        return channel1, w
+
+    def _init_worker(self, idx: int) -> None:
+        env_slice = self._env_slices[idx]
+        self.parent_channels[idx].send(
+            (
+                "init",
+                [
+                    [shared_tensordicts[i] for i in env_slice]
+                    for _, shared_tensordicts in self._shared_buffers
+                ],
+            )
+        )
 
-        # send shared tensordict to workers
-        for channel, shared_tensordict in zip(
-            self.parent_channels, self.shared_tensordicts
-        ):
-            channel.send(("init", shared_tensordict))
-        self.is_closed = False
+    def _recv(
+        self, idx: int, timeout: Optional[float] = None
+    ) -> Optional[Tuple[str, Any]]:
+        # receives a message from a process, or returns None if it died or
+        # did not respond in time and can be restarted
+        channel = self.parent_channels[idx]
+        if self.max_restarts or timeout is not None:
+            ready = connection.wait([channel, self._workers[idx].sentinel], timeout)
+            if channel not in ready:
+                if self.max_restarts:
+                    return None
+                if ready:
+                    _check_for_faulty_process(self._workers)
+                raise RuntimeError(
+                    f"Worker process {idx} did not respond within {timeout} seconds."
+                )
+        try:
+            return channel.recv()
+        except EOFError:
+            if self.max_restarts:
+                return None
+            raise
+
+    def _check_workers(self) -> None:
+        if not self.max_restarts:
+            _check_for_faulty_process(self._workers)
+            return
+        for idx, proc in enumerate(self._workers):
+            if not proc.is_alive():
+                self._restart_worker(idx)
+
+    def _restart_worker(self, idx: int) -> set:
+        """Replaces a failed process by a new one, whose environments are reset in the shared tensordict that
+        is currently written. A pending asynchronous step of the process is sent again.
+
+        Returns the keys written by the reset.
+        """
+        env_slice = self._env_slices[idx]
+        proc = self._workers[idx]
+        if proc.is_alive():
+            # the process hangs
+            proc.terminate()
+        proc.join()
+        self.parent_channels[idx].close()
+        for i in env_slice:
+            self.restart_counts[i] += 1
+        if self.restart_counts[env_slice.start] > self.max_restarts:
+            raise RuntimeError(
+                f"Worker process {idx} failed more than max_restarts="
+                f"{self.max_restarts} times."
+            )
+        warn(
+            f"Worker process {idx} (exit code {proc.exitcode}) failed and is "
+            f"restarted, restart count = {self.restart_counts[env_slice.start]}."
+        )
+        if self._step_flags is not None:
+            self._step_flags[idx] = 0
+        channel, self._workers[idx] = self._start_worker(idx)
+        self.parent_channels[idx] = channel
+        self._init_worker(idx)
+        channel.send(("reset", (list(range(len(env_slice))), {}, self._buffer)))
+        msg = self._recv(idx)
+        if msg is None or msg[0] != "reset_obs":
+            raise RuntimeError(f"Worker process {idx} could not be restarted.")
+        self._restarted_envs.update(env_slice)
+        if self._pending[idx]:
+            local_ids = [i - env_slice.start for i in self._pending[idx]]
+            channel.send(("step", (local_ids, self._buffer)))
+        return msg[1]
+
+    def _mark_restarted_envs(self, env_ids: Sequence[int]) -> None:
+        # the trajectories of the restarted envs are interrupted
+        for i in env_ids:
+            if i in self._restarted_envs:
+                self.shared_tensordicts[i].get("done").fill_(True)
+                self._restarted_envs.discard(i)
 
     @_check_start
     def state_dict(self) -> OrderedDict:
         state_dict = OrderedDict()
         for idx, channel in enumerate(self.parent_channels):
             channel.send(("state_dict", None))
-        for idx, channel in enumerate(self.parent_channels):
-            msg, _state_dict = channel.recv()
+        for channel, env_slice in zip(self.parent_channels, self._env_slices):
+            msg, _state_dicts = channel.recv()
             if msg != "state_dict":
                 raise RuntimeError(f"Expected 'state_dict' but received {msg}")
-            state_dict[f"worker{idx}"] = _state_dict
+            for idx, _state_dict in zip(env_slice, _state_dicts):
+                state_dict[f"worker{idx}"] = _state_dict
 
         return state_dict
 
@@ -646,24 +904,51 @@ class ParallelEnv(_BatchedEnv):
             state_dict = OrderedDict(
                 **{f"worker{idx}": state_dict for idx in range(self.num_workers)}
             )
-        for i, channel in enumerate(self.parent_channels):
-            channel.send(("load_state_dict", state_dict[f"worker{i}"]))
+        for channel, env_slice in zip(self.parent_channels, self._env_slices):
+            channel.send(
+                (
+                    "load_state_dict",
+                    [state_dict[f"worker{idx}"] for idx in env_slice],
+                )
+            )
         for channel in self.parent_channels:
             msg, _ = channel.recv()
             if msg != "loaded":
                 raise RuntimeError(f"Expected 'loaded' but received {msg}")
 
+    def _check_no_pending_step(self) -> None:
+        if any(self._pending):
+            raise RuntimeError(
+                "Some workers have a pending asynchronous step. Call "
+                "step_wait() until all of them have returned first."
+            )
+
     @_check_start
     def _step(self, tensordict: TensorDictBase) -> TensorDictBase:
+        self._check_no_pending_step()
         self._assert_tensordict_shape(tensordict)
 
+        buffer = self._swap_buffers()
         self.shared_tensordict_parent.update_(tensordict.select(*self.env_input_keys))
-        for i in range(self.num_workers):
-            self.parent_channels[i].send(("step", None))
+        if self._step_flags is not None and self._step_keys is not None:
+            self._step_flags.fill_(buffer + 1)
+            for wakeup in self._wakeups:
+                wakeup.release()
+            self._wait_step_flags(buffer)
+            self._mark_restarted_envs(range(self.num_workers))
+            return self._step_output(self._step_keys)
+
+        for channel in self.parent_channels:
+            channel.send(("step", (None, buffer)))
 
         keys = set()
-        for i in range(self.num_workers):
-            msg, data = self.parent_channels[i].recv()
+        for i in range(len(self.parent_channels)):
+            received = self._recv(i, self.worker_timeout)
+            while received is None:
+                self._restart_worker(i)
+                self.parent_channels[i].send(("step", (None, buffer)))
+                received = self._recv(i, self.worker_timeout)
+            msg, data = received
             if msg != "step_result":
                 if msg != "done":
                     raise RuntimeError(
@@ -671,9 +956,147 @@ class ParallelEnv(_BatchedEnv):
                     )
             # data is the set of updated keys
             keys = keys.union(data)
+        self._step_keys = keys
+        self._mark_restarted_envs(range(self.num_workers))
+        return self._step_output(keys)
+
+    def _step_output(self, keys: Sequence[str]) -> TensorDictBase:
+        tensordict_out = self.shared_tensordict_parent.select(*keys)
+        if self.double_buffer:
+            # the other buffer is written by the next step
+            return tensordict_out
         # We must pass a clone of the tensordict, as the values of this tensordict
         # will be modified in-place at further steps
-        return self.shared_tensordict_parent.select(*keys).clone()
+        return tensordict_out.clone()
+
+    def _wait_step_flags(self, buffer: int) -> None:
+        flags = self._step_flags
+        timeout = self.worker_timeout
+        deadline = None if timeout is None else monotonic() + timeout
+        i = 0
+        while flags.any():
+            if i >= _SPIN_ITERATIONS + _YIELD_ITERATIONS:
+                hung = deadline is not None and monotonic() > deadline
+                for idx in flags.nonzero().view(-1).tolist():
+                    if self._workers[idx].is_alive() and not hung:
+                        continue
+                    if not self.max_restarts:
+                        _check_for_faulty_process(self._workers)
+                        raise RuntimeError(
+                            f"Worker process {idx} did not respond within {timeout} "
+                            f"seconds."
+                        )
+                    self._restart_worker(idx)
+                    flags[idx] = buffer + 1
+                    self._wakeups[idx].release()
+                    deadline = None if timeout is None else monotonic() + timeout
+            _backoff(i)
+            i += 1
+
+    @_check_start
+    def step_async(
+        self,
+        tensordict: TensorDictBase,
+        env_ids: Optional[Union[Sequence[int], torch.Tensor]] = None,
+    ) -> None:
+        """Sends a step command to some workers without waiting for the results.
+
+        Args:
+            tensordict (TensorDictBase): tensordict containing the inputs (e.g. the action) of the environments,
+                stacked in the order of `env_ids`.
+            env_ids (sequence of int or torch.Tensor, optional): indices of the workers to be stepped. These
+                workers must not have a pending step.
+                default = None (all the workers)
+
+        """
+        if env_ids is None:
+            env_ids = range(self.num_workers)
+        env_ids = torch.as_tensor(env_ids, dtype=torch.long).reshape(-1).tolist()
+        if tensordict.batch_size[:1] != torch.Size([len(env_ids)]):
+            raise RuntimeError(
+                f"Expected a tensordict with a leading batch dimension of "
+                f"{len(env_ids)} but got batch_size={tensordict.batch_size}."
+            )
+        if tensordict.get("action").dtype is not self.action_spec.dtype:
+            raise TypeError(
+                f"expected action.dtype to be {self.action_spec.dtype} "
+                f"but got {tensordict.get('action').dtype}"
+            )
+        local_ids = OrderedDict()
+        for i in env_ids:
+            idx = i // self.envs_per_process
+            if self._pending[idx]:
+                raise RuntimeError(f"Worker {i} already has a pending step.")
+            local_ids.setdefault(idx, []).append(i - self._env_slices[idx].start)
+        values = [tensordict.get(key) for key in self.env_input_keys]
+        for j, i in enumerate(env_ids):
+            shared_tensordict = self.shared_tensordicts[i]
+            for key, value in zip(self.env_input_keys, values):
+                shared_tensordict.set_(key, value[j])
+        for idx, _local_ids in local_ids.items():
+            self.parent_channels[idx].send(("step", (_local_ids, self._buffer)))
+            self._pending[idx] = [
+                self._env_slices[idx][j] for j in _local_ids
+            ]
+
+    @_check_start
+    def step_wait(
+        self, min_ready: Optional[int] = None, timeout: Optional[float] = None
+    ) -> Tuple[TensorDictBase, torch.Tensor]:
+        """Waits for the results of the workers stepped with `step_async()`.
+
+        Args:
+            min_ready (int, optional): minimum number of workers to wait for. All the workers that are ready
+                when this number is reached are returned.
+                default = None (all the pending workers)
+            timeout (float, optional): maximum time to wait for, in seconds. If it expires, the results of the
+                workers that are ready are returned, which may be less than `min_ready`.
+                default = None (no timeout)
+
+        Returns:
+            a tensordict with the results of the ready workers and a tensor with the indices of these workers, in
+            increasing order.
+
+        """
+        pending = {
+            channel: idx
+            for idx, channel in enumerate(self.parent_channels)
+            if self._pending[idx]
+        }
+        if not pending:
+            raise RuntimeError("No worker has a pending step, call step_async() first.")
+        min_ready = len(pending) if min_ready is None else min(min_ready, len(pending))
+        deadline = None if timeout is None else monotonic() + timeout
+        ready = connection.wait(list(pending), timeout)
+        while len(ready) < min_ready:
+            remaining = [channel for channel in pending if channel not in ready]
+            if deadline is not None:
+                timeout = max(deadline - monotonic(), 0.0)
+            new_ready = connection.wait(remaining, timeout)
+            if not new_ready:
+                break
+            ready += new_ready
+
+        keys = set()
+        env_ids = []
+        for channel in ready:
+            idx = pending[channel]
+            received = self._recv(idx)
+            while received is None:
+                # the restarted process steps its pending envs again
+                self._restart_worker(idx)
+                received = self._recv(idx)
+            msg, data = received
+            if msg not in ("step_result", "done"):
+                raise RuntimeError(
+                    f"Expected 'done' but received {msg} from worker {idx}"
+                )
+            keys = keys.union(data)
+            env_ids.extend(self._pending[idx])
+            self._pending[idx] = []
+        self._mark_restarted_envs(env_ids)
+        env_ids = torch.tensor(sorted(env_ids), dtype=torch.long)
+        return self.shared_tensordict_parent.select(*keys)[env_ids].clone(), env_ids
 
     @_check_start
     def _shutdown_workers(self) -> None:
@@ -681,6 +1104,8 @@ class ParallelEnv(_BatchedEnv):
             raise RuntimeError(
                 "calling {self.__class__.__name__}._shutdown_workers only allowed when env.is_closed = False"
             )
+        while any(self._pending):
+            self.step_wait()
         for i, channel in enumerate(self.parent_channels):
             if self._verbose:
                 print(f"closing {i}")
@@ -695,6 +1120,7 @@ class ParallelEnv(_BatchedEnv):
                 )
 
         del self.shared_tensordicts, self.shared_tensordict_parent
+        del self._shared_buffers
 
         for channel in self.parent_channels:
             channel.close()
@@ -723,22 +1149,57 @@ class ParallelEnv(_BatchedEnv):
             reset_workers = tensordict.get("reset_workers")
         else:
             reset_workers = torch.ones(self.num_workers, 1, dtype=torch.bool)
-
-        for i, channel in enumerate(self.parent_channels):
-            if not reset_workers[i]:
+        reset_workers = reset_workers.reshape(-1).cpu()
+
+        # the envs returned by step_wait() can be reset while the steps of
+        # other processes are pending
+        reset_local_ids = {}
+        for idx, env_slice in enumerate(self._env_slices):
+            local_ids = [j for j, i in enumerate(env_slice) if reset_workers[i]]
+            if not local_ids:
                 continue
-            channel.send((cmd_out, kwargs))
+            if self._pending[idx]:
+                raise RuntimeError(
+                    f"The environments {list(env_slice)} cannot be reset while "
+                    "their process has a pending asynchronous step. Call "
+                    "step_wait() until it has returned first."
+                )
+            reset_local_ids[idx] = local_ids
+
+        previous_tensordicts = self.shared_tensordicts
+        if any(self._pending):
+            # the pending steps write in the current buffer
+            buffer = self._buffer
+        else:
+            buffer = self._swap_buffers()
+        reset_channels = []
+        for idx, local_ids in reset_local_ids.items():
+            self.parent_channels[idx].send((cmd_out, (local_ids, kwargs, buffer)))
+            reset_channels.append(idx)
 
         keys = set()
-        for i, channel in enumerate(self.parent_channels):
-            if not reset_workers[i]:
+        for idx in reset_channels:
+            received = self._recv(idx)
+            if received is None:
+                # the restarted process resets all its envs
+                keys = keys.union(self._restart_worker(idx))
                 continue
-            cmd_in, new_keys = channel.recv()
+            cmd_in, new_keys = received
             keys = keys.union(new_keys)
             if cmd_in != "reset_obs":
                 raise RuntimeError(f"received cmd {cmd_in} instead of reset_obs")
+        self._restarted_envs.difference_update(
+            i for i in range(self.num_workers) if reset_workers[i]
+        )
+        if previous_tensordicts is not self.shared_tensordicts:
+            # the envs that have not been reset keep their latest results
+            for i in range(self.num_workers):
+                if not reset_workers[i]:
+                    self.shared_tensordicts[i].update_(
+                        previous_tensordicts[i].select(*keys)
+                    )
         check_count = 0
-        while self.shared_tensordict_parent.get("done").any():
+        while self.shared_tensordict_parent.get("done")[reset_workers].any():
             if check_count == 4:
                 raise RuntimeError("Envs have just been reset but some are still done")
             else:
@@ -798,33 +1259,118 @@ class ParallelEnv(_BatchedEnv):
         return self
 
 
+class _SignalledConnection:
+    """Main process end of the pipe of a process with `signal_mode="flags"`.
+
+    Sending a command also increments the command count of the process and
+    releases its wake-up semaphore, such that the process reads its pipe as soon
+    as a command is waiting in it.
+    """
+
+    def __init__(
+        self,
+        channel: connection.Connection,
+        command_count: torch.Tensor,
+        wakeup: mp.Semaphore,
+    ):
+        self._channel = channel
+        self._command_count = command_count
+        self._wakeup = wakeup
+
+    def send(self, obj: Any) -> None:
+        # the command is in the pipe before the process is told about it
+        self._channel.send(obj)
+        self._command_count.add_(1)
+        self._wakeup.release()
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._channel, attr)
+
+
+class _CommandReceiver:
+    """Process end of the signals with `signal_mode="flags"`.
+
+    Waits for the step flag or the command count of the process to be raised
+    by the main process. Both are read from shared memory for a few spinning
+    iterations, after which the process blocks on its wake-up semaphore. The
+    command count is only written by the main process, hence no command can
+    be missed; the releases of the signals seen while spinning only cause
+    spurious wake-ups.
+    """
+
+    def __init__(
+        self,
+        child_pipe: connection.Connection,
+        step_flag: torch.Tensor,
+        command_count: torch.Tensor,
+        wakeup: mp.Semaphore,
+    ):
+        self.child_pipe = child_pipe
+        self.step_flag = step_flag
+        self.command_count = command_count
+        self.wakeup = wakeup
+        self._received = 0
+
+    def recv(self) -> Tuple[str, Any]:
+        i = 0
+        while True:
+            flag = self.step_flag.item()
+            if flag:
+                # the flag holds the index of the shared tensordicts plus one
+                return "step_flag", (None, flag - 1)
+            if self.command_count.item() > self._received:
+                self._received += 1
+                return self.child_pipe.recv()
+            if i < _SPIN_ITERATIONS:
+                i += 1
+            else:
+                self.wakeup.acquire()
+
+
+def _backoff(i: int) -> None:
+    if i < _SPIN_ITERATIONS:
+        return
+    sleep(0 if i < _SPIN_ITERATIONS + _YIELD_ITERATIONS else _SLEEP_TIME)
+
+
 def _run_worker_pipe_shared_mem(
     idx: int,
     parent_pipe: connection.Connection,
     child_pipe: connection.Connection,
-    env_fun: Union[_EnvClass, Callable],
-    env_fun_kwargs: dict,
+    env_funs: Sequence[Union[_EnvClass, Callable]],
+    env_funs_kwargs: Sequence[dict],
     pin_memory: bool,
     env_input_keys: dict,
     device: DEVICE_TYPING = "cpu",
     verbose: bool = False,
+    step_flag: Optional[torch.Tensor] = None,
+    command_count: Optional[torch.Tensor] = None,
+    wakeup: Optional[mp.Semaphore] = None,
 ) -> None:
     parent_pipe.close()
-    pid = os.getpid()
-    if not isinstance(env_fun, _EnvClass):
-        env = env_fun(**env_fun_kwargs)
+    if step_flag is None:
+        receiver = child_pipe
     else:
-        if env_fun_kwargs:
-            raise RuntimeError(
-                "env_fun_kwargs must be empty if an environment is passed to a process."
-            )
-        env = env_fun
-    env = env.to(device)
+        receiver = _CommandReceiver(child_pipe, step_flag, command_count, wakeup)
+    pid = os.getpid()
+    envs = []
+    for env_fun, env_fun_kwargs in zip(env_funs, env_funs_kwargs):
+        if not isinstance(env_fun, _EnvClass):
+            env = env_fun(**env_fun_kwargs)
+        else:
+            if env_fun_kwargs:
+                raise RuntimeError(
+                    "env_fun_kwargs must be empty if an environment is passed to a process."
+                )
+            env = env_fun
+        envs.append(env.to(device))
+    all_envs = list(range(len(envs)))
     i = -1
     initialized = False
 
     # make sure that process can be closed
-    tensordict = None
+    buffers = None
+    tensordicts = None
     _td = None
     data = None
 
@@ -833,7 +1379,7 @@ def _run_worker_pipe_shared_mem(
 
     while True:
         try:
-            cmd, data = child_pipe.recv()
+            cmd, data = receiver.recv()
         except EOFError as err:
             raise EOFError(
                 f"proc {pid} failed, last command: {cmd}. " f"\nErr={str(err)}"
@@ -843,7 +1389,9 @@ def _run_worker_pipe_shared_mem(
                 raise RuntimeError("call 'init' before closing")
             # torch.manual_seed(data)
             # np.random.seed(data)
-            new_seed = env.set_seed(data)
+            new_seed = data
+            for env in envs:
+                new_seed = env.set_seed(new_seed)
             child_pipe.send(("seeded", new_seed))
 
         elif cmd == "init":
@@ -852,62 +1400,76 @@ def _run_worker_pipe_shared_mem(
             if initialized:
                 raise RuntimeError("worker already initialized")
             i = 0
-            tensordict = data
-            if not (tensordict.is_shared() or tensordict.is_memmap()):
-                raise RuntimeError(
-                    "tensordict must be placed in shared memory (share_memory_() or memmap_())"
-                )
+            # one list of tensordicts per shared buffer
+            buffers = data
+            for tensordicts in buffers:
+                for tensordict in tensordicts:
+                    if not (tensordict.is_shared() or tensordict.is_memmap()):
+                        raise RuntimeError(
+                            "tensordict must be placed in shared memory (share_memory_() or memmap_())"
+                        )
             initialized = True
 
         elif cmd == "reset":
-            reset_kwargs = data
             if verbose:
                 print(f"resetting worker {pid}")
             if not initialized:
                 raise RuntimeError("call 'init' before resetting")
-            # _td = tensordict.select("observation").to(env.device).clone()
-            _td = env.reset(execute_step=False, **reset_kwargs)
-            if reset_keys is None:
-                reset_keys = set(_td.keys())
-            if pin_memory:
-                _td.pin_memory()
-            tensordict.update_(_td)
+            local_ids, reset_kwargs, buffer = data
+            tensordicts = buffers[buffer]
+            for j in local_ids:
+                env = envs[j]
+                # _td = tensordict.select("observation").to(env.device).clone()
+                _td = env.reset(execute_step=False, **reset_kwargs)
+                if reset_keys is None:
+                    reset_keys = set(_td.keys())
+                if pin_memory:
+                    _td.pin_memory()
+                tensordicts[j].update_(_td)
+                if env.is_done:
+                    raise RuntimeError(
+                        f"{env.__class__.__name__}.is_done is {env.is_done} after reset"
+                    )
             child_pipe.send(("reset_obs", reset_keys))
             just_reset = True
-            if env.is_done:
-                raise RuntimeError(
-                    f"{env.__class__.__name__}.is_done is {env.is_done} after reset"
-                )
 
-        elif cmd == "step":
+        elif cmd in ("step", "step_flag"):
             if not initialized:
                 raise RuntimeError("called 'init' before step")
             i += 1
-            _td = tensordict.select(*env_input_keys)
-            if env.is_done:
-                raise RuntimeError(
-                    f"calling step when env is done, just reset = {just_reset}"
-                )
-            _td = env.step(_td)
-            if step_keys is None:
-                step_keys = set(_td.keys()) - set(env_input_keys)
-            if pin_memory:
-                _td.pin_memory()
-            tensordict.update_(_td.select(*step_keys))
-            if _td.get("done"):
-                msg = "done"
+            msg = "step_result"
+            local_ids, buffer = data
+            tensordicts = buffers[buffer]
+            for j in all_envs if local_ids is None else local_ids:
+                env = envs[j]
+                tensordict = tensordicts[j]
+                _td = tensordict.select(*env_input_keys)
+                if env.is_done:
+                    raise RuntimeError(
+                        f"calling step when env is done, just reset = {just_reset}"
+                    )
+                _td = env.step(_td)
+                if step_keys is None:
+                    step_keys = set(_td.keys()) - set(env_input_keys)
+                if pin_memory:
+                    _td.pin_memory()
+                tensordict.update_(_td.select(*step_keys))
+                if _td.get("done"):
+                    msg = "done"
+            if cmd == "step_flag":
+                step_flag.fill_(0)
             else:
-                msg = "step_result"
-            data = (msg, step_keys)
-            child_pipe.send(data)
+                data = (msg, step_keys)
+                child_pipe.send(data)
             just_reset = False
 
         elif cmd == "close":
-            del tensordict, _td, data
+            del buffers, tensordicts, _td, data
             if not initialized:
                 raise RuntimeError("call 'init' before closing")
-            env.close()
-            del env
+            for env in envs:
+                env.close()
+            del env, envs
 
             child_pipe.send(("closing", None))
             child_pipe.close()
@@ -916,36 +1478,41 @@ def _run_worker_pipe_shared_mem(
             break
 
         elif cmd == "load_state_dict":
-            env.load_state_dict(data)
+            for env, state_dict in zip(envs, data):
+                env.load_state_dict(state_dict)
             msg = "loaded"
             child_pipe.send((msg, None))
 
         elif cmd == "state_dict":
-            state_dict = env.state_dict()
+            state_dicts = [env.state_dict() for env in envs]
             msg = "state_dict"
-            child_pipe.send((msg, state_dict))
+            child_pipe.send((msg, state_dicts))
 
         else:
             err_msg = f"{cmd} from env"
-            try:
-                attr = getattr(env, cmd)
-                if callable(attr):
-                    args, kwargs = data
-                    args_replace = []
-                    for _arg in args:
-                        if isinstance(_arg, str) and _arg == "_self":
-                            continue
-                        else:
-                            args_replace.append(_arg)
-                    result = attr(*args_replace, **kwargs)
-                else:
-                    result = attr
-            except Exception as err:
-                raise RuntimeError(
-                    f"querying {err_msg} resulted in the following error: " f"{err}"
-                )
+            results = []
+            for env in envs:
+                try:
+                    attr = getattr(env, cmd)
+                    if callable(attr):
+                        args, kwargs = data
+                        args_replace = []
+                        for _arg in args:
+                            if isinstance(_arg, str) and _arg == "_self":
+                                continue
+                            else:
+                                args_replace.append(_arg)
+                        result = attr(*args_replace, **kwargs)
+                    else:
+                        result = attr
+                except Exception as err:
+                    raise RuntimeError(
+                        f"querying {err_msg} resulted in the following error: "
+                        f"{err}"
+                    )
+                results.append(result)
             if cmd not in ("to"):
-                child_pipe.send(("_".join([cmd, "done"]), result))
+                child_pipe.send(("_".join([cmd, "done"]), results))
             else:
                 # don't send env through pipe
-                child_pipe.send(("_".join([cmd, "done"]), None))
+                child_pipe.send(("_".join([cmd, "done"]), [None for _ in envs]))
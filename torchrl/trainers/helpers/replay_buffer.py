@@ -16,39 +16,34 @@ from torchrl.data import (
 
 __all__ = ["make_replay_buffer"]
 
-from torchrl.data.replay_buffers.storages import LazyMemmapStorage
-
-
-def collate_fn(x):
-    return x.to_tensordict()
+from torchrl.data.replay_buffers.storages import CompressedStorage, LazyMemmapStorage
 
 
 def make_replay_buffer(device: DEVICE_TYPING, cfg: "DictConfig") -> ReplayBuffer:
     """Builds a replay buffer using the config built from ReplayArgsConfig."""
     device = torch.device(device)
+    if cfg.buffer_compression:
+        storage = CompressedStorage(cfg.buffer_size)
+    else:
+        storage = LazyMemmapStorage(
+            cfg.buffer_size,
+            scratch_dir=cfg.buffer_scratch_dir,
+        )
     if not cfg.prb:
         buffer = TensorDictReplayBuffer(
             cfg.buffer_size,
-            collate_fn=collate_fn,
             pin_memory=device != torch.device("cpu"),
             prefetch=cfg.buffer_prefetch,
-            storage=LazyMemmapStorage(
-                cfg.buffer_size,
-                scratch_dir=cfg.buffer_scratch_dir,
-            ),
+            storage=storage,
         )
     else:
         buffer = TensorDictPrioritizedReplayBuffer(
             cfg.buffer_size,
             alpha=0.7,
             beta=0.5,
-            collate_fn=collate_fn,
             pin_memory=device != torch.device("cpu"),
             prefetch=cfg.buffer_prefetch,
-            storage=LazyMemmapStorage(
-                cfg.buffer_size,
-                scratch_dir=cfg.buffer_scratch_dir,
-            ),
+            storage=storage,
         )
     return buffer
 
@@ -63,3 +58,6 @@ class ReplayArgsConfig:
     # directory where the buffer data should be stored. If none is passed, they will be placed in /tmp/
     buffer_prefetch: int = 10
     # prefetching queue length for the replay buffer
+    buffer_compression: bool = False
+    # whether the buffer content should be kept compressed in RAM instead of
+    # memory-mapped. Recommended for pixel-based experiments.
@@ -53,6 +53,7 @@ __all__ = [
     "Trainer",
     "BatchSubSampler",
     "CountFramesLog",
+    "LogCollectorStats",
     "LogReward",
     "Recorder",
     "ReplayBuffer",
@@ -978,6 +979,44 @@ class CountFramesLog:
         return {"n_frames": self.frame_count, "log_pbar": self.log_pbar}
 
 
+class LogCollectorStats:
+    """Collector profiling logger hook.
+
+    Forwards the profiling counters of a collector built with
+    :obj:`profile=True` (frames per second, latency percentiles of each
+    phase, queue occupancy...) to the logger of the trainer.
+
+    Args:
+        collector (_DataCollector): the profiled data collector.
+        keys (sequence of str, optional): the counters to be logged, e.g.
+            :obj:`["fps", "worker0/env_step/p99"]`. Default is `None`, i.e.
+            all the counters are logged.
+        prefix (str, optional): prefix of the logged names. Default is
+            `"collector/"`.
+
+    Examples:
+        >>> log_stats = LogCollectorStats(trainer.collector, keys=["fps"])
+        >>> trainer.register_op("post_steps_log", log_stats)
+
+    """
+
+    def __init__(
+        self,
+        collector: _DataCollector,
+        keys: Optional[Sequence[str]] = None,
+        prefix: str = "collector/",
+    ):
+        self.collector = collector
+        self.keys = keys
+        self.prefix = prefix
+
+    def __call__(self, batch: TensorDictBase) -> Dict:
+        stats = self.collector.profiling_stats()
+        if self.keys is not None:
+            stats = {key: stats[key] for key in self.keys if key in stats}
+        return {self.prefix + key: value for key, value in stats.items()}
+
+
 def _check_input_output_typehint(func: Callable, input: Type, output: Type):
     # Placeholder for a function that checks the types input / output against expectations
     return